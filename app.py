@@ -1,15 +1,37 @@
-from fastapi import FastAPI, Depends, HTTPException, Header, Body
+from fastapi import FastAPI, Depends, HTTPException, Header, Body, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, insert, tuple_, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 import db_control.mymodels as models
 import db_control.schemas as schemas
-from db_control.connect import engine, get_db
+from db_control.connect import engine, get_db, SessionLocal, DATABASE_URL
+from db_control.pool import pool_status
+from db_control.product_catalog import get_product_catalog
+from db_control.query_stats import get_query_stats
+from db_control.metrics import create_metrics_middleware, render_metrics
+from db_control.order_writer import get_order_writer, write_orders_in_chunks, USE_GROUP_COMMIT
+from db_control.order_builder import build_order_values, build_order_detail_rows, offline_sale_entries, duplicate_sale_ids, batch_results
+from db_control.employee_auth import get_employee_authenticator, get_employee_sessions, get_current_employee, get_bearer_token, get_session_from_credentials, require_session_secret, LoginBusyError
+from db_control.change_feed import get_change_feed, CHANGE_FEED_ENABLED
+from db_control.event_hub import get_event_hub, parse_tables, stream_websocket, sse_lines
 from typing import Optional, List
-from datetime import datetime
-import math
-from pytz import timezone
+import hmac
+import os
 
-models.Base.metadata.create_all(bind=engine)
+# 内部向けAPI（/internal/pool・/internal/queries）のトークン（未設定の場合は内部向けAPIを使えない）
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN")
+
+# DBアクセスの方式（sync: 同期Session / async: AsyncSession）を起動時に選択
+DB_MODE = os.getenv("DB_MODE", "sync").lower()
+USE_ASYNC_DB = DB_MODE == "async"
+
+if USE_ASYNC_DB:
+    from db_control.connect_async import get_async_db
+
+# スキーマはデプロイ時に python -m db_control.migrate で作成・更新する
 
 app = FastAPI()
 
@@ -22,38 +44,483 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-GUEST_CODE = "GUEST00001"  # ゲストコード
+@app.middleware("http")
+async def count_request_queries(request: Request, call_next):
+    """リクエストごとのクエリ数をルート単位で集計するミドルウェア"""
+    query_stats = get_query_stats()
+    token = query_stats.begin_request()
+    try:
+        return await call_next(request)
+    finally:
+        route = request.scope.get("route")
+        query_stats.end_request(token, route.path if route else request.url.path)
+
+# ルートごとの応答時間・エラー数・DBラウンドトリップ数を記録
+app.middleware("http")(create_metrics_middleware(backends=("db",)))
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Prometheus形式のメトリクスを取得するAPI
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+def require_internal_token(x_internal_token: Optional[str] = Header(None)):
+    """内部向けAPIの認証（X-Internal-Token ヘッダーと INTERNAL_API_TOKEN を照合）"""
+    if not INTERNAL_API_TOKEN:
+        raise HTTPException(status_code=403, detail="内部向けAPIは無効です（INTERNAL_API_TOKEN が未設定です）")
+    if not x_internal_token or not hmac.compare_digest(x_internal_token.encode("utf-8"), INTERNAL_API_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=401, detail="認証が必要です")
+
+@app.get("/internal/pool", dependencies=[Depends(require_internal_token)])
+def get_pool_statistics():
+    """
+    このワーカーの接続プールの状態（使用中・オーバーフロー・チェックアウト待ち時間）を取得するAPI
+    ・X-Internal-Token ヘッダーが必要
+    """
+    status = {"sync": pool_status(engine)}
+    if USE_ASYNC_DB:
+        from db_control.connect_async import async_engine
+        status["async"] = pool_status(async_engine.sync_engine)
+    return status
+
+@app.get("/internal/queries", dependencies=[Depends(require_internal_token)])
+def get_query_statistics(top: int = 20):
+    """
+    クエリ統計（クエリごとの実行時間・ルートごとのクエリ数・遅いクエリ・サンプルSQL）を取得するAPI
+    ・X-Internal-Token ヘッダーが必要
+    """
+    return get_query_stats().snapshot(top)
+
+def _product_to_dict(product: models.Product) -> dict:
+    return {"prd_id": product.prd_id, "code": product.code, "name": product.name, "price": product.price}
+
+def _load_all_products() -> List[dict]:
+    db = SessionLocal()
+    try:
+        return [_product_to_dict(p) for p in db.query(models.Product).all()]
+    finally:
+        db.close()
+
+def _load_product_by_code(code: str) -> Optional[dict]:
+    db = SessionLocal()
+    try:
+        product = db.query(models.Product).filter(models.Product.code == code).first()
+        return _product_to_dict(product) if product else None
+    finally:
+        db.close()
+
+def _load_products_by_codes(codes: List[str]) -> List[dict]:
+    db = SessionLocal()
+    try:
+        products = db.query(models.Product).filter(models.Product.code.in_(codes)).all()
+        return [_product_to_dict(p) for p in products]
+    finally:
+        db.close()
+
+def _load_employee(enp_cd: str) -> Optional[dict]:
+    db = SessionLocal()
+    try:
+        employee = db.query(models.Employee).filter(models.Employee.enp_cd == enp_cd).first()
+        if employee is None:
+            return None
+        return {
+            "enp_cd": employee.enp_cd,
+            "name": employee.name,
+            "password": employee.password,
+            "role": employee.role,
+            "is_active": employee.is_active
+        }
+    finally:
+        db.close()
+
+@app.on_event("startup")
+def load_product_catalog():
+    """起動時に商品カタログインデックスを読み込む"""
+    catalog = get_product_catalog()
+    catalog.configure(
+        loader=_load_all_products,
+        fallback=_load_product_by_code,
+        bulk_fallback=_load_products_by_codes
+    )
+    try:
+        count = catalog.load()
+        print(f"✅ 商品カタログを読み込みました: {count}件")
+    except Exception as e:
+        print(f"❌ 商品カタログの読み込みに失敗しました: {e}")
+
+def _revoke_employee_session(token_hash: str, expires_at: int):
+    db = SessionLocal()
+    try:
+        db.execute(
+            text("INSERT INTO employee_session_revocations (token_hash, expires_at) VALUES (:token_hash, :expires_at) ON CONFLICT (token_hash) DO NOTHING"),
+            {"token_hash": token_hash, "expires_at": expires_at}
+        )
+        # 有効期限の過ぎた記録は不要なため、ログアウトのたびに削除する
+        db.execute(text("DELETE FROM employee_session_revocations WHERE expires_at < EXTRACT(EPOCH FROM NOW())"))
+        db.commit()
+    finally:
+        db.close()
+
+def _load_employee_session_revocations(since: Optional[int]) -> List[dict]:
+    db = SessionLocal()
+    try:
+        sql = "SELECT token_hash, expires_at FROM employee_session_revocations WHERE expires_at > EXTRACT(EPOCH FROM NOW())"
+        if since is not None:
+            sql += " AND xact_id >= :since"
+        return [dict(row) for row in db.execute(text(sql), {"since": since}).mappings()]
+    finally:
+        db.close()
+
+def _load_employee_session_revocation_bound() -> int:
+    db = SessionLocal()
+    try:
+        return int(db.execute(text("SELECT realtime_catch_up_bound('employee_session_revocations')->>'bound'")).scalar())
+    finally:
+        db.close()
+
+@app.on_event("startup")
+def configure_employee_sessions():
+    """セッションの署名鍵を確認し（未設定の場合は起動しない）、他のワーカーでのログアウトの読み込みを開始する"""
+    require_session_secret()
+    get_employee_sessions().configure(
+        revoker=_revoke_employee_session,
+        revocation_loader=_load_employee_session_revocations,
+        bound_loader=_load_employee_session_revocation_bound
+    )
+    get_employee_sessions().start()
+
+@app.on_event("startup")
+def start_order_writer():
+    """グループコミットモードの場合、注文ライターを起動する"""
+    if USE_GROUP_COMMIT:
+        writer = get_order_writer()
+        writer.configure(flush_fn=_write_orders_batch)
+        writer.start()
+
+@app.on_event("shutdown")
+def stop_order_writer():
+    """キューに残っている注文を登録してから注文ライターを停止する"""
+    get_order_writer().stop()
+
+@app.on_event("startup")
+def start_change_feed():
+    """変更フィード（LISTEN/NOTIFY）を購読し、商品カタログの更新とイベント配信に使う"""
+    if not CHANGE_FEED_ENABLED:
+        return
+    feed = get_change_feed()
+    # プールの接続は使わず、LISTEN 専用に直接接続する
+    feed.configure(dsn=feed.dsn or DATABASE_URL, connect_args={"sslmode": "require"})
+    try:
+        feed.subscribe_to_products(get_product_catalog().apply_change)
+        hub = get_event_hub()
+        hub.configure(source=feed)
+        hub.connect_upstream(CHANGE_FEED_EVENT_TABLES)
+    except Exception as e:
+        print(f"❌ 変更フィードの購読を開始できませんでした: {e}")
+
+@app.on_event("shutdown")
+def stop_change_feed():
+    """変更フィードの受信を停止する"""
+    get_change_feed().stop()
 
 @app.get("/")
 def read_root():
     return {"message": "POS System API"}
 
+@app.get("/products/catalog/stats")
+def get_product_catalog_stats():
+    """
+    商品カタログインデックスの統計（ヒット・ミス・鮮度）を取得するAPI
+    """
+    return get_product_catalog().stats()
+
+def _insert_order_stmt(order_values: dict):
+    """注文を登録し trd_id を返すINSERT文（RETURNING）"""
+    return insert(models.Order).values(**order_values).returning(models.Order.trd_id)
+
+def _insert_order_details_stmt(detail_rows: List[dict]):
+    """注文明細をまとめて登録する複数行INSERT文（ORMのunit of workを経由しない）"""
+    return insert(models.OrderDetail).values(detail_rows)
+
+SALE_KEY_COLUMNS = (models.Order.store_cd, models.Order.pos_no, models.Order.sale_id)
+
+def _insert_offline_orders(db: Session, orders: List[dict]) -> List[tuple]:
+    """
+    端末の取引IDを持つ注文を INSERT ... ON CONFLICT DO NOTHING で登録する
+
+    Returns:
+        orders と同じ順の (trd_id, 今回登録したか)（登録済みの取引は既存の trd_id）
+    """
+    rows = db.execute(
+        pg_insert(models.Order)
+        .values(orders)
+        .on_conflict_do_nothing(index_elements=[column.name for column in SALE_KEY_COLUMNS])
+        .returning(models.Order.trd_id, *SALE_KEY_COLUMNS)
+    ).all()
+    inserted = {(row.store_cd, row.pos_no, row.sale_id): row.trd_id for row in rows}
+    keys = [(order["store_cd"], order["pos_no"], order["sale_id"]) for order in orders]
+    existing = {}
+    conflicted = [key for key in keys if key not in inserted]
+    if conflicted:
+        result = db.execute(
+            select(models.Order.trd_id, *SALE_KEY_COLUMNS).where(tuple_(*SALE_KEY_COLUMNS).in_(conflicted))
+        )
+        existing = {(row.store_cd, row.pos_no, row.sale_id): row.trd_id for row in result}
+    return [(inserted[key], True) if key in inserted else (existing.get(key), False) for key in keys]
+
+def _write_orders_with_status(entries: List[tuple]) -> List[tuple]:
+    """
+    複数の注文と注文明細を1トランザクションで登録し、(trd_id, 今回登録したか) のリストを返す（一括登録用）
+    ・端末の取引ID（sale_id）を持つ注文は登録済みなら明細を追加せず、既存の trd_id と False を返す
+    """
+    db = SessionLocal()
+    try:
+        trd_ids = [None] * len(entries)
+        created = [False] * len(entries)
+        plain = [i for i, (order_values, _) in enumerate(entries) if order_values.get("sale_id") is None]
+        keyed = [i for i, (order_values, _) in enumerate(entries) if order_values.get("sale_id") is not None]
+        if plain:
+            result = db.execute(
+                insert(models.Order).returning(models.Order.trd_id, sort_by_parameter_order=True),
+                [entries[i][0] for i in plain]
+            )
+            for i, trd_id in zip(plain, result.scalars()):
+                trd_ids[i], created[i] = trd_id, True
+        if keyed:
+            for i, (trd_id, inserted) in zip(keyed, _insert_offline_orders(db, [entries[i][0] for i in keyed])):
+                trd_ids[i], created[i] = trd_id, inserted
+        detail_rows = [
+            dict(detail, trd_id=trd_id)
+            for (_, details), trd_id, inserted in zip(entries, trd_ids, created)
+            if inserted
+            for detail in details
+        ]
+        if detail_rows:
+            db.execute(insert(models.OrderDetail), detail_rows)
+        db.commit()
+        return list(zip(trd_ids, created))
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def _write_orders_batch(entries: List[tuple]) -> List[int]:
+    """複数の注文と注文明細を1トランザクションで登録し、trd_id のリストを返す（グループコミット用）"""
+    return [trd_id for trd_id, _ in _write_orders_with_status(entries)]
+
+BATCH_UPLOAD_CHUNK_SIZE = 500  # オフライン取引を1回のINSERTでまとめる件数
+
+@app.post("/transactions/batch")
+def create_transactions_batch(batch: schemas.OfflineSaleBatch):
+    """
+    オフライン中に端末へ溜まった取引をまとめて登録するAPI
+    - **sales**: 端末の取引ID・販売日時・店舗コード・POS番号・カート内容のリスト（最大 OFFLINE_BATCH_MAX_SALES 件）
+    ・複数行INSERTでチャンク単位に登録し、取引IDごとの結果を返す
+    ・登録済みの取引ID（再送）は重複して登録せず、既存の取引IDを status "duplicate" で返す
+    """
+    duplicates = duplicate_sale_ids(batch.sales)
+    if duplicates:
+        raise HTTPException(status_code=422, detail=f"取引IDが重複しています: {', '.join(duplicates)}")
+    results = write_orders_in_chunks(offline_sale_entries(batch.sales), _write_orders_with_status, BATCH_UPLOAD_CHUNK_SIZE)
+    return batch_results(batch.sales, results)
+
+@app.post("/employees/login")
+async def login_employee(request: schemas.EmployeeLoginRequest):
+    """
+    従業員のログインAPI
+    - **enp_cd**: 従業員コード
+    - **password**: パスワード・PIN
+    ・パスワードの検証（bcrypt）はプロセスプールで実行し、成功時にセッショントークンを発行
+    """
+    employee = await run_in_threadpool(_load_employee, request.enp_cd)
+    try:
+        result = await get_employee_authenticator().login(employee, request.password)
+    except LoginBusyError:
+        raise HTTPException(status_code=503, detail="ログインが混み合っています。しばらくしてから再度お試しください")
+    if result is None:
+        raise HTTPException(status_code=401, detail="従業員コードまたはパスワードが正しくありません")
+    token, session = result
+    return {"token": token, "token_type": "bearer", **session}
+
+@app.post("/employees/logout")
+def logout_employee(authorization: Optional[str] = Header(None)):
+    """
+    従業員のログアウトAPI
+    """
+    if not get_employee_sessions().revoke(get_bearer_token(authorization)):
+        raise HTTPException(status_code=401, detail="セッションが無効か有効期限が切れています")
+    return {"message": "ログアウトしました"}
+
+@app.get("/employees/me")
+def get_logged_in_employee(employee: dict = Depends(get_current_employee)):
+    """
+    ログイン中の従業員を取得するAPI
+    ・セッションはメモリ上のストアで検証（DBアクセスなし）
+    """
+    return employee
+
+@app.get("/employees/login/stats")
+def get_employee_login_stats():
+    """
+    従業員ログインの統計（ログイン件数・待ち数・セッション数）を取得するAPI
+    """
+    return get_employee_authenticator().stats()
+
+@app.on_event("shutdown")
+def stop_employee_authenticator():
+    """パスワード検証のプロセスプールと、ログアウトの読み込みを停止する"""
+    get_employee_authenticator().shutdown()
+    get_employee_sessions().stop()
+
+# 変更フィードで配信できるテーブル（orders は通知の対象外: migrations/006_change_feed_notify.sql）
+CHANGE_FEED_EVENT_TABLES = ("products",)
+
+def require_event_client(authorization: Optional[str] = Header(None), token: Optional[str] = None) -> dict:
+    """イベント配信APIの認証（従業員のセッション、認証必須）"""
+    session = get_session_from_credentials(authorization, token)
+    if session is None:
+        raise HTTPException(status_code=401, detail="認証が必要です")
+    return session
+
+@app.websocket("/ws/events")
+async def websocket_events(
+    websocket: WebSocket,
+    tables: Optional[str] = None,
+    authorization: Optional[str] = Header(None),
+    token: Optional[str] = None
+):
+    """
+    テーブルの変更イベントをWebSocketで配信するAPI（変更フィード経由）
+    - **tables**: 購読するテーブル（カンマ区切り、省略時は products）
+    - **token**: 従業員のセッショントークン（Authorizationヘッダーを付けられない場合）
+    ・処理が遅いクライアントは古いイベントから捨てる
+    """
+    if get_session_from_credentials(authorization, token) is None:
+        await websocket.close(code=1008)
+        return
+    try:
+        table_names = parse_tables(tables, CHANGE_FEED_EVENT_TABLES)
+    except ValueError:
+        await websocket.close(code=1008)
+        return
+    await stream_websocket(websocket, table_names)
+
+@app.get("/events/stream")
+async def stream_events(request: Request, tables: Optional[str] = None, employee: dict = Depends(require_event_client)):
+    """
+    テーブルの変更イベントをServer-Sent Eventsで配信するAPI（変更フィード経由）
+    - **tables**: 購読するテーブル（カンマ区切り、省略時は products）
+    - **token**: 従業員のセッショントークン（Authorizationヘッダーを付けられない場合）
+    """
+    try:
+        table_names = parse_tables(tables, CHANGE_FEED_EVENT_TABLES)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        sse_lines(request, table_names),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/events/stats")
+def get_event_stats(employee: dict = Depends(require_event_client)):
+    """
+    イベント配信の統計（接続数・配信数・破棄数）を取得するAPI
+    """
+    return get_event_hub().stats()
+
+@app.get("/realtime/stats")
+def get_change_feed_stats():
+    """
+    変更フィード（LISTEN/NOTIFY）の接続状態・通知件数・配信キューの統計を取得するAPI
+    """
+    return get_change_feed().stats()
+
+@app.get("/transactions/writer/stats")
+def get_order_writer_stats():
+    """
+    グループコミット（注文ライター）の統計を取得するAPI
+    """
+    return get_order_writer().stats()
+
+# DBセッションの依存関数（DB_MODE に応じて AsyncSession / Session を渡す）
+get_session = get_async_db if USE_ASYNC_DB else get_db
+
+async def _execute(db, statement):
+    """SQL文を実行（非同期モードはawait、同期モードはスレッドプールで実行）"""
+    if USE_ASYNC_DB:
+        return await db.execute(statement)
+    return await run_in_threadpool(db.execute, statement)
+
+async def _commit(db):
+    if USE_ASYNC_DB:
+        await db.commit()
+    else:
+        await run_in_threadpool(db.commit)
+
+async def _rollback(db):
+    if USE_ASYNC_DB:
+        await db.rollback()
+    else:
+        await run_in_threadpool(db.rollback)
+
 @app.get("/employees/{emp_cd}", response_model=schemas.Employee)
-def get_employee(emp_cd: str, db: Session = Depends(get_db)):
+async def get_employee(emp_cd: str, db=Depends(get_session)):
     """
     従業員コードで従業員を検索するAPI
     - **emp_cd**: 検索する従業員コード
     """
-    employee = db.query(models.Employee).filter(models.Employee.enp_cd == emp_cd).first()
+    result = await _execute(db, select(models.Employee).where(models.Employee.enp_cd == emp_cd))
+    employee = result.scalars().first()
     if employee is None:
         raise HTTPException(status_code=404, detail="従業員が見つかりません")
     return employee
 
 @app.get("/products/code/{code}", response_model=schemas.Product)
-def search_product(code: str, db: Session = Depends(get_db)):
+async def search_product(code: str, db=Depends(get_session)):
     """
     商品コードで商品を検索するAPI
     - **code**: 検索する商品コード（13桁）
+    ・プロセス内の商品カタログインデックスから検索（無ければDBから1件取得）
     """
-    product = db.query(models.Product).filter(models.Product.code == code).first()
+    catalog = get_product_catalog()
+    product = catalog.get_cached(code)
     if product is None:
-        raise HTTPException(status_code=404, detail="商品が見つかりません")
+        result = await _execute(db, select(models.Product).where(models.Product.code == code))
+        row = result.scalars().first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="商品が見つかりません")
+        product = _product_to_dict(row)
+        catalog.upsert(product)
     return product
 
+@app.post("/products/lookup", response_model=schemas.ProductLookupResponse)
+async def lookup_products(request: schemas.ProductLookupRequest, db=Depends(get_session)):
+    """
+    複数の商品コードで商品をまとめて検索するAPI
+    - **codes**: 検索する商品コードのリスト（最大 PRODUCT_LOOKUP_MAX_CODES 件）
+    ・インデックスに無いコードは1回の IN (...) クエリでまとめて取得
+    """
+    catalog = get_product_catalog()
+    codes = list(dict.fromkeys(request.codes))
+    found = catalog.get_many(codes, use_fallback=False)
+    not_cached = [code for code in codes if code not in found]
+    if not_cached:
+        result = await _execute(db, select(models.Product).where(models.Product.code.in_(not_cached)))
+        for row in result.scalars().all():
+            product = _product_to_dict(row)
+            catalog.upsert(product)
+            found[product["code"]] = product
+    products = [found[code] for code in codes if code in found]
+    missing = [code for code in codes if code not in found]
+    return {"products": products, "missing": missing}
+
 @app.post("/transactions/", status_code=201)
-def create_transaction(
+async def create_transaction(
     items: List[schemas.CartItem] = Body(...),  # Bodyパラメータとして直接リストを受け取る
-    db: Session = Depends(get_db),
+    db=Depends(get_session),
     emp_cd: Optional[str] = Header(default=None)
 ):
     """
@@ -61,49 +528,30 @@ def create_transaction(
     ・emp_cd がリクエストヘッダーにあればそのコードを使用
     ・なければ GUEST00001 を使用
     """
-
     try:
-        # 合計金額の計算
-        total_amount = sum(item.price * item.quantity for item in items)
-        total_amount_with_tax = math.floor(total_amount * 1.1)  # 税率10%
-
-        # 日本時間のタイムスタンプを取得
-        jst = timezone('Asia/Tokyo')
-        current_time = datetime.now(jst)
-
-        # 注文（Order）の作成
-        order = models.Order(
-            datetime=current_time,  # JSTで設定
-            enp_cd=emp_cd or "GUEST00001",
-            store_cd="A001",
-            pos_no="P01",
-            total_amt=total_amount_with_tax,
-            ttl_amt_ex_tax=total_amount,
-            final_amt=total_amount_with_tax
-        )
+        order_values = build_order_values(items, emp_cd)
 
-        db.add(order)
-        db.flush()  # order.trd_idを取得するためにflush
-
-        # 注文明細（OrderDetail）の作成
-        for idx, item in enumerate(items, 1):
-            detail = models.OrderDetail(
-                trd_id=order.trd_id,
-                prd_id=item.prd_id,
-                prd_code=item.code,
-                prd_name=item.name,
-                prd_price=item.price,
-                quantity=item.quantity,
-                tax_cd="10"    # 税区分コード：10%
-            )
-            db.add(detail)
+        # グループコミットモードの場合はライターに渡し、バッチのコミットを待つ
+        if USE_GROUP_COMMIT:
+            trd_id = await get_order_writer().write_async(order_values, build_order_detail_rows(items))
+        else:
+            # 注文（Order）の作成（RETURNINGでtrd_idを取得）
+            result = await _execute(db, _insert_order_stmt(order_values))
+            trd_id = result.scalar_one()
 
-        db.commit()
+            # 注文明細（OrderDetail）を1回の複数行INSERTで作成
+            if items:
+                await _execute(db, _insert_order_details_stmt(build_order_detail_rows(items, trd_id)))
+
+            await _commit(db)
         return {
             "message": "取引が登録されました",
-            "transaction_id": order.trd_id,
-            "total_amount": total_amount_with_tax
+            "transaction_id": trd_id,
+            "total_amount": order_values["total_amt"]
         }
+    except TimeoutError:
+        await _rollback(db)
+        raise HTTPException(status_code=503, detail="取引の登録がタイムアウトしました。しばらくしてから再度お試しください")
     except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        await _rollback(db)
+        raise HTTPException(status_code=500, detail=str(e))
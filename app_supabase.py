@@ -1,21 +1,33 @@
-from fastapi import FastAPI, HTTPException, Header, Body
+from fastapi import FastAPI, HTTPException, Header, Body, Query, Response, Depends, Request, WebSocket
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional, List
-from datetime import datetime
-import math
-from pytz import timezone
+from fastapi.concurrency import run_in_threadpool
+from typing import Optional, List, Callable, Any
+import json
+import os
 import uuid
-from db_control.crud_supabase import (
-    get_product_by_code,
-    get_employee_by_code,
-    create_order_with_details,
-    get_all_products,
-    create_customer,
-    get_customer_by_email,
-    update_customer_points,
-    get_coupon_by_id
-)
-from db_control.schemas import CartItem
+import db_control.crud_supabase as crud_supabase
+from db_control.schemas import CartItem, ProductLookupRequest, OfflineSaleBatch, EmployeeRolesRequest, EmployeeLoginRequest
+from db_control.product_catalog import get_product_catalog
+from db_control.role_cache import get_role_cache
+from db_control.lookup_cache import invalidate_lookup, lookup_cache_stats
+from db_control.event_hub import get_event_hub, parse_tables, validate_store_filter, stream_websocket, sse_lines
+from db_control.metrics import create_metrics_middleware, render_metrics
+from db_control.order_writer import get_order_writer, write_orders_in_chunks, USE_GROUP_COMMIT
+from db_control.order_builder import build_order_values, build_order_detail_rows, to_json_values, offline_sale_entries, duplicate_sale_ids, batch_results
+from db_control.employee_auth import get_employee_authenticator, get_employee_sessions, get_current_employee, get_bearer_token, get_session_from_credentials, require_session_secret, LoginBusyError
+
+# Supabaseクライアントの方式（sync: 同期クライアント / async: 非同期クライアント）を起動時に選択
+DB_MODE = os.getenv("DB_MODE", "sync").lower()
+USE_ASYNC_DB = DB_MODE == "async"
+
+if USE_ASYNC_DB:
+    import db_control.crud_supabase_async as crud
+else:
+    crud = crud_supabase
+
+# 注文登録方式（rpc: DB関数で注文と明細を1回で登録 / rest: orders と order_details を順に登録）
+USE_ORDER_RPC = os.getenv("ORDER_CREATE_MODE", "rpc").lower() == "rpc"
 
 app = FastAPI()
 
@@ -28,44 +40,363 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-GUEST_CODE = "GUEST00001"  # ゲストコード
+# ルートごとの応答時間・エラー数・PostgRESTラウンドトリップ数を記録
+app.middleware("http")(create_metrics_middleware(backends=("postgrest",)))
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Prometheus形式のメトリクスを取得するAPI（Supabase版）
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+async def _call_crud(func: Callable, *args) -> Any:
+    """CRUD関数を呼び出す（非同期モードはawait、同期モードはスレッドプールで実行）"""
+    if USE_ASYNC_DB:
+        return await func(*args)
+    return await run_in_threadpool(func, *args)
+
+@app.on_event("startup")
+def load_product_catalog():
+    """起動時に商品カタログインデックスを読み込み、productsテーブルの変更を購読する"""
+    catalog = get_product_catalog()
+    catalog.configure(
+        loader=crud_supabase.get_all_products,
+        fallback=crud_supabase.get_product_by_code,
+        bulk_fallback=crud_supabase.get_products_by_codes
+    )
+    try:
+        count = catalog.load()
+        print(f"✅ 商品カタログを読み込みました: {count}件")
+    except Exception as e:
+        print(f"❌ 商品カタログの読み込みに失敗しました: {e}")
+
+    # 購読を開始できない場合は起動しない（wait_for_realtime で参加を確認する）
+    from db_control.realtime_supabase import get_realtime_manager
+    get_realtime_manager().subscribe_to_products(catalog.apply_change)
+
+def _invalidate_employee_caches(payload: dict):
+    """employeesテーブルの変更を役割キャッシュ・従業員の読み取りキャッシュに反映"""
+    get_role_cache().apply_change(payload)
+    record = payload.get('record') or payload.get('old_record') or {}
+    invalidate_lookup('employees', record.get('enp_cd'))
+
+@app.on_event("startup")
+def subscribe_employee_roles():
+    """employeesテーブルの変更で従業員の役割キャッシュ・読み取りキャッシュを無効化する"""
+    # 購読を開始できない場合は起動しない（wait_for_realtime で参加を確認する）
+    from db_control.realtime_supabase import get_realtime_manager
+    get_realtime_manager().subscribe_to_employees(_invalidate_employee_caches)
+
+def _invalidate_customer_cache(payload: dict):
+    """customersテーブルの変更（他のワーカーでのポイントの更新など）を顧客の読み取りキャッシュに反映"""
+    record = payload.get('record') or {}
+    old_record = payload.get('old_record') or {}
+    # メールアドレスが分からないイベント（主キーだけの DELETE・RESYNC）は全件を無効化する
+    # 変更前のメールアドレスは届かないため、メールアドレスを変えた場合の古いキーは保持秒数で消える
+    emails = {record.get('email'), old_record.get('email')} - {None}
+    if not emails:
+        invalidate_lookup('customers')
+    for email in emails:
+        invalidate_lookup('customers', email)
+
+@app.on_event("startup")
+def subscribe_customer_cache():
+    """customersテーブルの変更で顧客の読み取りキャッシュを無効化する（切断中の変更は再接続時に補完される）"""
+    # 購読を開始できない場合は起動しない（wait_for_realtime で参加を確認する）
+    from db_control.realtime_supabase import get_realtime_manager
+    get_realtime_manager().subscribe_to_customers(_invalidate_customer_cache)
+
+@app.on_event("startup")
+def subscribe_api_keys():
+    """api_keysテーブルの変更（他のワーカーでの作成・無効化）をAPIキーのインデックスに即時に反映する"""
+    # 購読を開始できない場合は起動しない（wait_for_realtime で参加を確認する）
+    from db_control.api_key_index import get_api_key_index
+    from db_control.realtime_supabase import get_realtime_manager
+    get_realtime_manager().subscribe_to_table('api_keys', '*', get_api_key_index().apply_change)
+
+@app.on_event("startup")
+def configure_employee_sessions():
+    """セッションの署名鍵を確認し（未設定の場合は起動しない）、他のワーカーでのログアウトの読み込みを開始する"""
+    require_session_secret()
+    from db_control.auth_supabase import revoke_employee_session, load_employee_session_revocations, load_employee_session_revocation_bound
+    get_employee_sessions().configure(
+        revoker=revoke_employee_session,
+        revocation_loader=load_employee_session_revocations,
+        bound_loader=load_employee_session_revocation_bound
+    )
+    get_employee_sessions().start()
+
+@app.on_event("startup")
+def connect_event_hub():
+    """WebSocket / SSE 配信用に、テーブルごとに1つだけリアルタイム購読を開始する"""
+    from db_control.realtime_supabase import get_realtime_manager
+    hub = get_event_hub()
+    hub.configure(source=get_realtime_manager())
+    hub.connect_upstream()
+
+@app.on_event("startup")
+def wait_for_realtime():
+    """起動時に開始した全てのリアルタイム購読がチャンネルに参加するまで待つ（開始できない場合は起動しない）"""
+    from db_control.realtime_supabase import get_realtime_manager
+    get_realtime_manager().wait_until_subscribed()
+    print("✅ リアルタイムの購読を開始しました")
+
+@app.on_event("shutdown")
+def stop_realtime_dispatch():
+    """リアルタイムのチャンネルから退出し、配信キューに残っているイベントを処理してから停止する"""
+    from db_control.realtime_supabase import get_realtime_manager
+    get_realtime_manager().stop()
+
+@app.on_event("startup")
+def start_order_writer():
+    """グループコミットモードの場合、注文ライターを起動する"""
+    if USE_GROUP_COMMIT:
+        writer = get_order_writer()
+        writer.configure(flush_fn=crud_supabase.create_orders_with_details_batch)
+        writer.start()
+
+@app.on_event("shutdown")
+def stop_order_writer():
+    """キューに残っている注文を登録してから注文ライターを停止する"""
+    get_order_writer().stop()
+
+@app.get("/internal/lookup-cache")
+def get_lookup_cache_stats():
+    """
+    従業員・顧客・クーポンの読み取りキャッシュの統計（エンティティごとのヒット率）を取得するAPI（Supabase版）
+    ・顧客は customers の変更の購読で、他のワーカーでの更新も無効化する
+    """
+    return lookup_cache_stats()
 
 @app.get("/")
 def read_root():
     return {"message": "POS System API (Supabase)"}
 
+@app.post("/employees/login")
+async def login_employee(request: EmployeeLoginRequest):
+    """
+    従業員のログインAPI（Supabase版）
+    - **enp_cd**: 従業員コード
+    - **password**: パスワード・PIN
+    ・パスワードの検証（bcrypt）はプロセスプールで実行し、成功時にセッショントークンを発行
+    """
+    employee = await _call_crud(crud.get_employee_by_code, request.enp_cd)
+    try:
+        result = await get_employee_authenticator().login(employee, request.password)
+    except LoginBusyError:
+        raise HTTPException(status_code=503, detail="ログインが混み合っています。しばらくしてから再度お試しください")
+    if result is None:
+        raise HTTPException(status_code=401, detail="従業員コードまたはパスワードが正しくありません")
+    token, session = result
+    return {"token": token, "token_type": "bearer", **session}
+
+@app.post("/employees/logout")
+def logout_employee(authorization: Optional[str] = Header(None)):
+    """
+    従業員のログアウトAPI（Supabase版）
+    """
+    if not get_employee_sessions().revoke(get_bearer_token(authorization)):
+        raise HTTPException(status_code=401, detail="セッションが無効か有効期限が切れています")
+    return {"message": "ログアウトしました"}
+
+@app.get("/employees/me")
+def get_logged_in_employee(employee: dict = Depends(get_current_employee)):
+    """
+    ログイン中の従業員を取得するAPI（Supabase版）
+    ・セッションはメモリ上のストアで検証（DBアクセスなし）
+    """
+    return employee
+
+@app.get("/employees/login/stats")
+def get_employee_login_stats():
+    """
+    従業員ログインの統計（ログイン件数・待ち数・セッション数）を取得するAPI（Supabase版）
+    """
+    return get_employee_authenticator().stats()
+
+@app.on_event("shutdown")
+def stop_employee_authenticator():
+    """パスワード検証のプロセスプールと、ログアウトの読み込みを停止する"""
+    get_employee_authenticator().shutdown()
+    get_employee_sessions().stop()
+
 @app.get("/employees/{emp_cd}")
-def get_employee(emp_cd: str):
+async def get_employee(emp_cd: str):
     """
     従業員コードで従業員を検索するAPI（Supabase版）
     - **emp_cd**: 検索する従業員コード
     """
-    employee = get_employee_by_code(emp_cd)
+    employee = await _call_crud(crud.get_employee_by_code, emp_cd)
     if employee is None:
         raise HTTPException(status_code=404, detail="従業員が見つかりません")
     return employee
 
+async def _api_client(authorization: Optional[str], token: Optional[str], x_api_key: Optional[str]) -> Optional[dict]:
+    """APIの利用者（従業員のセッション、またはAPIキー）、認証できない場合は None"""
+    session = get_session_from_credentials(authorization, token)
+    if session is not None:
+        return session
+    if x_api_key:
+        from db_control.auth_supabase import verify_api_key
+        # 未知のキーはAPIキーの差分を取得するため、スレッドプールで検証する
+        user_id = await run_in_threadpool(verify_api_key, x_api_key)
+        if user_id is not None:
+            return {"user_id": user_id}
+    return None
+
+async def require_api_client(
+    authorization: Optional[str] = Header(None),
+    token: Optional[str] = None,
+    x_api_key: Optional[str] = Header(None)
+) -> dict:
+    """従業員のセッション、または X-API-Key ヘッダーのAPIキーによる認証（認証必須）"""
+    client = await _api_client(authorization, token, x_api_key)
+    if client is None:
+        raise HTTPException(status_code=401, detail="認証が必要です")
+    return client
+
+@app.post("/employees/roles")
+async def get_employee_roles(request: EmployeeRolesRequest, client: dict = Depends(require_api_client)):
+    """
+    複数の従業員の役割をまとめて取得するAPI（Supabase版）
+    - **enp_cds**: 従業員コードのリスト（最大 EMPLOYEE_ROLES_MAX_CODES 件）
+    ・従業員のセッション、またはAPIキーが必要
+    ・キャッシュに無い従業員は1回の in_ フィルタでまとめて取得
+    """
+    from db_control.auth_supabase import get_employee_roles as resolve_roles
+    roles = await run_in_threadpool(resolve_roles, request.enp_cds)
+    missing = [enp_cd for enp_cd in dict.fromkeys(request.enp_cds) if enp_cd not in roles]
+    return {"roles": roles, "missing": missing}
+
+@app.get("/employees/roles/stats")
+def get_employee_role_cache_stats():
+    """
+    従業員の役割キャッシュの統計（ヒット・ミス）を取得するAPI（Supabase版）
+    """
+    return get_role_cache().stats()
+
 @app.get("/products/code/{code}")
-def search_product(code: str):
+async def search_product(code: str):
     """
     商品コードで商品を検索するAPI（Supabase版）
     - **code**: 検索する商品コード（13桁）
+    ・プロセス内の商品カタログインデックスから検索（無ければSupabaseから1件取得）
     """
-    product = get_product_by_code(code)
+    catalog = get_product_catalog()
+    product = catalog.get_cached(code)
     if product is None:
-        raise HTTPException(status_code=404, detail="商品が見つかりません")
+        product = await _call_crud(crud.get_product_by_code, code)
+        if product is None:
+            raise HTTPException(status_code=404, detail="商品が見つかりません")
+        catalog.upsert(product)
     return product
 
+@app.post("/products/lookup")
+async def lookup_products(request: ProductLookupRequest):
+    """
+    複数の商品コードで商品をまとめて検索するAPI（Supabase版）
+    - **codes**: 検索する商品コードのリスト（最大 PRODUCT_LOOKUP_MAX_CODES 件）
+    ・インデックスに無いコードは1回の in_ フィルタでまとめて取得
+    """
+    catalog = get_product_catalog()
+    codes = list(dict.fromkeys(request.codes))
+    found = catalog.get_many(codes, use_fallback=False)
+    not_cached = [code for code in codes if code not in found]
+    if not_cached:
+        for product in await _call_crud(crud.get_products_by_codes, not_cached):
+            catalog.upsert(product)
+            found[product["code"]] = product
+    products = [found[code] for code in codes if code in found]
+    missing = [code for code in codes if code not in found]
+    return {"products": products, "missing": missing}
+
+@app.get("/products/catalog/stats")
+def get_product_catalog_stats():
+    """
+    商品カタログインデックスの統計（ヒット・ミス・鮮度）を取得するAPI（Supabase版）
+    """
+    return get_product_catalog().stats()
+
+PRODUCTS_PAGE_MAX = 1000  # 1ページあたりの最大件数
+
+def _ndjson_lines(products):
+    for product in products:
+        yield json.dumps(product, ensure_ascii=False) + "\n"
+
+async def _ndjson_lines_async(products):
+    async for product in products:
+        yield json.dumps(product, ensure_ascii=False) + "\n"
+
+def _catalog_etag(version: int, format: str) -> str:
+    """カタログバージョンのETag（json と ndjson は別の表現のため別のETagにする）"""
+    return f'"catalog-{version}-{format}"'
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match が現在のETagに一致するか（* は任意の表現に一致、W/ の弱いETagも比較する）"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+
 @app.get("/products/")
-def get_products():
+async def get_products(
+    response: Response,
+    after: Optional[int] = Query(default=None, ge=0),
+    limit: Optional[int] = Query(default=None, ge=1, le=PRODUCTS_PAGE_MAX),
+    format: str = Query(default="json", pattern="^(json|ndjson)$"),
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """
+    商品一覧を取得するAPI（Supabase版）
+    - **after**: このprd_idより後の商品を取得（キーセットページング）
+    - **limit**: 1ページの件数（指定時はページ単位で返す）
+    - **format**: ndjson を指定すると全商品を1行1件で逐次ストリーミング
+    ・全件取得時はカタログバージョンをETagとして返し、If-None-Matchが一致すれば304を返す
+    """
+    headers = {}
+    version = None
+    if after is None and limit is None:
+        version = await _call_crud(crud.get_catalog_version)
+        etag = _catalog_etag(version, format)
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        headers["ETag"] = etag
+
+    if format == "ndjson":
+        products = crud.iter_products(PRODUCTS_PAGE_MAX, after or 0)
+        lines = _ndjson_lines_async(products) if USE_ASYNC_DB else _ndjson_lines(products)
+        return StreamingResponse(lines, media_type="application/x-ndjson", headers=headers)
+
+    if limit is not None or after is not None:
+        page_size = limit or PRODUCTS_PAGE_MAX
+        products = await _call_crud(crud.get_products_page, after or 0, page_size)
+        next_after = products[-1]["prd_id"] if len(products) == page_size else None
+        return {"products": products, "next_after": next_after}
+
+    response.headers.update(headers)
+    products = await _call_crud(crud.get_all_products)
+    return {"products": products, "version": version}
+
+@app.get("/products/changes")
+async def get_product_changes(since: int = Query(..., ge=0)):
     """
-    全商品を取得するAPI（Supabase版）
+    指定バージョン以降の商品の差分を取得するAPI（Supabase版）
+    - **since**: 端末が保持しているカタログバージョン
+    ・追加・更新された商品と削除された商品、および次回の since に指定するバージョンを返す
     """
-    products = get_all_products()
-    return {"products": products}
+    # 実行中のトランザクションより後の version は返さず、次回の差分に回す（migrations/009）
+    version = max(await _call_crud(crud.get_catalog_version), since)
+    changes = await _call_crud(crud.get_product_changes, since, version)
+    return {
+        "since": since,
+        "version": version,
+        "products": changes["products"],
+        "deleted": changes["deleted"]
+    }
 
 @app.post("/transactions/", status_code=201)
-def create_transaction(
+async def create_transaction(
     items: List[CartItem] = Body(...),
     emp_cd: Optional[str] = Header(default=None)
 ):
@@ -76,87 +407,179 @@ def create_transaction(
     """
 
     try:
-        # 合計金額の計算
-        total_amount = sum(item.price * item.quantity for item in items)
-        total_amount_with_tax = math.floor(total_amount * 1.1)  # 税率10%
-
-        # 日本時間のタイムスタンプを取得
-        jst = timezone('Asia/Tokyo')
-        current_time = datetime.now(jst)
-
-        # 注文データの作成
-        order_data = {
-            "datetime": current_time.isoformat(),
-            "enp_cd": emp_cd or "GUEST00001",
-            "store_cd": "A001",
-            "pos_no": "P01",
-            "total_amt": total_amount_with_tax,
-            "ttl_amt_ex_tax": total_amount,
-            "final_amt": total_amount_with_tax
-        }
+        # 注文データ・注文詳細データの作成
+        order_data = to_json_values(build_order_values(items, emp_cd))
+        order_details_data = build_order_detail_rows(items)
+        total_amount_with_tax = order_data["total_amt"]
 
-        # 注文詳細データの作成
-        order_details_data = []
-        for item in items:
-            detail_data = {
-                "prd_id": item.prd_id,
-                "prd_code": item.code,
-                "prd_name": item.name,
-                "prd_price": item.price,
-                "quantity": item.quantity,
-                "tax_cd": "10"    # 税区分コード：10%
-            }
-            order_details_data.append(detail_data)
-
-        # 注文と注文詳細を作成
-        order = create_order_with_details(order_data, order_details_data)
+        # 注文と注文詳細を作成（グループコミットモードの場合はバッチのコミットを待つ）
+        if USE_GROUP_COMMIT:
+            trd_id = await get_order_writer().write_async(order_data, order_details_data)
+            order = {**order_data, "trd_id": trd_id}
+        elif USE_ORDER_RPC:
+            order = await _call_crud(crud.create_order_with_details_rpc, order_data, order_details_data)
+        else:
+            order = await _call_crud(crud.create_order_with_details, order_data, order_details_data)
 
         return {
             "message": "取引が登録されました",
             "transaction_id": order["trd_id"],
             "total_amount": total_amount_with_tax
         }
+    except TimeoutError:
+        raise HTTPException(status_code=503, detail="取引の登録がタイムアウトしました。しばらくしてから再度お試しください")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+BATCH_UPLOAD_CHUNK_SIZE = 500  # オフライン取引を1回のRPCでまとめる件数
+
+@app.post("/transactions/batch")
+async def create_transactions_batch(batch: OfflineSaleBatch):
+    """
+    オフライン中に端末へ溜まった取引をまとめて登録するAPI（Supabase版）
+    - **sales**: 端末の取引ID・販売日時・店舗コード・POS番号・カート内容のリスト（最大 OFFLINE_BATCH_MAX_SALES 件）
+    ・チャンク単位に1回のRPCで登録し、取引IDごとの結果を返す
+    ・登録済みの取引ID（再送）は重複して登録せず、既存の取引IDを status "duplicate" で返す
+    """
+    duplicates = duplicate_sale_ids(batch.sales)
+    if duplicates:
+        raise HTTPException(status_code=422, detail=f"取引IDが重複しています: {', '.join(duplicates)}")
+    entries = [(to_json_values(order_data), details) for order_data, details in offline_sale_entries(batch.sales)]
+    results = await run_in_threadpool(
+        write_orders_in_chunks,
+        entries,
+        crud_supabase.create_offline_orders_with_details_batch,
+        BATCH_UPLOAD_CHUNK_SIZE
+    )
+    return batch_results(batch.sales, results)
+
+@app.websocket("/ws/events")
+async def websocket_events(
+    websocket: WebSocket,
+    tables: Optional[str] = None,
+    store_cd: Optional[str] = None,
+    pos_no: Optional[str] = None,
+    authorization: Optional[str] = Header(None),
+    token: Optional[str] = None,
+    x_api_key: Optional[str] = Header(None)
+):
+    """
+    テーブルの変更イベントをWebSocketで配信するAPI（Supabase版）
+    - **tables**: 購読するテーブル（カンマ区切り、省略時は orders,products）
+    - **store_cd**: 店舗コード（orders をこの店舗の注文に絞り込む。絞り込みはリアルタイムサーバーで行う）
+    - **pos_no**: レジ番号（store_cd と一緒に指定し、そのレジの注文に絞り込む）
+    - **token**: 従業員のセッショントークン（Authorizationヘッダーを付けられない場合）
+    ・処理が遅いクライアントは古いイベントから捨てる
+    """
+    if await _api_client(authorization, token, x_api_key) is None:
+        await websocket.close(code=1008)
+        return
+    try:
+        table_names = parse_tables(tables)
+        validate_store_filter(store_cd, pos_no)
+    except ValueError:
+        await websocket.close(code=1008)
+        return
+    await stream_websocket(websocket, table_names, store_cd, pos_no)
+
+@app.get("/events/stream")
+async def stream_events(
+    request: Request,
+    tables: Optional[str] = None,
+    store_cd: Optional[str] = None,
+    pos_no: Optional[str] = None,
+    client: dict = Depends(require_api_client)
+):
+    """
+    テーブルの変更イベントをServer-Sent Eventsで配信するAPI（Supabase版）
+    - **tables**: 購読するテーブル（カンマ区切り、省略時は orders,products）
+    - **store_cd**: 店舗コード（orders をこの店舗の注文に絞り込む。絞り込みはリアルタイムサーバーで行う）
+    - **pos_no**: レジ番号（store_cd と一緒に指定し、そのレジの注文に絞り込む）
+    - **token**: 従業員のセッショントークン（Authorizationヘッダーを付けられない場合）
+    """
+    try:
+        table_names = parse_tables(tables)
+        validate_store_filter(store_cd, pos_no)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        sse_lines(request, table_names, store_cd=store_cd, pos_no=pos_no),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/events/stats")
+def get_event_stats(client: dict = Depends(require_api_client)):
+    """
+    イベント配信の統計（接続数・配信数・破棄数）を取得するAPI（Supabase版）
+    """
+    return get_event_hub().stats()
+
+@app.get("/realtime/stats")
+def get_realtime_dispatch_stats():
+    """
+    リアルタイムイベントの統計（チャンネルの状態・再接続時の補完・テーブルごとの待ち件数・まとめた件数・破棄数・遅延）を取得するAPI（Supabase版）
+    """
+    from db_control.realtime_supabase import get_realtime_manager
+    return get_realtime_manager().stats()
+
+@app.get("/realtime/health")
+def get_realtime_health():
+    """
+    リアルタイムの購読の状態を確認するAPI（Supabase版）
+    ・参加していないチャンネル（開始の失敗・再接続中）がある場合は503を返す（ヘルスチェック用）
+    """
+    from db_control.realtime_supabase import get_realtime_manager
+    manager = get_realtime_manager()
+    if not manager.healthy:
+        raise HTTPException(status_code=503, detail={"states": dict(manager.states), "errors": dict(manager.errors)})
+    return {"healthy": True, "subscriptions": len(manager.states)}
+
+@app.get("/transactions/writer/stats")
+def get_order_writer_stats():
+    """
+    グループコミット（注文ライター）の統計を取得するAPI（Supabase版）
+    """
+    return get_order_writer().stats()
+
 @app.post("/customers/", status_code=201)
-def create_customer_endpoint(customer_data: dict):
+async def create_customer_endpoint(customer_data: dict):
     """
     顧客を作成するAPI（Supabase版）
     """
     try:
-        customer = create_customer(customer_data)
+        customer = await _call_crud(crud.create_customer, customer_data)
         return {"message": "顧客が作成されました", "customer": customer}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/customers/email/{email}")
-def get_customer_by_email_endpoint(email: str):
+async def get_customer_by_email_endpoint(email: str):
     """
     メールアドレスで顧客を検索するAPI（Supabase版）
     """
-    customer = get_customer_by_email(email)
+    customer = await _call_crud(crud.get_customer_by_email, email)
     if customer is None:
         raise HTTPException(status_code=404, detail="顧客が見つかりません")
     return customer
 
 @app.put("/customers/{cust_id}/points")
-def update_customer_points_endpoint(cust_id: int, points: int):
+async def update_customer_points_endpoint(cust_id: int, points: int):
     """
     顧客のポイントを更新するAPI（Supabase版）
     """
     try:
-        customer = update_customer_points(cust_id, points)
+        customer = await _call_crud(crud.update_customer_points, cust_id, points)
         return {"message": "ポイントが更新されました", "customer": customer}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/coupons/{coupon_id}")
-def get_coupon_endpoint(coupon_id: str):
+async def get_coupon_endpoint(coupon_id: str):
     """
     クーポンIDでクーポンを検索するAPI（Supabase版）
     """
-    coupon = get_coupon_by_id(coupon_id)
+    coupon = await _call_crud(crud.get_coupon_by_id, coupon_id)
     if coupon is None:
         raise HTTPException(status_code=404, detail="クーポンが見つかりません")
     return coupon
@@ -0,0 +1,93 @@
+"""
+イベント配信ハブ（db_control/event_hub.py）のファンアウト性能のベンチマーク
+
+使い方（リポジトリのルートで実行）:
+    python benchmarks/fanout.py                          # 1,000クライアント × 1,000イベント
+    python benchmarks/fanout.py --clients 5000 --events 200
+    python benchmarks/fanout.py --slow-ratio 0.1         # 10%のクライアントを遅いクライアントにする
+
+リアルタイムの受信スレッドを模したスレッドからイベントを発行し、
+各クライアント（asyncioタスク）に届くまでの遅延と、全体の配信スループットを計測する。
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from db_control.event_hub import EventHub
+
+def percentile(values, ratio: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+async def run(clients: int, events: int, rate: float, queue_size: int, slow_ratio: float, slow_delay: float):
+    hub = EventHub(max_queue=queue_size)
+    subscribers = [hub.subscribe(["orders"]) for _ in range(clients)]
+    slow_count = int(clients * slow_ratio)
+    latencies = []
+    received = [0] * clients
+
+    async def consume(index: int, subscriber):
+        slow = index < slow_count
+        while True:
+            event = await subscriber.get()
+            latencies.append(time.time() - event["published_at"])
+            received[index] += 1
+            if slow:
+                await asyncio.sleep(slow_delay)
+
+    tasks = [asyncio.create_task(consume(i, s)) for i, s in enumerate(subscribers)]
+
+    def publish():
+        interval = 1.0 / rate if rate > 0 else 0.0
+        for i in range(events):
+            hub.publish("orders", {"eventType": "INSERT", "record": {"trd_id": i}})
+            if interval:
+                time.sleep(interval)
+
+    start = time.perf_counter()
+    publisher = threading.Thread(target=publish)
+    publisher.start()
+    await asyncio.get_running_loop().run_in_executor(None, publisher.join)
+
+    # 遅いクライアント以外のキューが空になるまで待つ
+    while any(subscriber.pending() for subscriber in subscribers[slow_count:]):
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    stats = hub.stats()
+    delivered = sum(received)
+    print(f"クライアント数: {clients}（遅いクライアント {slow_count}）, イベント数: {events}, キュー上限: {queue_size}")
+    print(f"配信数: {delivered}件 / {elapsed:.2f}秒 = {delivered / elapsed:,.0f}件/秒")
+    print(
+        "遅延: "
+        f"平均 {statistics.mean(latencies) * 1000:.2f}ms / "
+        f"p50 {percentile(latencies, 0.50) * 1000:.2f}ms / "
+        f"p99 {percentile(latencies, 0.99) * 1000:.2f}ms / "
+        f"最大 {max(latencies) * 1000:.2f}ms"
+    )
+    print(f"破棄（drop-oldest）: {stats['dropped']}件")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=1000, help="クライアント数")
+    parser.add_argument("--events", type=int, default=1000, help="発行するイベント数")
+    parser.add_argument("--rate", type=float, default=500.0, help="1秒あたりの発行数（0は最速）")
+    parser.add_argument("--queue-size", type=int, default=256, help="クライアントごとのキューの上限")
+    parser.add_argument("--slow-ratio", type=float, default=0.0, help="遅いクライアントの割合")
+    parser.add_argument("--slow-delay", type=float, default=0.05, help="遅いクライアントの1件あたりの処理時間（秒）")
+    args = parser.parse_args()
+    asyncio.run(run(args.clients, args.events, args.rate, args.queue_size, args.slow_ratio, args.slow_delay))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+起動時間（import時間）とSupabaseクライアント取得時間のベンチマーク
+
+使い方（リポジトリのルートで実行）:
+    python benchmarks/import_time.py                     # app_supabase の import 時間
+    python benchmarks/import_time.py --module app        # SQLAlchemy版
+    python benchmarks/import_time.py --max-ms 1500       # 中央値が閾値を超えたら終了コード1
+
+import 時間は新しいプロセスで `python -X importtime` を実行して計測する。
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def measure_import(module: str, runs: int):
+    """新しいプロセスでモジュールを import し、所要時間（ミリ秒）と importtime の出力を返す"""
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    timings = []
+    importtime = ""
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=ROOT, env=env, capture_output=True, text=True
+        )
+        timings.append((time.perf_counter() - start) * 1000)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        importtime = result.stderr
+    return timings, importtime
+
+def slowest_imports(importtime: str, top: int):
+    """importtime の出力から累積時間の長いモジュールを取得"""
+    rows = []
+    for line in importtime.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # 形式: "import time: <self_us> | <cumulative_us> | <module>"
+        _, cumulative_us, name = line.split(":", 1)[1].split("|")
+        rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+def measure_client_get(iterations: int):
+    """共有クライアントの取得時間（初回作成と2回目以降）を計測"""
+    sys.path.insert(0, str(ROOT))
+    from db_control.supabase_client import get_client_registry, get_supabase_client, get_supabase_anon_client
+    results = {}
+    for name, getter in (("service_role", get_supabase_client), ("anon", get_supabase_anon_client)):
+        start = time.perf_counter()
+        getter()
+        first_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        for _ in range(iterations):
+            getter()
+        results[name] = (first_ms, (time.perf_counter() - start) * 1_000_000 / iterations)
+    return results, get_client_registry().stats()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app_supabase", help="import するモジュール")
+    parser.add_argument("--runs", type=int, default=5, help="import の計測回数")
+    parser.add_argument("--top", type=int, default=10, help="表示する遅いモジュールの件数")
+    parser.add_argument("--iterations", type=int, default=1000, help="クライアント取得の計測回数")
+    parser.add_argument("--max-ms", type=float, default=None, help="import 時間の中央値の上限（ミリ秒）")
+    args = parser.parse_args()
+
+    timings, importtime = measure_import(args.module, args.runs)
+    median_ms = statistics.median(timings)
+    print(f"import {args.module}: 中央値 {median_ms:.1f}ms（最小 {min(timings):.1f}ms / 最大 {max(timings):.1f}ms, {args.runs}回）")
+    print("累積時間の長いモジュール:")
+    for cumulative_us, name in slowest_imports(importtime, args.top):
+        print(f"  {cumulative_us / 1000:8.1f}ms  {name}")
+
+    try:
+        clients, stats = measure_client_get(args.iterations)
+        for name, (first_ms, per_call_us) in clients.items():
+            print(f"クライアント取得（{name}）: 初回 {first_ms:.1f}ms / 2回目以降 {per_call_us:.2f}µs")
+        print(f"作成済みクライアント: {stats['clients']}")
+    except Exception as e:
+        print(f"❌ クライアント取得の計測をスキップしました: {e}")
+
+    if args.max_ms is not None and median_ms > args.max_ms:
+        print(f"❌ import 時間が上限を超えています: {median_ms:.1f}ms > {args.max_ms:.1f}ms")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
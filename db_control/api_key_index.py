@@ -0,0 +1,326 @@
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Optional, List, Tuple
+import hashlib
+import secrets
+import threading
+import time
+
+API_KEY_PREFIX = "sk"
+
+def generate_api_key() -> Tuple[str, str, str]:
+    """
+    APIキーを生成
+
+    Returns:
+        (APIキー, 表示・検索用のプレフィックス, 保存用のハッシュ)
+    """
+    key_prefix = secrets.token_hex(4)
+    api_key = f"{API_KEY_PREFIX}_{key_prefix}_{secrets.token_urlsafe(32)}"
+    return api_key, key_prefix, hash_api_key(api_key)
+
+def hash_api_key(api_key: str) -> str:
+    """APIキーのハッシュ（十分なランダム性があるためSHA-256で保存・照合する）"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+def api_key_prefix(api_key: str) -> str:
+    """APIキーのプレフィックス（migrations/005 で既存のキーに設定したものと同じ取り出し方）"""
+    parts = api_key.split("_")
+    return parts[1][:16] if len(parts) > 1 else ""
+
+def _is_generated_format(api_key: str) -> bool:
+    """generate_api_key の形式（sk_<8桁の16進数>_<ランダム>）か"""
+    parts = api_key.split("_", 2)
+    return (
+        len(parts) == 3 and parts[0] == API_KEY_PREFIX and len(parts[1]) == 8
+        and all(c in "0123456789abcdef" for c in parts[1]) and bool(parts[2])
+    )
+
+class ApiKeyIndex:
+    """有効なAPIキーのハッシュ → ユーザーIDのプロセス内インデックス"""
+
+    def __init__(
+        self,
+        loader: Callable[[Optional[int]], List[Dict[str, Any]]] = None,
+        bound_loader: Callable[[], int] = None,
+        max_age: float = 3600.0,
+        refresh_interval: float = 30.0,
+        negative_ttl: float = 60.0,
+        negative_max_size: int = 10000,
+        miss_sync_interval: float = 1.0
+    ):
+        """
+        Args:
+            loader: 書き込んだトランザクションのID（xact_id）が引数以上のキー（None の場合は全件）を取得する関数
+            bound_loader: 完了済みのトランザクションの境界（これより小さいIDのトランザクションは全て完了している）を取得する関数
+            max_age: この秒数を超えると全件を読み込み直す
+            refresh_interval: この秒数を超えると差分をバックグラウンドで読み込む（リアルタイムの取りこぼしの反映）
+            negative_ttl: 存在しないキーを記録しておく秒数
+            negative_max_size: 存在しないキーを記録する最大件数
+            miss_sync_interval: 未知のキーによる差分の読み込みの最短間隔（秒）
+        """
+        self.loader = loader
+        self.bound_loader = bound_loader
+        self.max_age = max_age
+        self.refresh_interval = refresh_interval
+        self.negative_ttl = negative_ttl
+        self.negative_max_size = negative_max_size
+        self.miss_sync_interval = miss_sync_interval
+        self._by_hash: Dict[str, str] = {}
+        # ハッシュ → プレフィックスと、プレフィックスごとの有効なキーの数（未知のプレフィックスのキーだけ読み込みで確認する）
+        self._prefix_of: Dict[str, str] = {}
+        self._prefixes: Dict[str, int] = {}
+        self._negative: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refresh_count = 0
+        self._refreshing = False
+        self._miss_synced_at: Optional[float] = None
+        self.loaded_at: Optional[float] = None
+        self.refreshed_at: Optional[float] = None
+        # 差分の読み込みの起点（xact_id がこれより小さい変更は全て反映済み）
+        self.mark: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.prefix_rejections = 0
+        self.throttled = 0
+        self.reloads = 0
+        self.refreshes = 0
+        self.realtime_updates = 0
+
+    def configure(
+        self,
+        loader: Callable = None,
+        bound_loader: Callable = None,
+        max_age: float = None,
+        refresh_interval: float = None,
+        negative_ttl: float = None,
+        miss_sync_interval: float = None
+    ):
+        """ローダー関数・再読込間隔を設定"""
+        if loader is not None:
+            self.loader = loader
+        if bound_loader is not None:
+            self.bound_loader = bound_loader
+        if max_age is not None:
+            self.max_age = max_age
+        if refresh_interval is not None:
+            self.refresh_interval = refresh_interval
+        if negative_ttl is not None:
+            self.negative_ttl = negative_ttl
+        if miss_sync_interval is not None:
+            self.miss_sync_interval = miss_sync_interval
+
+    def _put(self, key_hash: str, user_id: str, key_prefix: Optional[str]):
+        self._drop(key_hash)
+        self._by_hash[key_hash] = user_id
+        if key_prefix is not None:
+            self._prefix_of[key_hash] = key_prefix
+            self._prefixes[key_prefix] = self._prefixes.get(key_prefix, 0) + 1
+        self._negative.pop(key_hash, None)
+
+    def _drop(self, key_hash: str):
+        self._by_hash.pop(key_hash, None)
+        key_prefix = self._prefix_of.pop(key_hash, None)
+        if key_prefix is not None:
+            count = self._prefixes.get(key_prefix, 0) - 1
+            if count > 0:
+                self._prefixes[key_prefix] = count
+            else:
+                self._prefixes.pop(key_prefix, None)
+
+    def _apply_rows(self, rows: List[Dict[str, Any]]):
+        for row in rows:
+            if row.get('is_active'):
+                self._put(row['key_hash'], row['user_id'], row.get('key_prefix'))
+            else:
+                self._drop(row['key_hash'])
+
+    def load(self) -> int:
+        """全件を読み込み、インデックスを作り直す"""
+        # 起点は読み込みの前に取得する（読み込み中にコミットされた変更は次の差分で読み込む）
+        mark = self.bound_loader() if self.bound_loader is not None else None
+        rows = self.loader(None)
+        with self._lock:
+            self._by_hash = {}
+            self._prefix_of = {}
+            self._prefixes = {}
+            self._apply_rows(rows)
+            self._negative.clear()
+            self.mark = mark
+            self.loaded_at = self.refreshed_at = time.monotonic()
+            self._refresh_count += 1
+            self.reloads += 1
+        return len(self._by_hash)
+
+    def refresh(self) -> int:
+        """
+        前回の起点以降に書き込まれたキーだけを反映
+
+        起点はトランザクションIDの完了済みの境界（スナップショットの xmin）のため、
+        書き込みとコミットの順が前後しても取りこぼさない（境界付近の変更は次回も読み込むが、反映は冪等）。
+        """
+        if self.mark is None:
+            return self.load()
+        mark = self.bound_loader()
+        rows = self.loader(self.mark)
+        with self._lock:
+            self._apply_rows(rows)
+            self.mark = max(self.mark, mark)
+            self.refreshed_at = time.monotonic()
+            self._refresh_count += 1
+            self.refreshes += 1
+        return len(rows)
+
+    def _sync(self):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > self.max_age:
+            self.load()
+        else:
+            self.refresh()
+
+    def refresh_in_background(self):
+        """差分の読み込みをバックグラウンドスレッドで実行（実行中の場合は何もしない）"""
+        with self._lock:
+            if self._refreshing or self.loader is None:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                with self._refresh_lock:
+                    self._sync()
+            except Exception as e:
+                print(f"❌ APIキーの読み込みに失敗しました: {e}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def verify(self, api_key: str) -> Optional[str]:
+        """
+        APIキーを検証し、ユーザーIDを返す（無効なキーは None）
+
+        インデックスに無いキーは、既知のプレフィックス・生成した形式でないもの（総当たり・誤入力）は読み込まずに拒否し、
+        未知のプレフィックスのキー（他のワーカーで作成したもの）だけ差分を読み込んで確認する。
+        差分の読み込みは miss_sync_interval に1回までで、確認できなかったキーは negative_ttl の間記録する。
+        """
+        key_hash = hash_api_key(api_key)
+        key_prefix = api_key_prefix(api_key)
+        now = time.monotonic()
+        with self._lock:
+            refresh_count = self._refresh_count
+            user_id = self._lookup(key_hash)
+            known = user_id is not None or key_hash in self._negative
+            refresh_due = self.refreshed_at is not None and now - self.refreshed_at > self.refresh_interval
+            if not known and self.loaded_at is not None and (key_prefix in self._prefixes or not _is_generated_format(api_key)):
+                self.prefix_rejections += 1
+                known = True
+            throttled = (
+                not known and self._miss_synced_at is not None
+                and now - self._miss_synced_at < self.miss_sync_interval
+            )
+            if not known and not throttled:
+                self._miss_synced_at = now
+        if known:
+            if refresh_due:
+                self.refresh_in_background()
+            return user_id
+        if self.loader is None:
+            return None
+        if throttled:
+            # 直前に読み込んだばかりのため確認しない（記録もしないため、次の読み込みで確認できる）
+            self.throttled += 1
+            return None
+
+        with self._refresh_lock:
+            # 待っている間に他のスレッドが読み込んだ場合は読み込み直さない
+            if self._refresh_count == refresh_count:
+                self._sync()
+
+        with self._lock:
+            user_id = self._by_hash.get(key_hash)
+            if user_id is None:
+                self._negative[key_hash] = time.monotonic() + self.negative_ttl
+                while len(self._negative) > self.negative_max_size:
+                    self._negative.popitem(last=False)
+            return user_id
+
+    def _lookup(self, key_hash: str) -> Optional[str]:
+        user_id = self._by_hash.get(key_hash)
+        if user_id is not None:
+            self.hits += 1
+            return user_id
+        expires_at = self._negative.get(key_hash)
+        if expires_at is not None:
+            if expires_at > time.monotonic():
+                self.negative_hits += 1
+                return None
+            del self._negative[key_hash]
+        self.misses += 1
+        return None
+
+    def add(self, key_hash: str, user_id: str, key_prefix: str = None):
+        """このプロセスで作成したキーを追加"""
+        with self._lock:
+            self._put(key_hash, user_id, key_prefix)
+
+    def remove(self, key_hash: str):
+        """無効化したキーを削除"""
+        with self._lock:
+            self._drop(key_hash)
+
+    def apply_change(self, payload: Dict[str, Any]):
+        """
+        api_keysテーブルのリアルタイムイベントを反映（他のワーカーでの無効化を refresh_interval を待たずに反映する）
+
+        キーを判別できないイベント（主キーだけの DELETE・RESYNC）は差分を読み込む。
+        """
+        event_type = payload.get('eventType') or payload.get('type')
+        record = payload.get('record') or payload.get('new') or {}
+        old_record = payload.get('old_record') or payload.get('old') or {}
+        with self._lock:
+            self.realtime_updates += 1
+            if event_type in ('INSERT', 'UPDATE') and record.get('key_hash'):
+                self._apply_rows([record])
+                return
+            if event_type == 'DELETE' and old_record.get('key_hash'):
+                self._drop(old_record['key_hash'])
+                return
+        self.refresh_in_background()
+
+    def clear(self):
+        """インデックスを空にする"""
+        with self._lock:
+            self._by_hash = {}
+            self._prefix_of = {}
+            self._prefixes = {}
+            self._negative.clear()
+            self.loaded_at = None
+            self.mark = None
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット・ミス・読み込み回数の統計を取得"""
+        with self._lock:
+            lookups = self.hits + self.misses + self.negative_hits
+            return {
+                "size": len(self._by_hash),
+                "negative_size": len(self._negative),
+                "hits": self.hits,
+                "misses": self.misses,
+                "negative_hits": self.negative_hits,
+                "hit_ratio": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+                "prefix_rejections": self.prefix_rejections,
+                "throttled": self.throttled,
+                "reloads": self.reloads,
+                "refreshes": self.refreshes,
+                "realtime_updates": self.realtime_updates,
+                "mark": self.mark,
+                "age_seconds": None if self.loaded_at is None else time.monotonic() - self.loaded_at,
+            }
+
+# グローバルインスタンス
+api_key_index = ApiKeyIndex()
+
+def get_api_key_index() -> ApiKeyIndex:
+    """APIキーのインデックスを取得"""
+    return api_key_index
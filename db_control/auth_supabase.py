@@ -1,35 +1,43 @@
-from supabase import create_client, Client
 from fastapi import HTTPException, Depends, Header
-from typing import Optional
+from typing import Optional, List, Dict, Any, TYPE_CHECKING
 import os
+import time
 from pathlib import Path
 from dotenv import load_dotenv
+from .supabase_client import get_supabase_client, get_supabase_anon_client
+from .token_cache import get_token_cache
+from .role_cache import get_role_cache
+from .api_key_index import get_api_key_index, generate_api_key, hash_api_key
 import jwt
 from datetime import datetime, timedelta
 
+if TYPE_CHECKING:
+    from supabase import Client
+
 # .env の読み込み
 base_path = Path(__file__).resolve().parent.parent
 env_path = base_path / '.env'
 load_dotenv(dotenv_path=env_path)
 
 # Supabase接続情報
-SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')  # バックエンド用
-SUPABASE_ANON_KEY = os.getenv('SUPABASE_ANON_KEY')  # フロントエンド用
-
-# Supabaseクライアントの作成（service_role key使用）
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+SUPABASE_ANON_KEY = os.getenv('SUPABASE_ANON_KEY')  # フロントエンド用（JWT検証に使用）
 
-def get_supabase_auth_client() -> Client:
+def get_supabase_auth_client() -> "Client":
     """Supabase認証クライアントを取得する関数（service_role key使用）"""
-    return supabase
+    return get_supabase_client()
 
-def get_supabase_anon_auth_client() -> Client:
+def get_supabase_anon_auth_client() -> "Client":
     """Supabase匿名認証クライアントを取得する関数（anon key使用）"""
-    return create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+    return get_supabase_anon_client()
 
 def verify_jwt_token(token: str) -> dict:
-    """JWTトークンを検証する関数"""
+    """JWTトークンを検証する関数（検証済みのトークンは exp までキャッシュ）"""
+    cache = get_token_cache()
+    if cache.is_revoked(token):
+        raise HTTPException(status_code=401, detail="無効なトークンです")
+    payload = cache.get(token)
+    if payload is not None:
+        return payload
     try:
         # SupabaseのJWTトークンを検証（anon keyで検証）
         payload = jwt.decode(
@@ -38,12 +46,22 @@ def verify_jwt_token(token: str) -> dict:
             algorithms=["HS256"],
             audience="authenticated"
         )
+        cache.put(token, payload)
         return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="トークンの有効期限が切れています")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="無効なトークンです")
 
+def revoke_jwt_token(token: str):
+    """JWTトークンを失効させる（有効期限まで検証キャッシュ・検証を通さない）"""
+    exp = None
+    try:
+        exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+    except jwt.InvalidTokenError:
+        pass
+    get_token_cache().revoke(token, exp)
+
 def get_current_user(authorization: Optional[str] = Header(None)) -> dict:
     """現在のユーザーを取得する関数（認証必須）"""
     if not authorization:
@@ -107,10 +125,11 @@ def sign_in_user(email: str, password: str) -> dict:
         raise HTTPException(status_code=401, detail=f"ログインに失敗しました: {str(e)}")
 
 def sign_out_user(token: str) -> bool:
-    """ユーザーログアウト（anon key使用）"""
+    """ユーザーログアウト（service_role key使用）"""
     try:
-        anon_client = get_supabase_anon_auth_client()
-        anon_client.auth.sign_out()
+        # 共有クライアントにはセッションを保持しないため、トークンを指定してセッションを無効化
+        get_supabase_auth_client().auth.admin.sign_out(token)
+        revoke_jwt_token(token)
         return True
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"ログアウトに失敗しました: {str(e)}")
@@ -127,56 +146,104 @@ def reset_password(email: str) -> bool:
 def update_user_profile(user_id: str, profile_data: dict) -> dict:
     """ユーザープロフィール更新（service_role key使用）"""
     try:
-        response = supabase.auth.update_user({
+        response = get_supabase_auth_client().auth.update_user({
             "data": profile_data
         })
         return response.user
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"プロフィール更新に失敗しました: {str(e)}")
 
+def _load_employee_roles(enp_cds: List[str]) -> List[Dict[str, Any]]:
+    """複数の従業員の役割を1回で取得（service_role key使用）"""
+    response = get_supabase_auth_client().table('employees').select('enp_cd, role').in_('enp_cd', enp_cds).execute()
+    return response.data or []
+
+get_role_cache().configure(bulk_loader=_load_employee_roles)
+
+def get_employee_roles(enp_cds: List[str]) -> Dict[str, Optional[str]]:
+    """複数の従業員の役割をまとめて取得（存在しない従業員は含まない）"""
+    return get_role_cache().get_roles(enp_cds)
+
 def check_user_permission(user_id: str, required_role: str = None) -> bool:
-    """ユーザーの権限をチェック（service_role key使用）"""
+    """ユーザーの権限をチェック（役割はキャッシュから取得）"""
     try:
-        # ユーザーの役割を取得
-        response = supabase.table('employees').select('role').eq('enp_cd', user_id).execute()
-        if not response.data:
+        roles = get_employee_roles([user_id])
+        if user_id not in roles:
             return False
         
-        user_role = response.data[0].get('role')
-        
         # 役割チェック
         if required_role:
-            return user_role == required_role
+            return roles[user_id] == required_role
         
         return True
     except Exception:
         return False
 
+def _load_api_keys(since: Optional[int]) -> List[Dict[str, Any]]:
+    """APIキーのハッシュを取得（書き込んだトランザクションのIDが since 以上のもの、None の場合は全件）"""
+    query = get_supabase_auth_client().table('api_keys').select('key_hash, key_prefix, user_id, is_active').not_.is_('key_hash', 'null')
+    if since is not None:
+        query = query.gte('xact_id', since)
+    return query.execute().data or []
+
+def _load_api_key_bound() -> int:
+    """APIキーの差分の読み込みの起点（完了済みのトランザクションの境界、migrations/010・011）"""
+    response = get_supabase_auth_client().rpc('realtime_catch_up_bound', {'table_name': 'api_keys'}).execute()
+    return int(response.data['bound'])
+
+get_api_key_index().configure(loader=_load_api_keys, bound_loader=_load_api_key_bound)
+
+def revoke_employee_session(token_hash: str, expires_at: int):
+    """従業員のセッションの無効化を記録し、有効期限の過ぎた記録を削除（migrations/013）"""
+    table = get_supabase_auth_client().table('employee_session_revocations')
+    table.upsert({"token_hash": token_hash, "expires_at": expires_at}, on_conflict='token_hash', ignore_duplicates=True).execute()
+    table.delete().lt('expires_at', int(time.time())).execute()
+
+def load_employee_session_revocations(since: Optional[int]) -> List[Dict[str, Any]]:
+    """無効化された従業員のセッションを取得（書き込んだトランザクションのIDが since 以上のもの、None の場合は有効期限内の全件）"""
+    query = get_supabase_auth_client().table('employee_session_revocations').select('token_hash, expires_at').gt('expires_at', int(time.time()))
+    if since is not None:
+        query = query.gte('xact_id', since)
+    return query.execute().data or []
+
+def load_employee_session_revocation_bound() -> int:
+    """セッションの無効化の差分の読み込みの起点（完了済みのトランザクションの境界）"""
+    response = get_supabase_auth_client().rpc('realtime_catch_up_bound', {'table_name': 'employee_session_revocations'}).execute()
+    return int(response.data['bound'])
+
 def create_api_key(user_id: str, key_name: str) -> str:
-    """APIキーを作成（service_role key使用）"""
+    """APIキーを作成（service_role key使用、キー本体は保存せずプレフィックスとハッシュのみ保存）"""
     try:
-        # 簡単なAPIキー生成（本番環境ではより安全な方法を使用）
-        api_key = f"sk_{user_id}_{key_name}_{datetime.now().timestamp()}"
+        api_key, key_prefix, key_hash = generate_api_key()
         
         # APIキーをデータベースに保存
-        supabase.table('api_keys').insert({
+        get_supabase_auth_client().table('api_keys').insert({
             "user_id": user_id,
             "key_name": key_name,
-            "api_key": api_key,
+            "key_prefix": key_prefix,
+            "key_hash": key_hash,
             "created_at": datetime.now().isoformat(),
             "is_active": True
         }).execute()
+        get_api_key_index().add(key_hash, user_id, key_prefix)
         
         return api_key
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"APIキー作成に失敗しました: {str(e)}")
 
+def revoke_api_key(api_key: str) -> bool:
+    """APIキーを無効化（service_role key使用）"""
+    try:
+        key_hash = hash_api_key(api_key)
+        get_supabase_auth_client().table('api_keys').update({"is_active": False}).eq('key_hash', key_hash).execute()
+        get_api_key_index().remove(key_hash)
+        return True
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"APIキーの無効化に失敗しました: {str(e)}")
+
 def verify_api_key(api_key: str) -> Optional[str]:
-    """APIキーを検証（service_role key使用）"""
+    """APIキーを検証（プロセス内のインデックスで照合し、未知のキーのみ差分を取得）"""
     try:
-        response = supabase.table('api_keys').select('user_id').eq('api_key', api_key).eq('is_active', True).execute()
-        if response.data:
-            return response.data[0]['user_id']
-        return None
+        return get_api_key_index().verify(api_key)
     except Exception:
-        return None 
\ No newline at end of file
+        return None
@@ -0,0 +1,252 @@
+from typing import Callable, Dict, Any, Optional, List, Tuple
+import json
+import os
+import select
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from dotenv import load_dotenv
+from .realtime_supabase import SupabaseRealtimeManager, parse_filter, match_filter, subscription_key, _parse_time
+from .realtime_dispatch import PRIMARY_KEYS
+
+# .env の読み込み
+base_path = Path(__file__).resolve().parent.parent
+env_path = base_path / '.env'
+load_dotenv(dotenv_path=env_path)
+
+# 変更フィードを使うかどうか
+CHANGE_FEED_ENABLED = os.getenv("CHANGE_FEED_ENABLED", "true").lower() == "true"
+# LISTEN に使う接続先（pgbouncer のトランザクションプーリングでは LISTEN できないため、直接接続を指定する）
+CHANGE_FEED_DATABASE_URL = os.getenv("CHANGE_FEED_DATABASE_URL")
+# 通知を受け取るチャンネル（migrations/006_change_feed_notify.sql のトリガー関数に固定で書かれているため設定で変えない）
+CHANGE_FEED_CHANNEL = "table_changes"
+# 切断時に再接続するまでの秒数
+CHANGE_FEED_RECONNECT_SECONDS = float(os.getenv("CHANGE_FEED_RECONNECT_SECONDS", "5"))
+# 通知が無い間に接続を確認する間隔（秒）
+CHANGE_FEED_PING_SECONDS = 30.0
+
+# フィルタの演算子 → SQLの比較演算子
+SQL_OPERATORS = {"eq": "=", "neq": "<>", "lt": "<", "lte": "<=", "gt": ">", "gte": ">="}
+
+class PostgresChangeFeed(SupabaseRealtimeManager):
+    """
+    PostgreSQLの LISTEN/NOTIFY でテーブルの変更を受け取るクラス（SQLAlchemy版のバックエンド用）
+
+    SupabaseRealtimeManager と同じ subscribe_to_table / subscribe_to_products などで購読でき、
+    コールバックも同じ配信キュー（RealtimeDispatcher）で実行する。
+    通知は専用の接続1本で受け取り、接続プールの接続は使わない。
+    """
+
+    def __init__(self, dsn: str = None, channel: str = CHANGE_FEED_CHANNEL, connect_args: Dict[str, Any] = None):
+        """
+        Args:
+            dsn: 接続先（postgresql://...）
+            channel: LISTEN するチャンネル
+            connect_args: psycopg2.connect に渡す追加の引数（sslmode など）
+        """
+        super().__init__()
+        self.dsn = dsn
+        self.channel = channel
+        self.connect_args = connect_args or {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.connected = False
+        self.connects = 0
+        self.notifications = 0
+        self.invalid = 0
+        self.last_notification_at: Optional[float] = None
+
+    def configure(self, dsn: str = None, channel: str = None, connect_args: Dict[str, Any] = None):
+        """接続先・チャンネルを設定（開始前に呼び出す）"""
+        if dsn is not None:
+            self.dsn = dsn
+        if channel is not None:
+            self.channel = channel
+        if connect_args is not None:
+            self.connect_args = connect_args
+
+    def subscribe_to_table(self, table_name: str, event: str = "*", callback: Callable = None, filter: str = None) -> Optional[str]:
+        """
+        テーブルの変更を監視する（通知の受信は全テーブルで1つの接続を共有する）
+
+        NOTIFY はサーバー側で絞り込めないため、イベント・フィルタは受信後にこのプロセスで適用する。
+
+        Args:
+            table_name: 監視するテーブル名
+            event: 監視するイベント（INSERT, UPDATE, DELETE, *）
+            callback: 変更時のコールバック関数
+            filter: 列のフィルタ（例: "store_cd=eq.A001"）
+
+        Returns:
+            購読のキー（unsubscribe_from_table に渡す）
+        """
+        if filter:
+            parse_filter(filter)
+        key = subscription_key(table_name, event, filter)
+        self.callbacks.setdefault(key, []).append((event, callback or self._default_callback))
+        self.channels[key] = self.channel
+        self.subscriptions[key] = (table_name, event, filter)
+        print(f"✅ {table_name}テーブルの監視を開始しました（LISTEN {self.channel}、イベント: {event}{'、フィルタ: ' + filter if filter else ''}）")
+        self.start()
+        return key
+
+    def unsubscribe_from_table(self, key: str):
+        """テーブルの監視を停止（key はテーブル名、または subscribe_to_table が返した購読のキー）"""
+        if key in self.channels:
+            del self.channels[key]
+            del self.callbacks[key]
+            self.subscriptions.pop(key, None)
+            self._forget_marks(key)
+            print(f"✅ {key} の監視を停止しました")
+
+    def start(self):
+        """通知を受け取るスレッドを開始（開始済みの場合は何もしない）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="change-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """通知の受信を停止し、配信キューに残っているイベントを処理する"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.dispatcher.stop()
+
+    def _connect(self):
+        import psycopg2
+        import psycopg2.extensions
+
+        conn = psycopg2.connect(self.dsn, **self.connect_args)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+        return conn
+
+    def _run(self):
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                self.connected = True
+                self.connects += 1
+                print(f"✅ 変更フィードに接続しました（LISTEN {self.channel}）")
+                self._schedule_catch_up(rejoined=self.connects > 1)
+                self._listen(conn)
+            except Exception as e:
+                if not self._stop.is_set():
+                    print(f"❌ 変更フィードの接続が切れました（{CHANGE_FEED_RECONNECT_SECONDS}秒後に再接続します）: {e}")
+            finally:
+                self.connected = False
+                # 切断中の通知は届かないため、受信中に取得した起点の候補は使わない
+                self._pending_marks.clear()
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._stop.wait(CHANGE_FEED_RECONNECT_SECONDS)
+
+    def _schedule_catch_up(self, rejoined: bool):
+        """接続時に補完の起点を取得し、再接続時は切断中の変更を補完する（LISTEN 開始後に実行）"""
+        for key in list(self.channels):
+            if self._catch_up_spec(key) is None:
+                continue
+            if rejoined:
+                self.dispatcher.submit_catch_up(key, lambda key=key: self.catch_up(key))
+            else:
+                self.dispatcher.submit_catch_up(key, lambda key=key: self._load_mark(key))
+
+    def _query(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        import psycopg2
+        import psycopg2.extras
+
+        conn = psycopg2.connect(self.dsn, **self.connect_args)
+        try:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+                cursor.execute(sql, params)
+                return [dict(row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _filter_sql(filter: Optional[str]) -> Tuple[str, tuple]:
+        """フィルタを WHERE 句の条件とパラメータに変換"""
+        if not filter:
+            return "", ()
+        column, operator, value = parse_filter(filter)
+        if operator == "in":
+            return f" AND {column}::text = ANY(%s)", ([item.strip().strip('"') for item in value.strip("()").split(",")],)
+        return f" AND {column} {SQL_OPERATORS[operator]} %s", (value,)
+
+    def _fetch_bound(self, table_name: str) -> Tuple[int, Optional[datetime]]:
+        """完了済みのトランザクションの境界と取得時刻を取得（SQLで取得）"""
+        bound = self._query("SELECT realtime_catch_up_bound(%s) AS bound", (table_name,))[0]["bound"]
+        return int(bound["bound"]), _parse_time(bound["at"])
+
+    def _fetch_after(self, table_name: str, column: str, since: Any, filter: str = None, key_table: str = None) -> List[Dict[str, Any]]:
+        """column が since 以上の行を (column, 主キー) の順に1回のクエリで取得（SQLで取得）"""
+        primary_key = PRIMARY_KEYS.get(key_table or table_name, "id")
+        condition, params = self._filter_sql(filter)
+        return self._query(
+            f"SELECT * FROM {table_name} WHERE {column} >= %s{condition} ORDER BY {column}, {primary_key}",
+            (since,) + params
+        )
+
+    def _listen(self, conn):
+        last_activity = time.monotonic()
+        while not self._stop.is_set():
+            # 停止の確認のため1秒ごとに戻る
+            if select.select([conn], [], [], 1.0) == ([], [], []):
+                if time.monotonic() - last_activity > CHANGE_FEED_PING_SECONDS:
+                    # 通知が無い間も接続が生きているかを確認する
+                    with conn.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                    last_activity = time.monotonic()
+                continue
+            conn.poll()
+            last_activity = time.monotonic()
+            while conn.notifies:
+                self._handle_notification(conn.notifies.pop(0).payload)
+
+    def _handle_notification(self, raw: str):
+        """NOTIFY のペイロードを該当テーブルのコールバックに配る"""
+        try:
+            payload = json.loads(raw)
+            table_name = payload.pop('table')
+        except (ValueError, KeyError, AttributeError):
+            self.invalid += 1
+            return
+        self.notifications += 1
+        self.last_notification_at = time.time()
+        event_type = payload.get('eventType')
+        record = payload.get('record') or payload.get('old_record') or {}
+        for key, (table, event, filter) in list(self.subscriptions.items()):
+            if table != table_name or event not in ("*", event_type):
+                continue
+            # 主キーだけの通知（truncated）は絞り込めないため、フィルタ付きの購読にも配る
+            if filter and not payload.get('truncated') and not match_filter(record, filter):
+                continue
+            self._dispatch(key, payload)
+
+    def stats(self) -> Dict[str, Any]:
+        """接続状態・通知件数・補完・配信キューの統計を取得"""
+        return {
+            "connected": self.connected,
+            "channel": self.channel,
+            "connects": self.connects,
+            "notifications": self.notifications,
+            "invalid": self.invalid,
+            "last_notification_at": self.last_notification_at,
+            **super().stats(),
+        }
+
+# グローバルインスタンス
+change_feed = PostgresChangeFeed(dsn=CHANGE_FEED_DATABASE_URL)
+
+def get_change_feed() -> PostgresChangeFeed:
+    """変更フィードを取得"""
+    return change_feed
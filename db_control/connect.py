@@ -4,6 +4,8 @@ from sqlalchemy.orm import Session
 import os
 from pathlib import Path
 from dotenv import load_dotenv
+from .query_stats import get_query_stats
+from .pool import pool_options
 
 # .env の読み込み
 base_path = Path(__file__).resolve().parent.parent
@@ -57,14 +59,18 @@ engine = create_engine(
     # pool_pre_ping=True,
     # pool_recycle=3600
     # Supabase用の設定
-    echo=True,
-    pool_pre_ping=True,
-    pool_recycle=3600,
+    # SQLの出力はクエリ統計（query_stats）で行うため、既定では標準出力に出さない
+    echo=os.getenv("SQL_ECHO", "false").lower() == "true",
+    # 接続プールの設定（DB_POOL_SIZE・DB_MAX_OVERFLOW・DB_POOL_TIMEOUT・DB_POOL_MODE など）
+    **pool_options(),
     connect_args={
         "sslmode": "require"
     }
 )
 
+# クエリの実行時間・件数を計測
+get_query_stats().instrument(engine)
+
 print("Current working directory:", os.getcwd())
 print("Certificate file exists:", os.path.exists('DigiCertGlobalRootCA.crt.pem'))
 
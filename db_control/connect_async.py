@@ -0,0 +1,34 @@
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from .connect import user, password, host, port, dbname
+from .query_stats import get_query_stats
+from .pool import pool_options, USE_PGBOUNCER
+
+# Supabase接続URL構築（PostgreSQL非同期接続用、asyncpgドライバ）
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{user}:{password}@{host}:{port}/{dbname}"
+
+# SQLAlchemy 非同期エンジンの作成
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    **pool_options(async_engine=True),
+    connect_args={
+        "ssl": "require",
+        # pgbouncer（トランザクションプーリング）ではプリペアドステートメントを使わない
+        **({"statement_cache_size": 0, "prepared_statement_cache_size": 0} if USE_PGBOUNCER else {})
+    }
+)
+
+# クエリの実行時間・件数を計測（非同期エンジンも内部の同期エンジンでイベントを受け取る）
+get_query_stats().instrument(async_engine.sync_engine)
+
+# 非同期セッションの定義（commit後も属性を参照できるよう expire_on_commit=False）
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+# 非同期DBセッション取得のための依存関数（get_db の非同期版）
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,7 +1,6 @@
-from .connect import engine
-from .mymodels import Base
+from .migrate import run_migrations
 
-# テーブルを作成
-Base.metadata.create_all(bind=engine)
+# テーブルを作成（migrations/ のマイグレーションを適用）
+run_migrations()
 
 print("✅ テーブル作成が完了しました。")
@@ -1,18 +1,33 @@
 from db_control.supabase_client import get_supabase_client
+from db_control.metrics import record_round_trip
+from db_control.lookup_cache import cached_lookup, invalidate_lookup
 from db_control.schemas import TransactionCreate, TransactionDetailCreate
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterator, Tuple
+
+def _execute(request):
+    """PostgRESTリクエストを実行し、ラウンドトリップ数を記録"""
+    record_round_trip("postgrest")
+    return request.execute()
 
 def get_product_by_code(code: str) -> Optional[Dict[str, Any]]:
     """商品コードで商品を取得（Supabase版）"""
     supabase = get_supabase_client()
-    response = supabase.table('products').select('*').eq('code', code).execute()
+    response = _execute(supabase.table('products').select('*').eq('code', code))
     return response.data[0] if response.data else None
 
+def get_products_by_codes(codes: List[str]) -> List[Dict[str, Any]]:
+    """複数の商品コードで商品をまとめて取得（Supabase版）"""
+    if not codes:
+        return []
+    supabase = get_supabase_client()
+    response = _execute(supabase.table('products').select('*').in_('code', list(codes)))
+    return response.data
+
 def check_product_exists(code: str) -> bool:
     """商品の存在確認（Supabase版）"""
     supabase = get_supabase_client()
-    response = supabase.table('products').select('prd_id').eq('code', code).execute()
+    response = _execute(supabase.table('products').select('prd_id').eq('code', code))
     return len(response.data) > 0
 
 def create_transaction_with_details(
@@ -27,7 +42,7 @@ def create_transaction_with_details(
     transaction_dict['datetime'] = datetime.now().isoformat()
     
     # 取引を挿入
-    transaction_response = supabase.table('transactions').insert(transaction_dict).execute()
+    transaction_response = _execute(supabase.table('transactions').insert(transaction_dict))
     transaction = transaction_response.data[0]
     
     # 取引詳細を作成
@@ -39,44 +54,109 @@ def create_transaction_with_details(
     
     # 取引詳細を一括挿入
     if details_to_insert:
-        supabase.table('transaction_details').insert(details_to_insert).execute()
+        _execute(supabase.table('transaction_details').insert(details_to_insert))
     
     return transaction
 
 def get_all_products() -> List[Dict[str, Any]]:
-    """全商品を取得（Supabase版）"""
+    """全商品を取得（Supabase版、prd_id順にページ単位で取得）"""
+    return list(iter_products())
+
+def get_products_page(after_prd_id: int = 0, limit: int = 1000) -> List[Dict[str, Any]]:
+    """prd_id をキーにしたキーセットページングで商品を取得（Supabase版）"""
     supabase = get_supabase_client()
-    response = supabase.table('products').select('*').execute()
+    response = _execute(
+        supabase.table('products')
+        .select('*')
+        .gt('prd_id', after_prd_id)
+        .order('prd_id')
+        .limit(limit)
+    )
     return response.data
 
+def iter_products(chunk_size: int = 1000, after_prd_id: int = 0) -> Iterator[Dict[str, Any]]:
+    """商品をチャンク単位で取得しながら1件ずつ返す（Supabase版）"""
+    while True:
+        page = get_products_page(after_prd_id, chunk_size)
+        yield from page
+        if len(page) < chunk_size:
+            return
+        after_prd_id = page[-1]['prd_id']
+
+def get_catalog_version() -> int:
+    """現在の商品カタログバージョン（完了したトランザクションの最大 version）を取得（Supabase版、migrations/009 の関数を使用）"""
+    supabase = get_supabase_client()
+    response = _execute(supabase.rpc('get_catalog_version', {}))
+    return response.data or 0
+
+def _version_page_filter(after_version: int, after_prd_id: int) -> str:
+    """(version, prd_id) のキーセットページングの条件（同じ version の行が多数あっても取りこぼさない）"""
+    return f"version.gt.{after_version},and(version.eq.{after_version},prd_id.gt.{after_prd_id})"
+
+def _iter_versions(table: str, columns: str, since: int, until: int, chunk_size: int = 1000) -> Iterator[Dict[str, Any]]:
+    """version が since より大きく until 以下の行を (version, prd_id) 順にページ単位で取得（Supabase版）"""
+    supabase = get_supabase_client()
+    after_version, after_prd_id = since, 0
+    while True:
+        response = _execute(
+            supabase.table(table)
+            .select(columns)
+            .or_(_version_page_filter(after_version, after_prd_id))
+            .lte('version', until)
+            .order('version')
+            .order('prd_id')
+            .limit(chunk_size)
+        )
+        yield from response.data
+        if len(response.data) < chunk_size:
+            return
+        after_version, after_prd_id = response.data[-1]['version'], response.data[-1]['prd_id']
+
+def get_product_changes(since: int, until: int, chunk_size: int = 1000) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    指定バージョンより後、until（get_catalog_version の値）以下で追加・更新・削除された商品を取得（Supabase版）
+
+    until より大きい version は実行中のトランザクションと前後してコミットされる可能性があるため、次回の差分で返す
+    """
+    return {
+        "products": list(_iter_versions('products', '*', since, until, chunk_size)),
+        "deleted": list(_iter_versions('product_tombstones', 'prd_id, code, version', since, until, chunk_size))
+    }
+
+@cached_lookup('employees')
 def get_employee_by_code(emp_code: str) -> Optional[Dict[str, Any]]:
     """従業員コードで従業員を取得（Supabase版）"""
     supabase = get_supabase_client()
-    response = supabase.table('employees').select('*').eq('enp_cd', emp_code).execute()
+    response = _execute(supabase.table('employees').select('*').eq('enp_cd', emp_code))
     return response.data[0] if response.data else None
 
 def create_customer(customer_data: Dict[str, Any]) -> Dict[str, Any]:
     """顧客を作成（Supabase版）"""
     supabase = get_supabase_client()
-    response = supabase.table('customers').insert(customer_data).execute()
+    response = _execute(supabase.table('customers').insert(customer_data))
+    # 作成前に「存在しない」と記録されたメールアドレスを無効化（他のワーカーはリアルタイムの変更で無効化する）
+    invalidate_lookup('customers', customer_data.get('email'))
     return response.data[0]
 
+@cached_lookup('customers')
 def get_customer_by_email(email: str) -> Optional[Dict[str, Any]]:
     """メールアドレスで顧客を取得（Supabase版）"""
     supabase = get_supabase_client()
-    response = supabase.table('customers').select('*').eq('email', email).execute()
+    response = _execute(supabase.table('customers').select('*').eq('email', email))
     return response.data[0] if response.data else None
 
 def update_customer_points(cust_id: int, new_points: int) -> Dict[str, Any]:
     """顧客のポイントを更新（Supabase版）"""
     supabase = get_supabase_client()
-    response = supabase.table('customers').update({'point': new_points}).eq('cust_id', cust_id).execute()
+    response = _execute(supabase.table('customers').update({'point': new_points}).eq('cust_id', cust_id))
+    invalidate_lookup('customers', response.data[0].get('email'))
     return response.data[0]
 
+@cached_lookup('coupons')
 def get_coupon_by_id(coupon_id: str) -> Optional[Dict[str, Any]]:
     """クーポンIDでクーポンを取得（Supabase版）"""
     supabase = get_supabase_client()
-    response = supabase.table('coupons').select('*').eq('coupon_id', coupon_id).execute()
+    response = _execute(supabase.table('coupons').select('*').eq('coupon_id', coupon_id))
     return response.data[0] if response.data else None
 
 def create_order_with_details(order_data: Dict[str, Any], order_details_data: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -87,7 +167,7 @@ def create_order_with_details(order_data: Dict[str, Any], order_details_data: Li
     order_data['datetime'] = datetime.now().isoformat()
     
     # 注文を挿入
-    order_response = supabase.table('orders').insert(order_data).execute()
+    order_response = _execute(supabase.table('orders').insert(order_data))
     order = order_response.data[0]
     
     # 注文詳細を作成
@@ -98,6 +178,37 @@ def create_order_with_details(order_data: Dict[str, Any], order_details_data: Li
     
     # 注文詳細を一括挿入
     if details_to_insert:
-        supabase.table('order_details').insert(details_to_insert).execute()
+        _execute(supabase.table('order_details').insert(details_to_insert))
     
-    return order 
\ No newline at end of file
+    return order
+
+def create_order_with_details_rpc(order_data: Dict[str, Any], order_details_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """注文と注文詳細を1回のRPCで作成（Supabase版、migrations/001 の関数を使用）"""
+    supabase = get_supabase_client()
+    response = _execute(supabase.rpc('create_order_with_details', {
+        'order_data': order_data,
+        'details': order_details_data
+    }))
+    return {**order_data, 'trd_id': response.data}
+
+def create_orders_with_details_batch(orders: List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]) -> List[int]:
+    """複数の注文と注文詳細を1回のRPCでまとめて作成（Supabase版、migrations/003 の関数を使用）"""
+    supabase = get_supabase_client()
+    response = _execute(supabase.rpc('create_orders_with_details', {
+        'orders': [{'order': order, 'details': details} for order, details in orders]
+    }))
+    return response.data
+
+def create_offline_orders_with_details_batch(orders: List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]) -> List[Tuple[int, bool]]:
+    """
+    オフライン取引の注文と注文詳細を1回のRPCでまとめて作成（Supabase版、migrations/014 の関数を使用）
+
+    Returns:
+        orders と同じ順の (trd_id, 今回登録したか)（登録済みの取引ID は既存の trd_id と False）
+    """
+    supabase = get_supabase_client()
+    response = _execute(supabase.rpc('create_orders_with_details_status', {
+        'orders': [{'order': order, 'details': details} for order, details in orders]
+    }))
+    return [(row['trd_id'], row['created']) for row in response.data]
+
@@ -0,0 +1,162 @@
+from db_control.supabase_client import get_async_supabase_client
+from db_control.metrics import record_round_trip
+from db_control.lookup_cache import cached_lookup, invalidate_lookup
+from datetime import datetime
+from typing import List, Optional, Dict, Any, AsyncIterator
+
+async def _execute(request):
+    """PostgRESTリクエストを実行し、ラウンドトリップ数を記録"""
+    record_round_trip("postgrest")
+    return await request.execute()
+
+async def get_product_by_code(code: str) -> Optional[Dict[str, Any]]:
+    """商品コードで商品を取得（Supabase非同期版）"""
+    supabase = await get_async_supabase_client()
+    response = await _execute(supabase.table('products').select('*').eq('code', code))
+    return response.data[0] if response.data else None
+
+async def get_products_by_codes(codes: List[str]) -> List[Dict[str, Any]]:
+    """複数の商品コードで商品をまとめて取得（Supabase非同期版）"""
+    if not codes:
+        return []
+    supabase = await get_async_supabase_client()
+    response = await _execute(supabase.table('products').select('*').in_('code', list(codes)))
+    return response.data
+
+async def check_product_exists(code: str) -> bool:
+    """商品の存在確認（Supabase非同期版）"""
+    supabase = await get_async_supabase_client()
+    response = await _execute(supabase.table('products').select('prd_id').eq('code', code))
+    return len(response.data) > 0
+
+async def get_all_products() -> List[Dict[str, Any]]:
+    """全商品を取得（Supabase非同期版、prd_id順にページ単位で取得）"""
+    return [product async for product in iter_products()]
+
+async def get_products_page(after_prd_id: int = 0, limit: int = 1000) -> List[Dict[str, Any]]:
+    """prd_id をキーにしたキーセットページングで商品を取得（Supabase非同期版）"""
+    supabase = await get_async_supabase_client()
+    response = await _execute(
+        supabase.table('products')
+        .select('*')
+        .gt('prd_id', after_prd_id)
+        .order('prd_id')
+        .limit(limit)
+    )
+    return response.data
+
+async def iter_products(chunk_size: int = 1000, after_prd_id: int = 0) -> AsyncIterator[Dict[str, Any]]:
+    """商品をチャンク単位で取得しながら1件ずつ返す（Supabase非同期版）"""
+    while True:
+        page = await get_products_page(after_prd_id, chunk_size)
+        for product in page:
+            yield product
+        if len(page) < chunk_size:
+            return
+        after_prd_id = page[-1]['prd_id']
+
+async def get_catalog_version() -> int:
+    """現在の商品カタログバージョン（完了したトランザクションの最大 version）を取得（Supabase非同期版、migrations/009 の関数を使用）"""
+    supabase = await get_async_supabase_client()
+    response = await _execute(supabase.rpc('get_catalog_version', {}))
+    return response.data or 0
+
+def _version_page_filter(after_version: int, after_prd_id: int) -> str:
+    """(version, prd_id) のキーセットページングの条件（同じ version の行が多数あっても取りこぼさない）"""
+    return f"version.gt.{after_version},and(version.eq.{after_version},prd_id.gt.{after_prd_id})"
+
+async def _iter_versions(table: str, columns: str, since: int, until: int, chunk_size: int = 1000) -> AsyncIterator[Dict[str, Any]]:
+    """version が since より大きく until 以下の行を (version, prd_id) 順にページ単位で取得（Supabase非同期版）"""
+    supabase = await get_async_supabase_client()
+    after_version, after_prd_id = since, 0
+    while True:
+        response = await _execute(
+            supabase.table(table)
+            .select(columns)
+            .or_(_version_page_filter(after_version, after_prd_id))
+            .lte('version', until)
+            .order('version')
+            .order('prd_id')
+            .limit(chunk_size)
+        )
+        for row in response.data:
+            yield row
+        if len(response.data) < chunk_size:
+            return
+        after_version, after_prd_id = response.data[-1]['version'], response.data[-1]['prd_id']
+
+async def get_product_changes(since: int, until: int, chunk_size: int = 1000) -> Dict[str, List[Dict[str, Any]]]:
+    """指定バージョンより後、until（get_catalog_version の値）以下で追加・更新・削除された商品を取得（Supabase非同期版）"""
+    return {
+        "products": [row async for row in _iter_versions('products', '*', since, until, chunk_size)],
+        "deleted": [row async for row in _iter_versions('product_tombstones', 'prd_id, code, version', since, until, chunk_size)]
+    }
+
+@cached_lookup('employees')
+async def get_employee_by_code(emp_code: str) -> Optional[Dict[str, Any]]:
+    """従業員コードで従業員を取得（Supabase非同期版）"""
+    supabase = await get_async_supabase_client()
+    response = await _execute(supabase.table('employees').select('*').eq('enp_cd', emp_code))
+    return response.data[0] if response.data else None
+
+async def create_customer(customer_data: Dict[str, Any]) -> Dict[str, Any]:
+    """顧客を作成（Supabase非同期版）"""
+    supabase = await get_async_supabase_client()
+    response = await _execute(supabase.table('customers').insert(customer_data))
+    # 作成前に「存在しない」と記録されたメールアドレスを無効化（他のワーカーはリアルタイムの変更で無効化する）
+    invalidate_lookup('customers', customer_data.get('email'))
+    return response.data[0]
+
+@cached_lookup('customers')
+async def get_customer_by_email(email: str) -> Optional[Dict[str, Any]]:
+    """メールアドレスで顧客を取得（Supabase非同期版）"""
+    supabase = await get_async_supabase_client()
+    response = await _execute(supabase.table('customers').select('*').eq('email', email))
+    return response.data[0] if response.data else None
+
+async def update_customer_points(cust_id: int, new_points: int) -> Dict[str, Any]:
+    """顧客のポイントを更新（Supabase非同期版）"""
+    supabase = await get_async_supabase_client()
+    response = await _execute(supabase.table('customers').update({'point': new_points}).eq('cust_id', cust_id))
+    invalidate_lookup('customers', response.data[0].get('email'))
+    return response.data[0]
+
+@cached_lookup('coupons')
+async def get_coupon_by_id(coupon_id: str) -> Optional[Dict[str, Any]]:
+    """クーポンIDでクーポンを取得（Supabase非同期版）"""
+    supabase = await get_async_supabase_client()
+    response = await _execute(supabase.table('coupons').select('*').eq('coupon_id', coupon_id))
+    return response.data[0] if response.data else None
+
+async def create_order_with_details(order_data: Dict[str, Any], order_details_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """注文と注文詳細を作成（Supabase非同期版）"""
+    supabase = await get_async_supabase_client()
+
+    # 注文データの作成
+    order_data['datetime'] = datetime.now().isoformat()
+
+    # 注文を挿入
+    order_response = await _execute(supabase.table('orders').insert(order_data))
+    order = order_response.data[0]
+
+    # 注文詳細を作成
+    details_to_insert = []
+    for detail in order_details_data:
+        detail['trd_id'] = order['trd_id']
+        details_to_insert.append(detail)
+
+    # 注文詳細を一括挿入
+    if details_to_insert:
+        await _execute(supabase.table('order_details').insert(details_to_insert))
+
+    return order
+
+async def create_order_with_details_rpc(order_data: Dict[str, Any], order_details_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """注文と注文詳細を1回のRPCで作成（Supabase非同期版、migrations/001 の関数を使用）"""
+    supabase = await get_async_supabase_client()
+    response = await _execute(supabase.rpc('create_order_with_details', {
+        'order_data': order_data,
+        'details': order_details_data
+    }))
+    return {**order_data, 'trd_id': response.data}
+
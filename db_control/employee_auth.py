@@ -0,0 +1,421 @@
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException, Header
+from typing import Callable, Dict, Any, List, Optional, Tuple
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+from .token_cache import hash_token
+
+# .env の読み込み
+base_path = Path(__file__).resolve().parent.parent
+env_path = base_path / '.env'
+load_dotenv(dotenv_path=env_path)
+
+# パスワード検証（bcrypt）を実行するプロセス数と、同時に待たせるログインの上限
+EMPLOYEE_LOGIN_WORKERS = int(os.getenv("EMPLOYEE_LOGIN_WORKERS", "2"))
+EMPLOYEE_LOGIN_MAX_PENDING = int(os.getenv("EMPLOYEE_LOGIN_MAX_PENDING", "32"))
+# セッションの有効期間（秒）
+EMPLOYEE_SESSION_TTL = int(os.getenv("EMPLOYEE_SESSION_TTL", str(8 * 60 * 60)))
+# セッショントークンの署名鍵（全ワーカーで同じ値が必要なため必須、未設定の場合は起動しない）
+EMPLOYEE_SESSION_SECRET = os.getenv("EMPLOYEE_SESSION_SECRET")
+# 他のワーカーでのログアウト（employee_session_revocations テーブル）を読み込む間隔（秒）
+EMPLOYEE_REVOCATION_SYNC_INTERVAL = float(os.getenv("EMPLOYEE_REVOCATION_SYNC_INTERVAL", "2"))
+
+class LoginBusyError(Exception):
+    """ログインの待ちが上限を超えた"""
+
+# ---- ワーカープロセスで実行する処理 ----
+
+_pwd_context = None
+_dummy_hash = None
+
+def _get_pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
+
+def hash_password(password: str) -> str:
+    """パスワードをbcryptでハッシュ化（従業員データの登録用）"""
+    return _get_pwd_context().hash(password)
+
+def _verify_password(password: str, stored: Optional[str]) -> bool:
+    """パスワードを検証（ワーカープロセスで実行）"""
+    global _dummy_hash
+    context = _get_pwd_context()
+    if stored and context.identify(stored) is not None:
+        return context.verify(password, stored)
+    # 従業員が存在しない場合・ハッシュ化前に登録された平文のパスワードも同じ時間をかけ、
+    # 応答時間から存在やパスワードの形式を推測されないようにする
+    if _dummy_hash is None:
+        _dummy_hash = context.hash(secrets.token_hex(16))
+    context.verify(password, _dummy_hash)
+    if not stored:
+        return False
+    return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+
+# ---- セッション ----
+
+def require_session_secret():
+    """署名鍵が設定されていることを確認（起動時に呼び出す、未設定の場合は RuntimeError）"""
+    if not EMPLOYEE_SESSION_SECRET:
+        raise RuntimeError("EMPLOYEE_SESSION_SECRET が設定されていません（全ワーカーで同じ値を設定してください）")
+
+def _sign(payload: bytes) -> str:
+    require_session_secret()
+    return hmac.new(EMPLOYEE_SESSION_SECRET.encode("utf-8"), payload, hashlib.sha256).hexdigest()
+
+class EmployeeSessionStore:
+    """
+    従業員のセッションを保持するプロセス内のストア
+
+    トークンは署名付きのため、このプロセスで発行していないトークン（他のワーカーで発行したもの）も
+    署名と有効期限を確認して取り込む。ログアウトはこのプロセス内で即時に反映し、
+    revoker で共有の無効化テーブル（migrations/013）に記録する。他のワーカーでのログアウトは
+    バックグラウンドスレッドで sync_interval ごとに revocation_loader で差分を読み込んで反映する
+    （get はDBにアクセスしないため、イベントループから呼び出せる）。
+    """
+
+    def __init__(
+        self,
+        ttl: int = EMPLOYEE_SESSION_TTL,
+        max_size: int = 10000,
+        revoker: Callable[[str, int], None] = None,
+        revocation_loader: Callable[[Optional[int]], List[Dict[str, Any]]] = None,
+        bound_loader: Callable[[], int] = None,
+        sync_interval: float = EMPLOYEE_REVOCATION_SYNC_INTERVAL
+    ):
+        """
+        Args:
+            ttl: セッションの有効期間（秒）
+            max_size: 保持するセッションの最大件数
+            revoker: 無効化を共有のテーブルに記録する関数（トークンのハッシュ, 有効期限）
+            revocation_loader: 無効化されたトークンを取得する関数（書き込んだトランザクションのIDが since 以上のもの、None の場合は有効期限内の全件）
+            bound_loader: 差分の読み込みの起点（完了済みのトランザクションの境界）を取得する関数
+            sync_interval: 他のワーカーでの無効化を読み込む間隔（秒）
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.revoker = revoker
+        self.revocation_loader = revocation_loader
+        self.bound_loader = bound_loader
+        self.sync_interval = sync_interval
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._revoked: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._sync_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.mark: Optional[int] = None
+        self.created = 0
+        self.hits = 0
+        self.imported = 0
+        self.rejected = 0
+        self.syncs = 0
+        self.sync_failures = 0
+        self.remote_revocations = 0
+
+    def configure(
+        self,
+        revoker: Callable[[str, int], None] = None,
+        revocation_loader: Callable[[Optional[int]], List[Dict[str, Any]]] = None,
+        bound_loader: Callable[[], int] = None,
+        sync_interval: float = None
+    ):
+        """共有の無効化テーブルの読み書きを設定（起動時に呼び出す）"""
+        if revoker is not None:
+            self.revoker = revoker
+        if revocation_loader is not None:
+            self.revocation_loader = revocation_loader
+        if bound_loader is not None:
+            self.bound_loader = bound_loader
+        if sync_interval is not None:
+            self.sync_interval = sync_interval
+
+    def create(self, employee: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """セッションを作成し、(トークン, セッション) を返す"""
+        session = {
+            "enp_cd": employee["enp_cd"],
+            "name": employee.get("name"),
+            "role": employee.get("role"),
+            "expires_at": int(time.time()) + self.ttl,
+        }
+        claims = dict(session, nonce=secrets.token_hex(8))
+        payload = base64.urlsafe_b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+        token = f"{payload.decode('ascii')}.{_sign(payload)}"
+        with self._lock:
+            self._purge()
+            self._sessions[hash_token(token)] = session
+            self.created += 1
+        return token, session
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """トークンからセッションを取得（無効・期限切れは None）"""
+        key = hash_token(token)
+        now = time.time()
+        with self._lock:
+            if key in self._revoked:
+                self.rejected += 1
+                return None
+            session = self._sessions.get(key)
+            if session is not None:
+                if session["expires_at"] > now:
+                    self.hits += 1
+                    return session
+                del self._sessions[key]
+
+        session = self._decode(token)
+        with self._lock:
+            if session is None or session["expires_at"] <= now:
+                self.rejected += 1
+                return None
+            self._purge()
+            self._sessions[key] = session
+            self.imported += 1
+        return session
+
+    @staticmethod
+    def _decode(token: str) -> Optional[Dict[str, Any]]:
+        try:
+            payload, signature = token.split(".")
+            if not hmac.compare_digest(_sign(payload.encode("ascii")), signature):
+                return None
+            session = json.loads(base64.urlsafe_b64decode(payload))
+            session.pop("nonce", None)
+            return session
+        except (ValueError, UnicodeError):
+            return None
+
+    def revoke(self, token: str) -> bool:
+        """
+        セッションを無効化（有効期限まで拒否し、共有のテーブルに記録して他のワーカーにも反映する）
+
+        署名を検証できないトークン・期限切れのトークンは記録しない（任意の文字列で無効化の記録を増やされないようにする）。
+
+        Returns:
+            無効化した場合は True
+        """
+        session = self._decode(token)
+        if session is None or session["expires_at"] <= time.time():
+            return False
+        key = hash_token(token)
+        expires_at = int(session["expires_at"])
+        with self._lock:
+            self._sessions.pop(key, None)
+            self._revoked[key] = expires_at
+        if self.revoker is not None:
+            try:
+                self.revoker(key, expires_at)
+            except Exception as e:
+                print(f"❌ セッションの無効化を記録できませんでした: {e}")
+                raise HTTPException(status_code=503, detail="ログアウトを記録できませんでした。しばらくしてから再度お試しください")
+        return True
+
+    def sync_revocations(self) -> int:
+        """
+        他のワーカーでの無効化を読み込み、反映した件数を返す
+
+        起点はトランザクションIDの完了済みの境界（スナップショットの xmin）のため、
+        書き込みとコミットの順が前後しても取りこぼさない。
+        """
+        # 起点は読み込みの前に取得する（読み込み中にコミットされた無効化は次回読み込む）
+        mark = self.bound_loader() if self.bound_loader is not None else None
+        rows = self.revocation_loader(self.mark)
+        now = time.time()
+        applied = 0
+        with self._lock:
+            for row in rows:
+                if row["expires_at"] <= now or row["token_hash"] in self._revoked:
+                    continue
+                self._sessions.pop(row["token_hash"], None)
+                self._revoked[row["token_hash"]] = row["expires_at"]
+                applied += 1
+            if mark is not None:
+                self.mark = mark if self.mark is None else max(self.mark, mark)
+            self.remote_revocations += applied
+            self.syncs += 1
+        return applied
+
+    def start(self):
+        """無効化の読み込みをバックグラウンドスレッドで開始（開始済み・未設定の場合は何もしない）"""
+        if self.revocation_loader is None or (self._sync_thread is not None and self._sync_thread.is_alive()):
+            return
+        self._stop.clear()
+        self._sync_thread = threading.Thread(target=self._run, name="employee-session-revocations", daemon=True)
+        self._sync_thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """無効化の読み込みを停止"""
+        self._stop.set()
+        if self._sync_thread is not None:
+            self._sync_thread.join(timeout)
+            self._sync_thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sync_revocations()
+            except Exception as e:
+                # 読み込みに失敗した場合は次の間隔で再試行する
+                self.sync_failures += 1
+                print(f"⚠️ セッションの無効化を読み込めませんでした: {e}")
+            self._stop.wait(self.sync_interval)
+
+    def _purge(self):
+        now = time.time()
+        if len(self._sessions) >= self.max_size:
+            for key in [key for key, session in self._sessions.items() if session["expires_at"] <= now]:
+                del self._sessions[key]
+            while len(self._sessions) >= self.max_size:
+                del self._sessions[next(iter(self._sessions))]
+        for key in [key for key, expires_at in self._revoked.items() if expires_at <= now]:
+            del self._revoked[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """セッション数・検証回数の統計を取得"""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "revoked": len(self._revoked),
+                "created": self.created,
+                "hits": self.hits,
+                "imported": self.imported,
+                "rejected": self.rejected,
+                "syncs": self.syncs,
+                "sync_failures": self.sync_failures,
+                "remote_revocations": self.remote_revocations,
+                "mark": self.mark,
+            }
+
+class EmployeeAuthenticator:
+    """パスワード検証をプロセスプールで実行し、成功時にセッションを発行するクラス"""
+
+    def __init__(self, session_store: EmployeeSessionStore, workers: int = EMPLOYEE_LOGIN_WORKERS, max_pending: int = EMPLOYEE_LOGIN_MAX_PENDING):
+        """
+        Args:
+            session_store: セッションの保存先
+            workers: パスワード検証のプロセス数
+            max_pending: 同時に処理・待機できるログインの上限（超えた場合は LoginBusyError）
+        """
+        self.session_store = session_store
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.logins = 0
+        self.failures = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # スレッドを持つ親プロセスを fork しないよう spawn で起動
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    async def verify_password(self, password: str, stored: Optional[str]) -> bool:
+        """パスワードをプロセスプールで検証（イベントループ・スレッドプールを止めない）"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise LoginBusyError()
+            self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), _verify_password, password, stored)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def login(self, employee: Optional[Dict[str, Any]], password: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        従業員のパスワードを検証し、成功した場合はセッションを発行
+
+        Args:
+            employee: 従業員（存在しない場合は None）
+            password: 入力されたパスワード・PIN
+
+        Returns:
+            (トークン, セッション)、認証に失敗した場合は None
+        """
+        stored = employee.get("password") if employee and employee.get("is_active", True) else None
+        if not await self.verify_password(password, stored) or stored is None:
+            self.failures += 1
+            return None
+        self.logins += 1
+        return self.session_store.create(employee)
+
+    def shutdown(self):
+        """プロセスプールを停止"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """ログイン件数・待ち数・セッションの統計を取得"""
+        return {
+            "workers": self.workers,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "logins": self.logins,
+            "failures": self.failures,
+            **self.session_store.stats(),
+        }
+
+# グローバルインスタンス
+employee_sessions = EmployeeSessionStore()
+employee_authenticator = EmployeeAuthenticator(employee_sessions)
+
+def get_employee_sessions() -> EmployeeSessionStore:
+    """従業員のセッションストアを取得"""
+    return employee_sessions
+
+def get_employee_authenticator() -> EmployeeAuthenticator:
+    """従業員の認証処理を取得"""
+    return employee_authenticator
+
+def get_bearer_token(authorization: Optional[str]) -> str:
+    """Authorizationヘッダーから Bearer トークンを取り出す"""
+    if not authorization:
+        raise HTTPException(status_code=401, detail="認証が必要です")
+    try:
+        scheme, token = authorization.split()
+    except ValueError:
+        raise HTTPException(status_code=401, detail="無効な認証ヘッダーです")
+    if scheme.lower() != "bearer":
+        raise HTTPException(status_code=401, detail="無効な認証スキームです")
+    return token
+
+def get_session_from_credentials(authorization: Optional[str] = None, token: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Authorizationヘッダー、または token パラメータのセッションを取得（無効な場合は None）
+
+    ヘッダーを付けられないクライアント（ブラウザの WebSocket・EventSource）は token パラメータで渡す。
+    """
+    if authorization:
+        try:
+            token = get_bearer_token(authorization)
+        except HTTPException:
+            return None
+    if not token:
+        return None
+    return employee_sessions.get(token)
+
+def get_current_employee(authorization: Optional[str] = Header(None)) -> Dict[str, Any]:
+    """ログイン中の従業員を取得する関数（セッションストアで検証、認証必須）"""
+    session = employee_sessions.get(get_bearer_token(authorization))
+    if session is None:
+        raise HTTPException(status_code=401, detail="セッションが無効か有効期限が切れています")
+    return session
@@ -0,0 +1,315 @@
+from collections import deque
+from typing import Dict, Any, Optional, Set, Iterable, List, AsyncIterator, Tuple
+import asyncio
+import json
+import itertools
+import os
+import threading
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+
+# .env の読み込み
+base_path = Path(__file__).resolve().parent.parent
+env_path = base_path / '.env'
+load_dotenv(dotenv_path=env_path)
+
+# クライアントごとのキューの上限（超えた場合は古いイベントから捨てる）
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "256"))
+# クライアントに配信するテーブル（customers は個人情報を含むため配信しない）
+EVENT_TABLES = ("orders", "products")
+# 店舗（store_cd）で絞り込めるテーブル
+STORE_TABLES = ("orders",)
+# SSEで接続を維持するためのコメントを送る間隔（秒）
+SSE_HEARTBEAT_SECONDS = 15.0
+
+# 購読の単位（テーブル名, 店舗コード）。店舗コードが None の場合は全店舗
+Topic = Tuple[str, Optional[str]]
+
+def event_topics(tables: Iterable[str], store_cd: Optional[str] = None) -> Set[Topic]:
+    """テーブルと店舗コードから購読の単位を作成（店舗で絞り込めないテーブルは全店舗）"""
+    return {(table, store_cd if table in STORE_TABLES else None) for table in tables}
+
+class EventSubscriber:
+    """1クライアント分のイベントキュー（上限付き、満杯の場合は最も古いイベントを捨てる）"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, tables: Iterable[str], max_queue: int = EVENT_QUEUE_SIZE, store_cd: str = None, pos_no: str = None):
+        """
+        Args:
+            tables: 購読するテーブル
+            max_queue: キューの上限
+            store_cd: 店舗コード（STORE_TABLES のイベントをこの店舗に絞り込む）
+            pos_no: レジ番号（店舗の中でさらにレジに絞り込む）
+        """
+        self.id = next(self._ids)
+        self.tables = set(tables)
+        self.topics = event_topics(self.tables, store_cd)
+        self.pos_no = pos_no
+        self.max_queue = max_queue
+        self._queue: deque = deque(maxlen=max_queue)
+        self._ready = asyncio.Event()
+        self.delivered = 0
+        self.dropped = 0
+
+    def wants(self, event: Dict[str, Any]) -> bool:
+        """レジ番号の条件に合うイベントか（列が無い変更前の行は判定できないため配る）"""
+        if self.pos_no is None or event["table"] not in STORE_TABLES:
+            return True
+        record = event["record"] or event["old_record"]
+        return record.get("pos_no", self.pos_no) == self.pos_no
+
+    def push(self, event: Dict[str, Any]):
+        """イベントを追加（イベントループのスレッドから呼び出す）"""
+        if len(self._queue) == self.max_queue:
+            self.dropped += 1
+        self._queue.append(event)
+        self._ready.set()
+
+    async def get(self) -> Dict[str, Any]:
+        """次のイベントを取得（無い場合は届くまで待つ）"""
+        while not self._queue:
+            self._ready.clear()
+            await self._ready.wait()
+        self.delivered += 1
+        return self._queue.popleft()
+
+    def pending(self) -> int:
+        """未配信のイベント数"""
+        return len(self._queue)
+
+class EventHub:
+    """
+    テーブルの変更イベントを多数のクライアント（WebSocket / SSE）に配信するハブ
+
+    上流（SupabaseRealtimeManager など subscribe_to_table を持つもの）にはテーブルごとに1回だけ購読し、
+    受け取ったイベントを各クライアントのキューに配る。
+    店舗を指定したクライアントには店舗で絞り込んだ上流の購読（subscribe_to_store_orders）を店舗ごとに1回だけ作り、
+    その店舗のクライアントが居なくなったら購読を解除する。
+    """
+
+    def __init__(self, source=None, max_queue: int = EVENT_QUEUE_SIZE):
+        """
+        Args:
+            source: 上流のイベントソース（subscribe_to_table(table, event, callback) を持つもの）
+            max_queue: クライアントごとのキューの上限
+        """
+        self.source = source
+        self.max_queue = max_queue
+        self._subscribers: Dict[Topic, Set[EventSubscriber]] = {}
+        # 購読の単位 → 上流の購読のキー（unsubscribe_from_table に渡す）
+        self._upstream: Dict[Topic, Optional[str]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self.published = 0
+        self.fanned_out = 0
+
+    def configure(self, source=None, max_queue: int = None):
+        """上流のイベントソース・キューの上限を設定"""
+        if source is not None:
+            self.source = source
+        if max_queue is not None:
+            self.max_queue = max_queue
+
+    def subscribe(self, tables: Iterable[str], store_cd: str = None, pos_no: str = None) -> EventSubscriber:
+        """クライアントを登録（イベントループ内で呼び出す）"""
+        self._loop = asyncio.get_running_loop()
+        subscriber = EventSubscriber(tables, self.max_queue, store_cd, pos_no)
+        for topic in subscriber.topics:
+            self._subscribers.setdefault(topic, set()).add(subscriber)
+            self._ensure_upstream(topic)
+        return subscriber
+
+    async def wait_ready(self, subscriber: EventSubscriber) -> bool:
+        """
+        クライアントの上流の購読の開始を待つ（店舗で絞り込んだ上流の購読はクライアントの登録時に作るため）
+
+        Returns:
+            上流の購読が全て開始できた場合は True（開始を確認できない上流は開始済みとみなす）
+        """
+        wait = getattr(self.source, "wait_until_subscribed", None)
+        keys = [key for key in (self._upstream.get(topic) for topic in subscriber.topics) if key is not None]
+        if wait is None or not keys:
+            return True
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, wait, keys)
+        except RuntimeError as e:
+            print(f"❌ イベントの配信を開始できませんでした: {e}")
+            return False
+        return True
+
+    def unsubscribe(self, subscriber: EventSubscriber):
+        """クライアントの登録を解除（店舗で絞り込んだ上流の購読は、最後のクライアントの解除で停止する）"""
+        for topic in subscriber.topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscriber)
+            if not subscribers and topic[1] is not None:
+                del self._subscribers[topic]
+                self._release_upstream(topic)
+
+    def connect_upstream(self, tables: Iterable[str] = EVENT_TABLES):
+        """上流のイベントソースにテーブルごとに1回だけ購読する（起動時に呼び出す）"""
+        for table in tables:
+            self._ensure_upstream((table, None))
+
+    def _ensure_upstream(self, topic: Topic):
+        table, store_cd = topic
+        with self._lock:
+            if self.source is None or topic in self._upstream:
+                return
+            self._upstream[topic] = None
+        callback = lambda payload: self.publish(table, payload, store_cd)
+        if store_cd is None:
+            key = self.source.subscribe_to_table(table, "*", callback)
+        else:
+            key = self.source.subscribe_to_store_orders(store_cd, callback)
+        with self._lock:
+            if topic in self._upstream:
+                self._upstream[topic] = key
+
+    def _release_upstream(self, topic: Topic):
+        with self._lock:
+            key = self._upstream.pop(topic, None)
+        if key is not None and self.source is not None:
+            self.source.unsubscribe_from_table(key)
+
+    def publish(self, table: str, payload: Dict[str, Any], store_cd: str = None):
+        """
+        テーブルの変更イベントを配信（どのスレッドからでも呼び出せる）
+
+        Args:
+            table: テーブル名
+            payload: リアルタイムイベントのペイロード
+            store_cd: 店舗で絞り込んだ上流の購読の場合は店舗コード
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        event = {
+            "table": table,
+            "type": payload.get('eventType') or payload.get('type'),
+            "record": payload.get('record') or payload.get('new') or {},
+            "old_record": payload.get('old_record') or payload.get('old') or {},
+            "published_at": time.time(),
+        }
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._fan_out((table, store_cd), event)
+        else:
+            loop.call_soon_threadsafe(self._fan_out, (table, store_cd), event)
+
+    def _fan_out(self, topic: Topic, event: Dict[str, Any]):
+        fanned_out = 0
+        for subscriber in list(self._subscribers.get(topic, ())):
+            if subscriber.wants(event):
+                subscriber.push(event)
+                fanned_out += 1
+        self.published += 1
+        self.fanned_out += fanned_out
+
+    def stats(self) -> Dict[str, Any]:
+        """クライアント数・配信数・破棄数の統計を取得"""
+        subscribers = {s for table_subscribers in self._subscribers.values() for s in table_subscribers}
+        return {
+            "clients": len(subscribers),
+            "clients_by_table": {_topic_name(topic): len(s) for topic, s in self._subscribers.items()},
+            "upstream_tables": sorted(_topic_name(topic) for topic in list(self._upstream)),
+            "published": self.published,
+            "fanned_out": self.fanned_out,
+            "pending": sum(s.pending() for s in subscribers),
+            "dropped": sum(s.dropped for s in subscribers),
+            "max_queue": self.max_queue,
+        }
+
+def _topic_name(topic: Topic) -> str:
+    table, store_cd = topic
+    return table if store_cd is None else f"{table}:store_cd={store_cd}"
+
+# グローバルインスタンス
+event_hub = EventHub()
+
+def get_event_hub() -> EventHub:
+    """イベント配信ハブを取得"""
+    return event_hub
+
+def parse_tables(tables: Optional[str], allowed: Iterable[str] = EVENT_TABLES) -> List[str]:
+    """カンマ区切りのテーブル名を検証して返す（未指定の場合は allowed の全テーブル）"""
+    allowed = tuple(allowed)
+    if not tables:
+        return list(allowed)
+    names = [name.strip() for name in tables.split(",") if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown or not names:
+        raise ValueError(f"配信できないテーブルです: {', '.join(unknown)}")
+    return names
+
+def validate_store_filter(store_cd: Optional[str], pos_no: Optional[str]):
+    """店舗コード・レジ番号の指定を検証（不正な場合は ValueError）"""
+    if pos_no is not None and store_cd is None:
+        raise ValueError("pos_no は store_cd と一緒に指定してください")
+    for name, value, max_length in (("store_cd", store_cd, 5), ("pos_no", pos_no, 3)):
+        # リアルタイムのフィルタ（store_cd=eq.値）に埋め込むため英数字のみ
+        if value is not None and not (value.isascii() and value.isalnum() and len(value) <= max_length):
+            raise ValueError(f"不正な{name}です: {value}")
+
+async def stream_websocket(websocket, tables: List[str], store_cd: str = None, pos_no: str = None):
+    """WebSocketでイベントを送り続ける（切断されたら購読を解除）"""
+    from starlette.websockets import WebSocketDisconnect
+
+    await websocket.accept()
+    subscriber = event_hub.subscribe(tables, store_cd, pos_no)
+    if not await event_hub.wait_ready(subscriber):
+        event_hub.unsubscribe(subscriber)
+        await websocket.close(code=1011)
+        return
+
+    async def wait_disconnect():
+        # クライアントからのメッセージは使わず、切断の検知のみに使う
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+
+    disconnect = asyncio.ensure_future(wait_disconnect())
+    try:
+        while not disconnect.done():
+            next_event = asyncio.ensure_future(subscriber.get())
+            await asyncio.wait({next_event, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_event.done():
+                next_event.cancel()
+                break
+            await websocket.send_json(next_event.result())
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        disconnect.cancel()
+        event_hub.unsubscribe(subscriber)
+
+async def sse_lines(
+    request,
+    tables: List[str],
+    heartbeat: float = SSE_HEARTBEAT_SECONDS,
+    store_cd: str = None,
+    pos_no: str = None
+) -> AsyncIterator[str]:
+    """Server-Sent Events の形式でイベントを返すジェネレータ（切断されたら購読を解除、上流の購読を開始できない場合は error イベントを送って終了）"""
+    subscriber = event_hub.subscribe(tables, store_cd, pos_no)
+    try:
+        if not await event_hub.wait_ready(subscriber):
+            yield f"event: error\ndata: {json.dumps({'detail': 'イベントの配信を開始できませんでした'}, ensure_ascii=False)}\n\n"
+            return
+        while not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(subscriber.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: {event['table']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+    finally:
+        event_hub.unsubscribe(subscriber)
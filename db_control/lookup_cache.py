@@ -0,0 +1,173 @@
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Optional, Tuple
+import functools
+import inspect
+import os
+import threading
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+
+# .env の読み込み
+base_path = Path(__file__).resolve().parent.parent
+env_path = base_path / '.env'
+load_dotenv(dotenv_path=env_path)
+
+# 読み取りキャッシュの有効・無効と、エンティティごとの最大件数
+LOOKUP_CACHE_ENABLED = os.getenv("LOOKUP_CACHE_ENABLED", "true").lower() == "true"
+LOOKUP_CACHE_MAX_SIZE = int(os.getenv("LOOKUP_CACHE_MAX_SIZE", "10000"))
+
+# エンティティごとの保持秒数（LOOKUP_CACHE_TTL_<エンティティ名> で上書き）
+DEFAULT_TTLS = {
+    "employees": 300.0,
+    "coupons": 300.0,
+    # ポイントの更新に使うため短くする（他のワーカーでの更新はリアルタイムの変更で無効化する）
+    "customers": 10.0,
+}
+# 存在しないキー（404）を保持する秒数
+NEGATIVE_TTL = float(os.getenv("LOOKUP_CACHE_NEGATIVE_TTL", "30"))
+
+# 存在しないことを表す値
+_NOT_FOUND = object()
+
+class LookupCache:
+    """1エンティティ分の読み取りキャッシュ（TTL・件数上限付きのLRU、存在しないキーも保持）"""
+
+    def __init__(self, name: str, ttl: float, max_size: int = LOOKUP_CACHE_MAX_SIZE, negative_ttl: float = NEGATIVE_TTL):
+        """
+        Args:
+            name: エンティティ名
+            ttl: 取得した値を保持する秒数
+            max_size: 保持する最大件数（超えた場合は最も古く使われたものから削除）
+            negative_ttl: 存在しないキーを保持する秒数
+        """
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[Any, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 無効化のたびに増やし、取得中に無効化された値を保持しない
+        self.generation = 0
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Any) -> Tuple[bool, Optional[Any]]:
+        """(キャッシュにあったか, 値) を返す（存在しないキーは (True, None)）"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                if entry[0] is _NOT_FOUND:
+                    self.negative_hits += 1
+                    return True, None
+                self.hits += 1
+                return True, dict(entry[0]) if isinstance(entry[0], dict) else entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key: Any, value: Optional[Any], generation: int = None):
+        """値を保持（None は存在しないキーとして negative_ttl の間保持）"""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if value is None:
+                entry = (_NOT_FOUND, time.monotonic() + self.negative_ttl)
+            else:
+                entry = (dict(value) if isinstance(value, dict) else value, time.monotonic() + self.ttl)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Any = None):
+        """キーを無効化（key を省略した場合は全件）"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+            self.generation += 1
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット・ミスの統計を取得"""
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "negative_ttl": self.negative_ttl,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+_caches: Dict[str, LookupCache] = {}
+_caches_lock = threading.Lock()
+
+def get_lookup_cache(entity: str) -> LookupCache:
+    """エンティティの読み取りキャッシュを取得（同期版・非同期版のCRUDで共有）"""
+    with _caches_lock:
+        cache = _caches.get(entity)
+        if cache is None:
+            ttl = float(os.getenv(f"LOOKUP_CACHE_TTL_{entity.upper()}", DEFAULT_TTLS.get(entity, 60.0)))
+            cache = _caches[entity] = LookupCache(entity, ttl)
+        return cache
+
+def invalidate_lookup(entity: str, key: Any = None):
+    """エンティティのキャッシュを無効化（key を省略した場合は全件）"""
+    get_lookup_cache(entity).invalidate(key)
+
+def lookup_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """エンティティごとのキャッシュの統計を取得"""
+    with _caches_lock:
+        caches = list(_caches.values())
+    return {cache.name: cache.stats() for cache in caches}
+
+def cached_lookup(entity: str) -> Callable:
+    """
+    1つのキーで1件を取得するCRUD関数を読み取りキャッシュ経由にするデコレータ（同期・非同期の両方に対応）
+
+    Args:
+        entity: エンティティ名（TTL・統計の単位）
+    """
+    def decorator(func: Callable) -> Callable:
+        if not LOOKUP_CACHE_ENABLED:
+            return func
+        cache = get_lookup_cache(entity)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(key):
+                found, value = cache.get(key)
+                if found:
+                    return value
+                generation = cache.generation
+                value = await func(key)
+                cache.put(key, value, generation)
+                return value
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(key):
+            found, value = cache.get(key)
+            if found:
+                return value
+            generation = cache.generation
+            value = func(key)
+            cache.put(key, value, generation)
+            return value
+        return wrapper
+    return decorator
@@ -0,0 +1,175 @@
+from contextvars import ContextVar
+from typing import Dict, Any, Optional, Tuple, List
+import threading
+import time
+
+# 応答時間ヒストグラムのバケット（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 1リクエストあたりのDB/PostgRESTラウンドトリップ数のバケット
+ROUND_TRIP_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    """ラベルごとに値を保持するメトリクスの基底クラス"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    """単調増加するカウンター"""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+class Gauge(Counter):
+    """増減するゲージ"""
+
+    type_name = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    """バケットごとの累積件数・合計・件数を保持するヒストグラム"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][index] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, state in self._values.items():
+            labels = dict(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, state["buckets"]):
+                bucket_labels = dict(labels, le=_format_value(float(bound)))
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {state['count']}")
+        return lines
+
+# 1リクエスト内のバックエンド別ラウンドトリップ数（db: SQLAlchemy、postgrest: Supabase）
+_round_trips: ContextVar[Optional[Dict[str, int]]] = ContextVar("request_round_trips", default=None)
+
+def record_round_trip(backend: str, count: int = 1):
+    """実行中のリクエストにDB/PostgRESTのラウンドトリップを記録"""
+    round_trips = _round_trips.get()
+    if round_trips is not None:
+        round_trips[backend] = round_trips.get(backend, 0) + count
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency in seconds by route.",
+    ("method", "route")
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being processed."
+)
+RESPONSES = Counter(
+    "http_responses_total",
+    "HTTP responses by route and status code.",
+    ("method", "route", "status")
+)
+REQUEST_ROUND_TRIPS = Histogram(
+    "request_backend_round_trips",
+    "DB / PostgREST round trips per HTTP request.",
+    ("route", "backend"),
+    buckets=ROUND_TRIP_BUCKETS
+)
+
+METRICS = [REQUEST_LATENCY, REQUESTS_IN_FLIGHT, RESPONSES, REQUEST_ROUND_TRIPS]
+
+def register_metric(metric: _Metric) -> _Metric:
+    """/metrics に出力するメトリクスを追加"""
+    METRICS.append(metric)
+    return metric
+
+def create_metrics_middleware(backends: Tuple[str, ...] = ()):
+    """
+    メトリクス記録用のミドルウェアを作成
+
+    Args:
+        backends: ラウンドトリップが0回のリクエストも記録するバックエンド名
+    """
+    async def metrics_middleware(request, call_next):
+        """ルートごとの応答時間・処理中リクエスト数・ステータス別件数・ラウンドトリップ数を記録するミドルウェア"""
+        return await _track_request(request, call_next, backends)
+    return metrics_middleware
+
+async def _track_request(request, call_next, backends: Tuple[str, ...]):
+    token = _round_trips.set({backend: 0 for backend in backends})
+    REQUESTS_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        REQUESTS_IN_FLIGHT.dec()
+        route = request.scope.get("route")
+        route_path = route.path if route else "unmatched"
+        REQUEST_LATENCY.observe(elapsed, method=request.method, route=route_path)
+        RESPONSES.inc(method=request.method, route=route_path, status=str(status))
+        for backend, count in _round_trips.get().items():
+            REQUEST_ROUND_TRIPS.observe(count, route=route_path, backend=backend)
+        _round_trips.reset(token)
+
+def render_metrics() -> str:
+    """全メトリクスをPrometheusのテキスト形式で出力"""
+    return "\n".join(metric.render() for metric in METRICS) + "\n"
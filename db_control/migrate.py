@@ -0,0 +1,91 @@
+from pathlib import Path
+from typing import List, Tuple
+import re
+import sys
+
+# マイグレーションSQLの置き場所（<番号>_<名前>.sql を番号順に適用）
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / 'migrations'
+MIGRATION_FILE_PATTERN = re.compile(r"^(\d+)_(.+)\.sql$")
+
+# 複数ワーカー・複数デプロイから同時に実行されないようにするアドバイザリロックのキー
+MIGRATION_LOCK_KEY = 741201
+
+def list_migrations() -> List[Tuple[int, str, Path]]:
+    """マイグレーションファイルを (番号, 名前, パス) の番号順リストで取得"""
+    migrations = []
+    for path in MIGRATIONS_DIR.glob('*.sql'):
+        match = MIGRATION_FILE_PATTERN.match(path.name)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), path))
+    return sorted(migrations)
+
+def _applied_versions(cursor) -> set:
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+def run_migrations(engine=None, dry_run: bool = False) -> List[str]:
+    """
+    未適用のマイグレーションを番号順に適用する（1ファイル1トランザクション）
+
+    Args:
+        engine: 適用先のエンジン（省略時は connect.py のエンジン）
+        dry_run: True の場合は適用せず、未適用のマイグレーションを返すだけ
+
+    Returns:
+        適用した（dry_run の場合は未適用の）マイグレーションのファイル名
+    """
+    if engine is None:
+        from .connect import engine
+
+    applied = []
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+        try:
+            done = _applied_versions(cursor)
+            connection.commit()
+            for version, name, path in list_migrations():
+                if version in done:
+                    continue
+                if dry_run:
+                    applied.append(path.name)
+                    continue
+                try:
+                    cursor.execute(path.read_text(encoding='utf-8'))
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                        (version, name)
+                    )
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+                    raise
+                applied.append(path.name)
+                print(f"✅ マイグレーションを適用しました: {path.name}")
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+            connection.commit()
+    finally:
+        connection.close()
+    return applied
+
+# デプロイ時に実行: python -m db_control.migrate [--dry-run]
+if __name__ == "__main__":
+    dry_run = "--dry-run" in sys.argv
+    try:
+        migrations = run_migrations(dry_run=dry_run)
+        if dry_run:
+            print(f"未適用のマイグレーション: {migrations or 'なし'}")
+        else:
+            print(f"✅ マイグレーションが完了しました（{len(migrations)}件適用）")
+    except Exception as e:
+        print(f"❌ マイグレーションに失敗しました: {e}")
+        sys.exit(1)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Date, ForeignKey, UniqueConstraint, LargeBinary, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, Date, ForeignKey, UniqueConstraint, LargeBinary, Boolean
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .connect import Base
@@ -8,7 +8,7 @@ class Product(Base):
     __tablename__ = 'products'
 
     prd_id = Column(Integer, primary_key=True, autoincrement=True)
-    code = Column(String(20), nullable=False)
+    code = Column(String(20), nullable=False, unique=True, index=True)
     name = Column(String(50), nullable=False)
     price = Column(Integer, nullable=False)
 
@@ -19,12 +19,14 @@ class Customer(Base):
     __tablename__ = 'customers'
 
     cust_id = Column(Integer, primary_key=True, autoincrement=True)
-    email = Column(String(255), nullable=True)
+    email = Column(String(255), nullable=True, index=True)
     name = Column(String(100), nullable=True)
     point = Column(Integer, nullable=False)
     is_active = Column(Boolean, nullable=False)
     synced_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, nullable=False, default=func.now())
+    updated_at = Column(DateTime(timezone=True), nullable=False, default=func.now(), index=True)
+    xact_id = Column(BigInteger, nullable=True)  # 更新したトランザクションのID（migrations/010、トリガーで設定）
 
     orders = relationship('Order', back_populates='customer')
 
@@ -62,7 +64,7 @@ class Order(Base):
     __tablename__ = 'orders'
 
     trd_id = Column(Integer, primary_key=True, autoincrement=True)
-    datetime = Column(DateTime, nullable=False)
+    datetime = Column(DateTime, nullable=False, index=True)
     enp_cd = Column(String(10), ForeignKey("employees.enp_cd"), nullable=False)
     store_cd = Column(String(5), nullable=False)
     pos_no = Column(String(3), nullable=False)
@@ -73,6 +75,11 @@ class Order(Base):
     coupon_id = Column(String(20), ForeignKey('coupons.coupon_id'), nullable=True)
     discount_by_cp = Column(Integer, nullable=True)
     final_amt = Column(Integer, nullable=False)
+    sale_id = Column(String(64), nullable=True)  # 端末側で採番した取引ID（オフライン取引のみ）
+    xact_id = Column(BigInteger, nullable=True)  # 登録したトランザクションのID（migrations/010、列の既定値で設定）
+
+    # 同じ端末の同じ取引IDは1件だけ登録する（migrations/008_orders_sale_id.sql）
+    __table_args__ = (UniqueConstraint('store_cd', 'pos_no', 'sale_id', name='orders_sale_id_key'),)
 
     customer = relationship('Customer', back_populates='orders')
     coupon = relationship('Coupon', back_populates='orders')  # ✅ 修正
@@ -85,7 +92,7 @@ class OrderDetail(Base):
     __tablename__ = 'order_details'
 
     dtl_id = Column(Integer, primary_key=True, autoincrement=True)
-    trd_id = Column(Integer, ForeignKey('orders.trd_id'), nullable=False)
+    trd_id = Column(Integer, ForeignKey('orders.trd_id'), nullable=False, index=True)
     prd_id = Column(Integer, ForeignKey('products.prd_id'), nullable=False)
     prd_code = Column(String(20), nullable=False)
     prd_name = Column(String(50), nullable=False)
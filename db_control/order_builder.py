@@ -0,0 +1,99 @@
+from typing import Optional, List, Dict, Any, Tuple, Union
+from datetime import datetime
+import math
+from pytz import timezone
+from .schemas import CartItem, OfflineSale
+from .order_writer import OrderEntry
+
+GUEST_CODE = "GUEST00001"  # ゲストコード
+
+def build_order_values(
+    items: List[CartItem],
+    emp_cd: Optional[str],
+    ordered_at: Optional[datetime] = None,
+    store_cd: str = "A001",
+    pos_no: str = "P01",
+    sale_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """カート内容から注文（Order）の登録値を作成（SQLAlchemy版・Supabase版で共通）"""
+    # 合計金額の計算
+    total_amount = sum(item.price * item.quantity for item in items)
+    total_amount_with_tax = math.floor(total_amount * 1.1)  # 税率10%
+
+    # 日本時間のタイムスタンプを取得（オフライン取引は端末の販売日時を使用）
+    jst = timezone('Asia/Tokyo')
+    current_time = ordered_at or datetime.now(jst)
+    # orders.datetime はタイムゾーンなしの列（JSTの日時）のため、JSTに変換してからタイムゾーンを外す
+    # （asyncpg はタイムゾーン付きの日時をタイムゾーンなしの列に渡せない）
+    if current_time.tzinfo is not None:
+        current_time = current_time.astimezone(jst).replace(tzinfo=None)
+
+    order_values = {
+        "datetime": current_time,  # JSTで設定
+        "enp_cd": emp_cd or GUEST_CODE,
+        "store_cd": store_cd,
+        "pos_no": pos_no,
+        "total_amt": total_amount_with_tax,
+        "ttl_amt_ex_tax": total_amount,
+        "final_amt": total_amount_with_tax
+    }
+    # 端末で採番した取引IDは再送時の重複登録の防止に使う（migrations/008_orders_sale_id.sql）
+    if sale_id is not None:
+        order_values["sale_id"] = sale_id
+    return order_values
+
+def build_order_detail_rows(items: List[CartItem], trd_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """カート内容から注文明細（OrderDetail）の登録値を作成"""
+    return [
+        {
+            "trd_id": trd_id,
+            "prd_id": item.prd_id,
+            "prd_code": item.code,
+            "prd_name": item.name,
+            "prd_price": item.price,
+            "quantity": item.quantity,
+            "tax_cd": "10"    # 税区分コード：10%
+        }
+        for item in items
+    ]
+
+def to_json_values(order_values: Dict[str, Any]) -> Dict[str, Any]:
+    """注文の登録値をJSONで送れる形に変換（Supabase版）"""
+    return {**order_values, "datetime": order_values["datetime"].isoformat()}
+
+def offline_sale_entries(sales: List[OfflineSale]) -> List[OrderEntry]:
+    """オフライン取引を (注文データ, 注文明細データ) のリストに変換"""
+    return [
+        (
+            build_order_values(sale.items, sale.emp_cd, sale.datetime, sale.store_cd, sale.pos_no, sale.sale_id),
+            build_order_detail_rows(sale.items)
+        )
+        for sale in sales
+    ]
+
+def duplicate_sale_ids(sales: List[OfflineSale]) -> List[str]:
+    """1回の一括登録の中で重複している取引IDを取得"""
+    seen = set()
+    duplicates = []
+    for sale in sales:
+        if sale.sale_id in seen and sale.sale_id not in duplicates:
+            duplicates.append(sale.sale_id)
+        seen.add(sale.sale_id)
+    return duplicates
+
+def batch_results(sales: List[OfflineSale], results: List[Union[Tuple[int, bool], Exception]]) -> Dict[str, Any]:
+    """
+    一括登録の結果を端末の取引IDごとにまとめる
+
+    results は (trd_id, 今回登録したか) または例外で、登録済みの取引（再送）は status "duplicate" で既存の取引IDを返す。
+    """
+    mapping = {}
+    for sale, result in zip(sales, results):
+        if isinstance(result, Exception):
+            mapping[sale.sale_id] = {"status": "error", "detail": str(result)}
+        else:
+            trd_id, created = result
+            mapping[sale.sale_id] = {"status": "created" if created else "duplicate", "transaction_id": trd_id}
+    created = sum(1 for r in mapping.values() if r["status"] == "created")
+    duplicate = sum(1 for r in mapping.values() if r["status"] == "duplicate")
+    return {"created": created, "duplicate": duplicate, "failed": len(mapping) - created - duplicate, "results": mapping}
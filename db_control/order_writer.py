@@ -0,0 +1,273 @@
+from concurrent.futures import Future, InvalidStateError
+from typing import Callable, Dict, Any, List, Optional, Tuple, Union
+import asyncio
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+
+# .env の読み込み
+base_path = Path(__file__).resolve().parent.parent
+env_path = base_path / '.env'
+load_dotenv(dotenv_path=env_path)
+
+# 注文登録方式（direct: リクエストごとにコミット / group: グループコミット）
+ORDER_WRITE_MODE = os.getenv("ORDER_WRITE_MODE", "direct").lower()
+USE_GROUP_COMMIT = ORDER_WRITE_MODE == "group"
+# リクエストがバッチのコミットを待つ最大秒数
+ORDER_WRITE_TIMEOUT_SECONDS = float(os.getenv("ORDER_WRITE_TIMEOUT_SECONDS", "30"))
+
+# (注文データ, 注文明細データのリスト)
+OrderEntry = Tuple[Dict[str, Any], List[Dict[str, Any]]]
+
+_STOP = object()
+
+def _resolve(future: Future, result: Any = None, exception: Exception = None):
+    """Futureに結果を設定（待機側がキャンセル済み・解決済みの場合は何もしない）"""
+    if future.done():
+        return
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+def _count_mismatch(entries: list, trd_ids: List[int]) -> Optional[Exception]:
+    """登録した注文数と返された trd_id の数が一致しない場合のエラー"""
+    if len(trd_ids) == len(entries):
+        return None
+    return RuntimeError(f"登録した注文数（{len(entries)}件）と trd_id の数（{len(trd_ids)}件）が一致しません")
+
+class GroupCommitWriter:
+    """注文をキューに溜め、まとめて1トランザクションで登録するライター（グループコミット）"""
+
+    def __init__(
+        self,
+        flush_fn: Callable[[List[OrderEntry]], List[int]] = None,
+        batch_size: int = 50,
+        interval_ms: float = 10.0
+    ):
+        """
+        Args:
+            flush_fn: 注文のリストを1トランザクションで登録し、trd_id のリストを返す関数
+            batch_size: 1回の登録でまとめる最大注文数
+            interval_ms: 最初の注文を受け取ってから登録するまでの最大待ち時間（ミリ秒）
+        """
+        self.flush_fn = flush_fn
+        self.batch_size = batch_size
+        self.interval_ms = interval_ms
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: threading.Thread = None
+        self.batches = 0
+        self.orders = 0
+        self.max_batch = 0
+        self.fallbacks = 0
+        self.failures = 0
+        self.cancelled = 0
+        self.errors = 0
+
+    def configure(self, flush_fn: Callable = None, batch_size: int = None, interval_ms: float = None):
+        """登録関数・バッチサイズ・待ち時間を設定"""
+        if flush_fn is not None:
+            self.flush_fn = flush_fn
+        if batch_size is not None:
+            self.batch_size = batch_size
+        if interval_ms is not None:
+            self.interval_ms = interval_ms
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """バックグラウンドの書き込みスレッドを開始"""
+        if self.running:
+            return
+        self._thread = threading.Thread(target=self._run, name="order-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """キューに残っている注文を登録してから書き込みスレッドを停止"""
+        if not self.running:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, order_data: Dict[str, Any], order_details_data: List[Dict[str, Any]]) -> Future:
+        """
+        注文をキューに追加する
+
+        Returns:
+            バッチのコミット後に trd_id が設定される Future
+        """
+        if not self.running:
+            raise RuntimeError("注文ライターが起動していません")
+        future = Future()
+        self._queue.put((order_data, order_details_data, future))
+        return future
+
+    def write(self, order_data: Dict[str, Any], order_details_data: List[Dict[str, Any]], timeout: float = ORDER_WRITE_TIMEOUT_SECONDS) -> int:
+        """
+        注文をキューに追加し、バッチのコミットを待って trd_id を返す（同期版）
+
+        Raises:
+            TimeoutError: timeout 秒以内にコミットされなかった場合（未登録の注文は取り消す）
+        """
+        future = self.submit(order_data, order_details_data)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    async def write_async(self, order_data: Dict[str, Any], order_details_data: List[Dict[str, Any]], timeout: float = ORDER_WRITE_TIMEOUT_SECONDS) -> int:
+        """
+        注文をキューに追加し、バッチのコミットを待って trd_id を返す（非同期版）
+
+        Raises:
+            TimeoutError: timeout 秒以内にコミットされなかった場合（未登録の注文は取り消す）
+        """
+        future = self.submit(order_data, order_details_data)
+        # タイムアウト・切断で待機をやめると Future もキャンセルされ、未登録ならライターが読み飛ばす
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            entry = self._queue.get()
+            if entry is _STOP:
+                break
+            batch = [entry]
+            deadline = time.monotonic() + self.interval_ms / 1000
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            self._flush_safely(batch)
+
+        # 停止要求後に残っている注文も登録する
+        remaining_entries = []
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is not _STOP:
+                remaining_entries.append(entry)
+        for start in range(0, len(remaining_entries), self.batch_size):
+            self._flush_safely(remaining_entries[start:start + self.batch_size])
+
+    def _flush_safely(self, batch: list):
+        """バッチを登録する（予期しないエラーでも書き込みスレッドを止めず、待機中の注文をエラーにする）"""
+        try:
+            self._flush(batch)
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ 注文ライターでエラーが発生しました: {e}")
+            for _, _, future in batch:
+                _resolve(future, exception=e)
+
+    def _flush(self, batch: list):
+        # 待機をやめた（キャンセルされた）注文は登録せず、残りは以降キャンセルできないようにする
+        claimed = [entry for entry in batch if entry[2].set_running_or_notify_cancel()]
+        self.cancelled += len(batch) - len(claimed)
+        if claimed:
+            self._write(claimed)
+
+    def _write(self, batch: list):
+        try:
+            trd_ids = self.flush_fn([(order, details) for order, details, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                self.failures += 1
+                _resolve(batch[0][2], exception=e)
+                return
+            # バッチ全体が失敗した場合は1件ずつ登録し、不正な注文だけをエラーにする
+            self.fallbacks += 1
+            for entry in batch:
+                self._write([entry])
+            return
+
+        # 件数が合わない場合はどの注文の trd_id か判断できないため、バッチ全体をエラーにする
+        mismatch = _count_mismatch(batch, trd_ids)
+        if mismatch is not None:
+            self.failures += len(batch)
+            for _, _, future in batch:
+                _resolve(future, exception=mismatch)
+            return
+
+        self.batches += 1
+        self.orders += len(batch)
+        self.max_batch = max(self.max_batch, len(batch))
+        for (_, _, future), trd_id in zip(batch, trd_ids):
+            _resolve(future, result=trd_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """グループコミットの統計を取得"""
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize(),
+            "batches": self.batches,
+            "orders": self.orders,
+            "avg_batch": self.orders / self.batches if self.batches else 0.0,
+            "max_batch": self.max_batch,
+            "fallbacks": self.fallbacks,
+            "failures": self.failures,
+            "cancelled": self.cancelled,
+            "errors": self.errors,
+        }
+
+def write_orders_in_chunks(
+    entries: List[OrderEntry],
+    flush_fn: Callable[[List[OrderEntry]], List[Any]],
+    chunk_size: int = 500
+) -> List[Union[Any, Exception]]:
+    """
+    注文をチャンク単位でまとめて登録する（オフライン取引の一括登録用）
+
+    Returns:
+        entries と同じ順の flush_fn の結果（(trd_id, 今回登録したか) など）、または登録に失敗した場合の例外
+    """
+    results: List[Union[Any, Exception]] = []
+    for start in range(0, len(entries), chunk_size):
+        chunk = entries[start:start + chunk_size]
+        try:
+            trd_ids = flush_fn(chunk)
+        except Exception:
+            # チャンク全体が失敗した場合は1件ずつ登録し、不正な取引だけをエラーにする
+            for entry in chunk:
+                try:
+                    trd_ids = flush_fn([entry])
+                except Exception as e:
+                    results.append(e)
+                    continue
+                mismatch = _count_mismatch([entry], trd_ids)
+                results.append(mismatch if mismatch is not None else trd_ids[0])
+            continue
+        # 件数が合わない場合はどの取引の trd_id か判断できないため、チャンク全体をエラーにする
+        mismatch = _count_mismatch(chunk, trd_ids)
+        results.extend([mismatch] * len(chunk) if mismatch is not None else trd_ids)
+    return results
+
+# グローバルインスタンス
+order_writer = GroupCommitWriter(
+    batch_size=int(os.getenv("ORDER_BATCH_SIZE", "50")),
+    interval_ms=float(os.getenv("ORDER_BATCH_INTERVAL_MS", "10"))
+)
+
+def get_order_writer() -> GroupCommitWriter:
+    """注文ライターを取得"""
+    return order_writer
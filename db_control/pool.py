@@ -0,0 +1,105 @@
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool, NullPool
+from typing import Dict, Any
+import os
+import threading
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+
+# .env の読み込み
+base_path = Path(__file__).resolve().parent.parent
+env_path = base_path / '.env'
+load_dotenv(dotenv_path=env_path)
+
+# 接続プールの方式（queue: SQLAlchemyのQueuePool / pgbouncer: プールをpgbouncerに任せる）
+DB_POOL_MODE = os.getenv("DB_POOL_MODE", "queue").lower()
+USE_PGBOUNCER = DB_POOL_MODE == "pgbouncer"
+
+class PoolCheckoutStats:
+    """接続プールのチェックアウト待ち時間・タイムアウトの統計"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def record(self, wait_ms: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": self.total_wait_ms / self.checkouts if self.checkouts else 0.0,
+                "max_wait_ms": self.max_wait_ms,
+            }
+
+class _CheckoutTimingMixin:
+    """プールから接続を取り出すまでの待ち時間を計測する"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkout_stats = PoolCheckoutStats()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.checkout_stats = self.checkout_stats
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.checkout_stats.record((time.perf_counter() - start) * 1000, timed_out=True)
+            raise
+        self.checkout_stats.record((time.perf_counter() - start) * 1000)
+        return connection
+
+class InstrumentedQueuePool(_CheckoutTimingMixin, QueuePool):
+    """チェックアウト待ち時間を計測するQueuePool"""
+
+class InstrumentedAsyncQueuePool(_CheckoutTimingMixin, AsyncAdaptedQueuePool):
+    """チェックアウト待ち時間を計測するAsyncAdaptedQueuePool"""
+
+def pool_options(async_engine: bool = False) -> Dict[str, Any]:
+    """環境変数から create_engine / create_async_engine の接続プール設定を作成"""
+    pre_ping = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    if USE_PGBOUNCER:
+        # pgbouncer（トランザクションプーリング）では接続をプロセス内に保持しない
+        return {"poolclass": NullPool, "pool_pre_ping": pre_ping}
+    return {
+        "poolclass": InstrumentedAsyncQueuePool if async_engine else InstrumentedQueuePool,
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "3600")),
+        "pool_pre_ping": pre_ping,
+    }
+
+def pool_status(engine) -> Dict[str, Any]:
+    """エンジンの接続プールの状態（使用中・オーバーフロー・待ち時間）を取得"""
+    pool = engine.pool
+    status: Dict[str, Any] = {"pid": os.getpid(), "mode": DB_POOL_MODE, "pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "max_overflow": pool._max_overflow,
+            "timeout": pool.timeout(),
+        })
+    checkout_stats = getattr(pool, "checkout_stats", None)
+    if checkout_stats is not None:
+        status.update(checkout_stats.snapshot())
+    return status
@@ -0,0 +1,227 @@
+from typing import Callable, Dict, Any, Optional, List
+import threading
+import time
+
+class ProductCatalogIndex:
+    """JANコードをキーにしたプロセス内の商品カタログインデックス"""
+
+    def __init__(
+        self,
+        loader: Callable[[], List[Dict[str, Any]]] = None,
+        fallback: Callable[[str], Optional[Dict[str, Any]]] = None,
+        bulk_fallback: Callable[[List[str]], List[Dict[str, Any]]] = None,
+        max_age: float = 300.0
+    ):
+        """
+        Args:
+            loader: 全商品を取得する関数（起動時・再読込時に使用）
+            fallback: インデックスに無いコードを1件取得する関数
+            bulk_fallback: インデックスに無い複数コードを1回で取得する関数
+            max_age: この秒数を超えるとインデックスを古いとみなす
+        """
+        self.loader = loader
+        self.fallback = fallback
+        self.bulk_fallback = bulk_fallback
+        self.max_age = max_age
+        self._by_code: Dict[str, Dict[str, Any]] = {}
+        self._code_by_id: Dict[int, str] = {}
+        self._lock = threading.RLock()
+        self._refreshing = False
+        self.loaded_at: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+        self.fallback_hits = 0
+        self.stale_hits = 0
+        self.reloads = 0
+        self.patches = 0
+        self.invalidations = 0
+
+    def configure(
+        self,
+        loader: Callable = None,
+        fallback: Callable = None,
+        bulk_fallback: Callable = None,
+        max_age: float = None
+    ):
+        """ローダー・フォールバック関数を設定"""
+        if loader is not None:
+            self.loader = loader
+        if fallback is not None:
+            self.fallback = fallback
+        if bulk_fallback is not None:
+            self.bulk_fallback = bulk_fallback
+        if max_age is not None:
+            self.max_age = max_age
+
+    def load(self) -> int:
+        """ローダーで全商品を読み込み、インデックスを作り直す"""
+        if self.loader is None:
+            return 0
+        products = self.loader()
+        by_code = {}
+        code_by_id = {}
+        for product in products:
+            product = dict(product)
+            by_code[product['code']] = product
+            code_by_id[product['prd_id']] = product['code']
+        with self._lock:
+            self._by_code = by_code
+            self._code_by_id = code_by_id
+            self.loaded_at = time.monotonic()
+            self.reloads += 1
+        return len(by_code)
+
+    def is_stale(self) -> bool:
+        """インデックスが max_age を超えて古くなっているか"""
+        if self.loaded_at is None:
+            return True
+        return time.monotonic() - self.loaded_at > self.max_age
+
+    def refresh_in_background(self):
+        """古くなったインデックスをバックグラウンドで再読込（スキャン処理は待たせない）"""
+        with self._lock:
+            if self._refreshing or self.loader is None:
+                return
+            self._refreshing = True
+
+        def _refresh():
+            try:
+                self.load()
+            except Exception as e:
+                print(f"❌ 商品カタログの再読込に失敗しました: {e}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=_refresh, daemon=True).start()
+
+    def get_cached(self, code: str) -> Optional[Dict[str, Any]]:
+        """インデックスのみから商品を取得（フォールバックしない）"""
+        with self._lock:
+            product = self._by_code.get(code)
+            if product is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if self.is_stale():
+                self.stale_hits += 1
+                self.refresh_in_background()
+            return product
+
+    def get(self, code: str) -> Optional[Dict[str, Any]]:
+        """商品コードで商品を取得（インデックスに無ければフォールバックで1件取得）"""
+        product = self.get_cached(code)
+        if product is not None:
+            return product
+
+        if self.fallback is None:
+            return None
+        product = self.fallback(code)
+        if product is not None:
+            self.fallback_hits += 1
+            self.upsert(product)
+        return product
+
+    def get_many(self, codes: List[str], use_fallback: bool = True) -> Dict[str, Dict[str, Any]]:
+        """複数の商品コードで商品を取得（インデックスに無いコードはまとめて1回で取得）"""
+        found: Dict[str, Dict[str, Any]] = {}
+        missing: List[str] = []
+        seen = set()
+        with self._lock:
+            stale = self.is_stale()
+            for code in codes:
+                if code in seen:
+                    continue
+                seen.add(code)
+                product = self._by_code.get(code)
+                if product is not None:
+                    self.hits += 1
+                    found[code] = product
+                else:
+                    self.misses += 1
+                    missing.append(code)
+            if stale and found:
+                self.stale_hits += len(found)
+        if stale and found:
+            self.refresh_in_background()
+
+        if missing and use_fallback and self.bulk_fallback is not None:
+            for product in self.bulk_fallback(missing):
+                self.fallback_hits += 1
+                self.upsert(product)
+                found[product['code']] = dict(product)
+        return found
+
+    def upsert(self, product: Dict[str, Any]):
+        """商品をインデックスに追加・更新"""
+        product = dict(product)
+        with self._lock:
+            old_code = self._code_by_id.get(product['prd_id'])
+            if old_code is not None and old_code != product['code']:
+                self._by_code.pop(old_code, None)
+            self._by_code[product['code']] = product
+            self._code_by_id[product['prd_id']] = product['code']
+            self.patches += 1
+
+    def remove(self, prd_id: int = None, code: str = None):
+        """商品をインデックスから削除"""
+        with self._lock:
+            if code is None and prd_id is not None:
+                code = self._code_by_id.get(prd_id)
+            if code is None:
+                return
+            product = self._by_code.pop(code, None)
+            if product is not None:
+                self._code_by_id.pop(product['prd_id'], None)
+            self.invalidations += 1
+
+    def apply_change(self, payload: Dict[str, Any]):
+        """productsテーブルのリアルタイムイベントをインデックスに反映"""
+        event_type = payload.get('eventType') or payload.get('type')
+        record = payload.get('record') or payload.get('new') or {}
+        old_record = payload.get('old_record') or payload.get('old') or {}
+
+        if event_type in ('INSERT', 'UPDATE') and 'code' in record and 'prd_id' in record:
+            self.upsert(record)
+        elif event_type == 'DELETE':
+            self.remove(prd_id=old_record.get('prd_id'), code=old_record.get('code'))
+        elif event_type == 'RESYNC':
+            # 取りこぼした変更が分からないため、全件を読み直す（ローダーが無い場合は空にしてフォールバックさせる）
+            if self.loader is not None:
+                self.load()
+            else:
+                self.clear()
+        else:
+            # 不完全なペイロードの場合は該当エントリを無効化して次回フォールバックさせる
+            self.remove(prd_id=record.get('prd_id') or old_record.get('prd_id'))
+
+    def clear(self):
+        """インデックスを空にする"""
+        with self._lock:
+            self._by_code = {}
+            self._code_by_id = {}
+            self.loaded_at = None
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット・ミス・鮮度の統計を取得"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._by_code),
+                "hits": self.hits,
+                "misses": self.misses,
+                "fallback_hits": self.fallback_hits,
+                "stale_hits": self.stale_hits,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "reloads": self.reloads,
+                "patches": self.patches,
+                "invalidations": self.invalidations,
+                "age_seconds": None if self.loaded_at is None else time.monotonic() - self.loaded_at,
+                "is_stale": self.is_stale(),
+            }
+
+# グローバルインスタンス
+product_catalog = ProductCatalogIndex()
+
+def get_product_catalog() -> ProductCatalogIndex:
+    """商品カタログインデックスを取得"""
+    return product_catalog
@@ -0,0 +1,191 @@
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from contextvars import ContextVar
+from collections import OrderedDict, deque
+from typing import Dict, Any, Optional
+from .metrics import record_round_trip
+import os
+import random
+import re
+import threading
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+
+# .env の読み込み
+base_path = Path(__file__).resolve().parent.parent
+env_path = base_path / '.env'
+load_dotenv(dotenv_path=env_path)
+
+# 遅いクエリとみなす閾値（ミリ秒）と、SQL全文を記録するサンプリング率（0.0〜1.0）
+SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "200"))
+ECHO_SAMPLE_RATE = float(os.getenv("SQL_ECHO_SAMPLE_RATE", "0"))
+# 遅いクエリ・サンプルSQLにパラメータを記録するか（メールアドレスやパスワードのハッシュを含むため既定では記録しない）
+CAPTURE_PARAMETERS = os.getenv("SQL_CAPTURE_PARAMETERS", "false").lower() == "true"
+# 集計するクエリの種類の上限（超えた場合は最も長く実行されていないクエリから捨てる）
+MAX_STATEMENTS = int(os.getenv("SQL_STATS_MAX_STATEMENTS", "500"))
+
+# プレースホルダ（psycopg2: %(name)s、asyncpg: $1）だけを並べた括弧（IN のリスト・VALUES の1行）
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:%\(\w+\)s|\$\d+)(?:\s*,\s*(?:%\(\w+\)s|\$\d+))*\s*\)")
+# 複数行の VALUES
+_REPEATED_ROWS = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+
+def normalize_statement(statement: str) -> str:
+    """IN のリスト・複数行の VALUES の長さが違うだけのクエリを同じクエリとして集計するための正規化"""
+    return _REPEATED_ROWS.sub("(...), ...", _PLACEHOLDER_LIST.sub("(...)", statement))
+
+class RequestQueryCounter:
+    """1リクエスト内で実行されたクエリ数と合計時間"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+
+_current_request: ContextVar[Optional[RequestQueryCounter]] = ContextVar("current_request_queries", default=None)
+
+class QueryStats:
+    """SQLAlchemyのカーソル実行イベントからクエリの統計を集計するクラス"""
+
+    def __init__(
+        self,
+        slow_query_ms: float = SLOW_QUERY_MS,
+        echo_sample_rate: float = ECHO_SAMPLE_RATE,
+        history_size: int = 100,
+        max_statements: int = MAX_STATEMENTS,
+        capture_parameters: bool = CAPTURE_PARAMETERS
+    ):
+        """
+        Args:
+            slow_query_ms: この時間（ミリ秒）を超えたクエリを遅いクエリとして記録
+            echo_sample_rate: SQL全文を記録する割合
+            history_size: 遅いクエリ・サンプルSQLを保持する最大件数
+            max_statements: 集計するクエリの種類の上限
+            capture_parameters: 遅いクエリ・サンプルSQLにパラメータを記録するか
+        """
+        self.slow_query_ms = slow_query_ms
+        self.echo_sample_rate = echo_sample_rate
+        self.max_statements = max_statements
+        self.capture_parameters = capture_parameters
+        self._lock = threading.Lock()
+        self._statements: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._routes: Dict[str, Dict[str, Any]] = {}
+        self.slow_queries = deque(maxlen=history_size)
+        self.sampled_queries = deque(maxlen=history_size)
+        self.total_queries = 0
+        self.evicted_statements = 0
+
+    def instrument(self, engine: Engine):
+        """エンジンにカーソル実行イベントを登録"""
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info["query_start_time"].pop()) * 1000
+        self.record(statement, elapsed_ms, parameters)
+
+    def record(self, statement: str, elapsed_ms: float, parameters: Any = None):
+        """クエリ1件の実行時間を記録"""
+        record_round_trip("db")
+        request = _current_request.get()
+        if request is not None:
+            request.count += 1
+            request.total_ms += elapsed_ms
+
+        normalized = normalize_statement(statement)
+        parameters = repr(parameters) if self.capture_parameters else None
+        with self._lock:
+            self.total_queries += 1
+            stats = self._statements.get(normalized)
+            if stats is None:
+                stats = self._statements[normalized] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0}
+                while len(self._statements) > self.max_statements:
+                    self._statements.popitem(last=False)
+                    self.evicted_statements += 1
+            else:
+                self._statements.move_to_end(normalized)
+            stats["count"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+            if elapsed_ms >= self.slow_query_ms:
+                self.slow_queries.append({
+                    "statement": statement,
+                    "parameters": parameters,
+                    "elapsed_ms": elapsed_ms,
+                    "at": time.time()
+                })
+            if self.echo_sample_rate > 0 and random.random() < self.echo_sample_rate:
+                self.sampled_queries.append({
+                    "statement": statement,
+                    "parameters": parameters,
+                    "elapsed_ms": elapsed_ms,
+                    "at": time.time()
+                })
+
+    def begin_request(self):
+        """リクエスト単位のクエリ数の計測を開始（end_request に渡すトークンを返す）"""
+        return _current_request.set(RequestQueryCounter())
+
+    def end_request(self, token, route: str) -> RequestQueryCounter:
+        """リクエスト単位のクエリ数の計測を終了し、ルートごとに集計"""
+        request = _current_request.get()
+        _current_request.reset(token)
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = {"requests": 0, "queries": 0, "max_queries": 0, "query_ms": 0.0}
+            stats["requests"] += 1
+            stats["queries"] += request.count
+            stats["max_queries"] = max(stats["max_queries"], request.count)
+            stats["query_ms"] += request.total_ms
+        return request
+
+    def current_request(self) -> Optional[RequestQueryCounter]:
+        """実行中のリクエストのクエリ数を取得"""
+        return _current_request.get()
+
+    def snapshot(self, top: int = 20) -> Dict[str, Any]:
+        """統計を取得（合計時間の長い順に上位 top 件のクエリ）"""
+        with self._lock:
+            statements = sorted(self._statements.items(), key=lambda kv: kv[1]["total_ms"], reverse=True)[:top]
+            return {
+                "total_queries": self.total_queries,
+                "tracked_statements": len(self._statements),
+                "evicted_statements": self.evicted_statements,
+                "statements": [
+                    {
+                        "statement": statement,
+                        "count": stats["count"],
+                        "total_ms": stats["total_ms"],
+                        "avg_ms": stats["total_ms"] / stats["count"],
+                        "max_ms": stats["max_ms"]
+                    }
+                    for statement, stats in statements
+                ],
+                "routes": {
+                    route: dict(stats, avg_queries=stats["queries"] / stats["requests"])
+                    for route, stats in self._routes.items()
+                },
+                "slow_queries": list(self.slow_queries),
+                "sampled_queries": list(self.sampled_queries),
+            }
+
+    def reset(self):
+        """統計をリセット"""
+        with self._lock:
+            self._statements = OrderedDict()
+            self._routes = {}
+            self.slow_queries.clear()
+            self.sampled_queries.clear()
+            self.total_queries = 0
+            self.evicted_statements = 0
+
+# グローバルインスタンス
+query_stats = QueryStats()
+
+def get_query_stats() -> QueryStats:
+    """クエリ統計を取得"""
+    return query_stats
@@ -0,0 +1,385 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Optional
+from .metrics import Counter, Gauge, Histogram, register_metric
+import asyncio
+import os
+import threading
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+
+# .env の読み込み
+base_path = Path(__file__).resolve().parent.parent
+env_path = base_path / '.env'
+load_dotenv(dotenv_path=env_path)
+
+# コールバックを実行するスレッド数
+REALTIME_DISPATCH_WORKERS = int(os.getenv("REALTIME_DISPATCH_WORKERS", "4"))
+# テーブルごとのキューの上限（超えた場合は古いイベントを捨て、捨てた分は取り直し処理で補う）
+REALTIME_QUEUE_SIZE = int(os.getenv("REALTIME_QUEUE_SIZE", "1000"))
+# 同じ行へのUPDATEをまとめる時間（秒、0でまとめない）
+REALTIME_COALESCE_WINDOW = float(os.getenv("REALTIME_COALESCE_WINDOW", "0.2"))
+
+# UPDATEをまとめる単位となるテーブルごとの主キー
+PRIMARY_KEYS = {
+    "orders": "trd_id",
+    "order_details": "dtl_id",
+    "products": "prd_id",
+    "customers": "cust_id",
+    "employees": "enp_cd",
+    "coupons": "coupon_id",
+}
+
+REALTIME_EVENTS = register_metric(Counter(
+    "realtime_events_total",
+    "Realtime events by table and result (enqueued, coalesced, dropped, resync, dispatched, failed, catch_up).",
+    ("table", "result")
+))
+REALTIME_QUEUE_DEPTH = register_metric(Gauge(
+    "realtime_dispatch_queue_depth",
+    "Realtime events waiting for their callbacks by table.",
+    ("table",)
+))
+REALTIME_DISPATCH_LAG = register_metric(Histogram(
+    "realtime_dispatch_lag_seconds",
+    "Time from receiving a realtime event to running its callbacks.",
+    ("table",)
+))
+
+class _QueuedEvent:
+    """キューで待っている1イベント（UPDATEをまとめる場合は payload を差し替える）"""
+
+    __slots__ = ("key", "payload", "received_at", "call")
+
+    def __init__(self, key: Any, payload: Dict[str, Any], received_at: float, call: Callable = None):
+        self.key = key
+        self.payload = payload
+        self.received_at = received_at
+        # 取りこぼしの補完処理（イベントの代わりに実行する）
+        self.call = call
+
+class _TableQueue:
+    """1テーブル分のキューと統計"""
+
+    def __init__(self, max_queue: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        # 主キー → まだコールバックを実行していないUPDATE
+        self.pending_updates: Dict[Any, _QueuedEvent] = {}
+        self.task: Optional[asyncio.Task] = None
+        # キューで待っている補完処理があるか
+        self.catch_up_pending = False
+        self.catch_ups = 0
+        self.received = 0
+        self.coalesced = 0
+        self.dropped = 0
+        # 捨てたイベントの代わりに入れた取り直し処理の件数
+        self.resyncs = 0
+        self.dispatched = 0
+        self.failed = 0
+        self.max_queued = 0
+        self.max_lag = 0.0
+        self.handler_seconds = 0.0
+
+class RealtimeDispatcher:
+    """
+    リアルタイムイベントを受信処理から切り離してコールバックに配るパイプライン
+
+    受信したイベントはテーブルごとのasyncioキューに入れるだけで戻り、
+    テーブルごとのタスクがスレッドプールでコールバックを実行する。
+    同じテーブルのイベントは受信順に処理し、遅いコールバックは他のテーブルの配信を止めない。
+    キューで待っている間に同じ行へのUPDATEが届いた場合は、最新の内容の1イベントにまとめる。
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[str, Dict[str, Any]], None] = None,
+        workers: int = REALTIME_DISPATCH_WORKERS,
+        max_queue: int = REALTIME_QUEUE_SIZE,
+        coalesce_window: float = REALTIME_COALESCE_WINDOW,
+        on_overflow: Callable[[str], Optional[Callable[[], Any]]] = None
+    ):
+        """
+        Args:
+            handler: handler(テーブル名, ペイロード) の形でコールバックを実行する関数
+            workers: コールバックを実行するスレッド数
+            max_queue: テーブルごとのキューの上限
+            coalesce_window: 同じ行へのUPDATEをまとめる時間（秒）
+            on_overflow: on_overflow(テーブル名) の形で、キューが溢れてイベントを捨てた時に
+                捨てた分を取り直す処理を返す関数（補完・キャッシュの全件無効化など）
+        """
+        self.handler = handler
+        self.on_overflow = on_overflow
+        self.workers = workers
+        self.max_queue = max_queue
+        self.coalesce_window = coalesce_window
+        self._tables: Dict[str, _TableQueue] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    def configure(
+        self,
+        handler: Callable = None,
+        workers: int = None,
+        max_queue: int = None,
+        coalesce_window: float = None,
+        on_overflow: Callable = None
+    ):
+        """コールバック・スレッド数・キューの上限・溢れた時の取り直し処理を設定（開始前に呼び出す）"""
+        if handler is not None:
+            self.handler = handler
+        if on_overflow is not None:
+            self.on_overflow = on_overflow
+        if workers is not None:
+            self.workers = workers
+        if max_queue is not None:
+            self.max_queue = max_queue
+        if coalesce_window is not None:
+            self.coalesce_window = coalesce_window
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        """配信用のイベントループをバックグラウンドスレッドで開始"""
+        with self._lock:
+            if self._loop is not None:
+                return self._loop
+            loop = asyncio.new_event_loop()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                try:
+                    loop.run_forever()
+                finally:
+                    loop.close()
+
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="realtime-handler")
+            self._thread = threading.Thread(target=run, name="realtime-dispatch", daemon=True)
+            self._thread.start()
+            self._loop = loop
+            return loop
+
+    def stop(self, timeout: float = 5.0):
+        """キューに残っているイベントを処理してから停止（timeout 秒を超えた分は破棄）"""
+        with self._lock:
+            loop, thread, executor = self._loop, self._thread, self._executor
+            self._loop = self._thread = self._executor = None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._drain(timeout), loop).result(timeout + 1)
+        except Exception as e:
+            print(f"❌ リアルタイムイベントの処理を待てませんでした: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _drain(self, timeout: float):
+        tables = list(self._tables.values())
+        try:
+            await asyncio.wait_for(asyncio.gather(*(state.queue.join() for state in tables)), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for state in tables:
+            state.task.cancel()
+        await asyncio.gather(*(state.task for state in tables), return_exceptions=True)
+        self._tables = {}
+
+    def submit(self, table: str, payload: Dict[str, Any]):
+        """
+        イベントをキューに入れる（受信スレッドから呼び出し、コールバックの完了は待たない）
+
+        Args:
+            table: テーブル名
+            payload: リアルタイムイベントのペイロード
+        """
+        loop = self._loop or self.start()
+        loop.call_soon_threadsafe(self._enqueue, table, payload, time.monotonic())
+
+    def submit_catch_up(self, table: str, func: Callable[[], Any]):
+        """
+        取りこぼしの補完処理をイベントと同じキューに入れる（受信スレッドから呼び出す）
+
+        補完処理はそれまでに届いたイベントの後、以降に届いたイベントの前に実行する。
+        実行を待っている間にキューが溢れた場合は新しいイベントを捨てる（補完処理の取得に含まれるため）。
+        補完処理は on_overflow で取り直しを求められたテーブルでは取り直しを行うこと。
+
+        Args:
+            table: テーブル名
+            func: 補完処理（ワーカーのスレッドで実行する）
+        """
+        loop = self._loop or self.start()
+        loop.call_soon_threadsafe(self._enqueue_catch_up, table, func, time.monotonic())
+
+    def _table_state(self, table: str) -> _TableQueue:
+        state = self._tables.get(table)
+        if state is None:
+            state = self._tables[table] = _TableQueue(self.max_queue)
+            state.task = asyncio.get_running_loop().create_task(self._consume(table, state))
+        return state
+
+    def _enqueue_catch_up(self, table: str, func: Callable[[], Any], received_at: float):
+        state = self._table_state(table)
+        if state.catch_up_pending:
+            # 待っている補完処理がこの分も取得する
+            return
+        if state.queue.full():
+            # 捨てたイベントは、これから入れる補完処理が取り直す
+            self._drop_oldest(table, state)
+        state.queue.put_nowait(_QueuedEvent(None, None, received_at, func))
+        state.catch_up_pending = True
+        # 補完処理より前のUPDATEには以降のUPDATEをまとめない
+        state.pending_updates.clear()
+        REALTIME_QUEUE_DEPTH.inc(table=table)
+
+    def _enqueue(self, table: str, payload: Dict[str, Any], received_at: float):
+        state = self._table_state(table)
+        state.received += 1
+
+        event_type = payload.get('eventType') or payload.get('type')
+        key = self._primary_key(table, payload)
+        if key is not None:
+            pending = state.pending_updates.get(key)
+            if (
+                event_type == 'UPDATE' and pending is not None
+                and received_at - pending.received_at <= self.coalesce_window
+            ):
+                pending.payload = self._merge(pending.payload, payload)
+                state.coalesced += 1
+                REALTIME_EVENTS.inc(table=table, result="coalesced")
+                return
+            # INSERT・DELETE の後のUPDATEはまとめない
+            state.pending_updates.pop(key, None)
+
+        queued = _QueuedEvent(key, payload, received_at)
+        if state.queue.full():
+            if state.catch_up_pending:
+                # 待っている補完処理が取得するため、新しいイベントを捨てる
+                self._count_dropped(table, state)
+                return
+            resync = self._drop_oldest(table, state)
+        else:
+            resync = None
+        state.queue.put_nowait(queued)
+        if resync is not None:
+            # 捨てたイベントは取り直し処理で補う（以降に溢れた分もこの処理の取得に含まれる）
+            state.resyncs += 1
+            REALTIME_EVENTS.inc(table=table, result="resync")
+            self._enqueue_catch_up(table, resync, received_at)
+        if event_type == 'UPDATE' and key is not None and self.coalesce_window > 0:
+            state.pending_updates[key] = queued
+        state.max_queued = max(state.max_queued, state.queue.qsize())
+        REALTIME_EVENTS.inc(table=table, result="enqueued")
+        REALTIME_QUEUE_DEPTH.inc(table=table)
+
+    def _drop_oldest(self, table: str, state: _TableQueue) -> Optional[Callable[[], Any]]:
+        dropped = state.queue.get_nowait()
+        state.queue.task_done()
+        if state.pending_updates.get(dropped.key) is dropped:
+            del state.pending_updates[dropped.key]
+        REALTIME_QUEUE_DEPTH.dec(table=table)
+        return self._count_dropped(table, state)
+
+    def _count_dropped(self, table: str, state: _TableQueue) -> Optional[Callable[[], Any]]:
+        """
+        捨てたイベントを数え、捨てた分を取り直す処理を返す
+
+        取り直しの要否は on_overflow 側で覚えておくため、待っている補完処理がある場合は
+        その補完処理が取り直し、戻り値はキューに入れなくてよい。
+        """
+        state.dropped += 1
+        REALTIME_EVENTS.inc(table=table, result="dropped")
+        if self.on_overflow is None:
+            if state.dropped == 1:
+                print(f"❌ {table}テーブルのイベントがキューの上限（{self.max_queue}件）を超えたため、古いイベントを破棄しました")
+            return None
+        if state.dropped == 1:
+            print(f"⚠️ {table}テーブルのイベントがキューの上限（{self.max_queue}件）を超えたため、破棄した分を取り直します")
+        try:
+            return self.on_overflow(table)
+        except Exception as e:
+            print(f"❌ {table}テーブルの取り直し処理を用意できませんでした: {e}")
+            return None
+
+    async def _consume(self, table: str, state: _TableQueue):
+        loop = asyncio.get_running_loop()
+        while True:
+            queued = await state.queue.get()
+            if state.pending_updates.get(queued.key) is queued:
+                # 実行を始めたイベントには以降のUPDATEをまとめない
+                del state.pending_updates[queued.key]
+            REALTIME_QUEUE_DEPTH.dec(table=table)
+            if queued.call is not None:
+                await self._run_catch_up(table, state, queued.call)
+                state.queue.task_done()
+                continue
+            lag = time.monotonic() - queued.received_at
+            state.max_lag = max(state.max_lag, lag)
+            REALTIME_DISPATCH_LAG.observe(lag, table=table)
+            started = time.monotonic()
+            try:
+                await loop.run_in_executor(self._executor, self.handler, table, queued.payload)
+                state.dispatched += 1
+                REALTIME_EVENTS.inc(table=table, result="dispatched")
+            except Exception as e:
+                state.failed += 1
+                REALTIME_EVENTS.inc(table=table, result="failed")
+                print(f"❌ {table}テーブルのイベント処理でエラーが発生しました: {e}")
+            finally:
+                state.handler_seconds += time.monotonic() - started
+                state.queue.task_done()
+
+    async def _run_catch_up(self, table: str, state: _TableQueue, func: Callable[[], Any]):
+        # 実行を始めた後に届いたイベントは補完処理の取得に含まれない可能性があるため、通常どおりキューに入れる
+        state.catch_up_pending = False
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, func)
+            state.catch_ups += 1
+            REALTIME_EVENTS.inc(table=table, result="catch_up")
+        except Exception as e:
+            state.failed += 1
+            REALTIME_EVENTS.inc(table=table, result="failed")
+            print(f"❌ {table}テーブルの取りこぼしの補完でエラーが発生しました: {e}")
+
+    @staticmethod
+    def _primary_key(table: str, payload: Dict[str, Any]) -> Any:
+        record = payload.get('record') or payload.get('new') or payload.get('old_record') or payload.get('old') or {}
+        # イベント・フィルタ付きの購読のキーは "テーブル名:イベント:フィルタ"
+        return record.get(PRIMARY_KEYS.get(table.split(":", 1)[0], "id"))
+
+    @staticmethod
+    def _merge(first: Dict[str, Any], latest: Dict[str, Any]) -> Dict[str, Any]:
+        """最新の内容に、最初のUPDATEの変更前の内容を引き継ぐ"""
+        merged = dict(latest)
+        for name in ('old_record', 'old'):
+            if first.get(name):
+                merged[name] = first[name]
+        return merged
+
+    def stats(self) -> Dict[str, Any]:
+        """テーブルごとの待ち件数・まとめた件数・破棄数・遅延の統計を取得"""
+        tables = {}
+        for table, state in list(self._tables.items()):
+            tables[table] = {
+                "queued": state.queue.qsize(),
+                "max_queued": state.max_queued,
+                "received": state.received,
+                "coalesced": state.coalesced,
+                "dropped": state.dropped,
+                "resyncs": state.resyncs,
+                "dispatched": state.dispatched,
+                "failed": state.failed,
+                "catch_ups": state.catch_ups,
+                "max_lag_ms": round(state.max_lag * 1000, 2),
+                "avg_handler_ms": round(state.handler_seconds * 1000 / state.dispatched, 2) if state.dispatched else 0.0,
+            }
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "coalesce_window": self.coalesce_window,
+            "tables": tables,
+        }
@@ -1,79 +1,643 @@
-from supabase import create_client, Client
-from typing import Callable, Dict, Any, Optional
+from typing import Callable, Dict, Any, Optional, List, Tuple, Iterable
+from concurrent.futures import Future
+from datetime import datetime
 import asyncio
 import json
 import os
+import threading
+import time
 from pathlib import Path
 from dotenv import load_dotenv
+from .supabase_client import get_supabase_client, get_async_supabase_client
+from .realtime_dispatch import RealtimeDispatcher, PRIMARY_KEYS
 
 # .env の読み込み
 base_path = Path(__file__).resolve().parent.parent
 env_path = base_path / '.env'
 load_dotenv(dotenv_path=env_path)
 
-# Supabase接続情報
-SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')  # バックエンド用
+# 再接続時に取りこぼしを補完するテーブル（テーブル → (位置の列, 補完するイベント, 削除を記録するテーブル)）
+# 位置の列は行を書き込んだトランザクションのID（products の version は migrations/009、それ以外は migrations/010）
+CATCH_UP_COLUMNS = {
+    "orders": ("xact_id", "INSERT", None),
+    "products": ("version", "UPDATE", "product_tombstones"),
+    "customers": ("xact_id", "UPDATE", None),
+}
+# 補完で1回に取得する最大件数（超えた場合は続きを取得する）
+CATCH_UP_PAGE_SIZE = int(os.getenv("REALTIME_CATCH_UP_PAGE_SIZE", "1000"))
+# 受信中に補完の起点を進めるため、完了済みのトランザクションの境界を取得する間隔（秒）
+CATCH_UP_MARK_REFRESH_SECONDS = float(os.getenv("REALTIME_CATCH_UP_MARK_REFRESH_SECONDS", "60"))
 
-# Supabaseクライアントの作成（service_role key使用）
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+# 購読の開始（チャンネルへの参加）を待つ最大秒数
+REALTIME_SUBSCRIBE_TIMEOUT_SECONDS = float(os.getenv("REALTIME_SUBSCRIBE_TIMEOUT_SECONDS", "10"))
+
+# チャンネルに参加できない状態がこの秒数続いた場合はチャンネルを作り直す
+# （realtime クライアントは再接続を max_retries 回で諦め、その後はチャンネルに戻らないため）
+REALTIME_REJOIN_AFTER_SECONDS = float(os.getenv("REALTIME_REJOIN_AFTER_SECONDS", "60"))
+
+# チャンネルの状態（購読の開始前・開始に失敗した状態を含む）
+JOINING = "JOINING"
+SUBSCRIBED = "SUBSCRIBED"
+FAILED = "FAILED"
+
+# リアルタイムのフィルタ（列=演算子.値）で使える演算子
+FILTER_OPERATORS = ("eq", "neq", "lt", "lte", "gt", "gte", "in")
+
+def parse_filter(filter: str) -> Tuple[str, str, str]:
+    """"store_cd=eq.A001" 形式のフィルタを (列, 演算子, 値) に分解（不正な場合は ValueError）"""
+    column, _, condition = filter.partition("=")
+    operator, _, value = condition.partition(".")
+    if not column.isidentifier() or operator not in FILTER_OPERATORS or not value:
+        raise ValueError(f"不正なフィルタです: {filter}")
+    return column, operator, value
+
+def match_filter(record: Dict[str, Any], filter: str) -> bool:
+    """レコードがフィルタの条件に合うか（サーバー側で絞り込めない場合に使う）"""
+    column, operator, value = parse_filter(filter)
+    actual = record.get(column)
+    if actual is None:
+        return False
+    if operator == "in":
+        return str(actual) in [item.strip().strip('"') for item in value.strip("()").split(",")]
+    if operator in ("eq", "neq"):
+        return (str(actual) == value) == (operator == "eq")
+    try:
+        actual, value = float(actual), float(value)
+    except (TypeError, ValueError):
+        actual = str(actual)
+    return {
+        "lt": actual < value,
+        "lte": actual <= value,
+        "gt": actual > value,
+        "gte": actual >= value,
+    }[operator]
+
+def subscription_key(table_name: str, event: str = "*", filter: str = None) -> str:
+    """購読のキー（イベント・フィルタを指定しない購読はテーブル名）"""
+    if event == "*" and not filter:
+        return table_name
+    return f"{table_name}:{event}:{filter or ''}"
+
+def normalize_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    postgres_changes のペイロードを eventType / record / old_record / commit_timestamp の形に変換
+
+    realtime 2.x の非同期クライアントは {"data": {"type", "record", "old_record", ...}, "ids": [...]} で渡す。
+    """
+    data = payload.get("data") if isinstance(payload, dict) else None
+    if not isinstance(data, dict):
+        return payload
+    event_type = data.get("type")
+    return {
+        "eventType": str(getattr(event_type, "value", event_type)),
+        "schema": data.get("schema"),
+        "table": data.get("table"),
+        "commit_timestamp": data.get("commit_timestamp"),
+        "record": data.get("record") or {},
+        "old_record": data.get("old_record") or {},
+    }
+
+def _parse_time(value: Any) -> Optional[datetime]:
+    """コミット時刻・境界の取得時刻の文字列を datetime に変換（変換できない場合は None）"""
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
 
 class SupabaseRealtimeManager:
-    """Supabaseリアルタイム機能を管理するクラス"""
+    """
+    Supabaseリアルタイム機能を管理するクラス
+    
+    同期クライアントはリアルタイムに対応していないため、非同期クライアントのチャンネルを
+    専用のイベントループ（バックグラウンドスレッド）で購読する。
+    購読の開始は待たずに戻り、起動時は wait_until_subscribed で全ての購読の開始を確認する。
+    """
     
     def __init__(self):
-        self.supabase = supabase
         self.channels = {}
         self.callbacks = {}
+        # 購読のキー → チャンネルの状態（JOINING / SUBSCRIBED / FAILED / CHANNEL_ERROR など）と最後のエラー
+        self.states: Dict[str, str] = {}
+        self.errors: Dict[str, str] = {}
+        self._settled: Dict[str, threading.Event] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._loop_lock = threading.Lock()
+        # リアルタイム用のイベントループ内でのみ使う
+        self._connect_lock: Optional[asyncio.Lock] = None
+        # 購読のキー → (テーブル名, イベント, フィルタ)
+        self.subscriptions: Dict[str, Tuple[str, str, Optional[str]]] = {}
+        # コールバックは受信処理とは別のスレッドで実行する
+        # キューが溢れてイベントを捨てた場合は、捨てた分を取り直す（_on_overflow）
+        self.dispatcher = RealtimeDispatcher(self._run_callbacks, on_overflow=self._on_overflow)
+        # 購読ごとの補完の起点（CATCH_UP_COLUMNS の列の値がこれより小さい変更は全て配り済み）
+        self.marks: Dict[str, int] = {}
+        # 次の起点の候補（境界, 境界を取得した時刻）。取得時刻より後にコミットされたイベントを配った時点で起点にする
+        self._pending_marks: Dict[str, Tuple[int, datetime]] = {}
+        self._mark_checked: Dict[str, float] = {}
+        # 起点以上の位置で配った変更（(主キー, 位置) → 補完で配ったか）。補完とライブのイベントで同じ変更を二重に配らない
+        self._delivered: Dict[str, Dict[Tuple[Any, Any], bool]] = {}
+        self._joined = set()
+        # 配信キューで捨てたイベントの取り直しを待っている購読（取り直すまで起点を進めない）
+        self._resyncing = set()
+        self._lock = threading.Lock()
+        self.catch_ups = 0
+        self.backfilled = 0
+        self.resyncs = 0
+        self.rejoins = 0
     
-    def subscribe_to_table(self, table_name: str, event: str = "*", callback: Callable = None):
+    @property
+    def supabase(self):
+        """共有のSupabaseクライアント（service_role key使用、初回利用時に作成）"""
+        return get_supabase_client()
+    
+    def subscribe_to_table(self, table_name: str, event: str = "*", callback: Callable = None, filter: str = None) -> Optional[str]:
         """
-        テーブルの変更を監視する
+        テーブルの変更を監視する（同じ条件の購読は1つのチャンネルを共有する）
+        
+        イベント・フィルタを指定した場合は専用のチャンネルを作り、条件をリアルタイムサーバーで適用する
+        （条件に合うイベントだけが届く）。フィルタは1列のみで、DELETE には適用されない（Supabaseの制約）。
+        チャンネルへの参加はリアルタイム用のイベントループで行い、完了は待たない（wait_until_subscribed で確認する）。
         
         Args:
             table_name: 監視するテーブル名
             event: 監視するイベント（INSERT, UPDATE, DELETE, *）
             callback: 変更時のコールバック関数
+            filter: 列のフィルタ（例: "store_cd=eq.A001"、演算子は FILTER_OPERATORS）
+        
+        Returns:
+            購読のキー（unsubscribe_from_table に渡す）
         """
-        try:
-            channel = self.supabase.channel(f"table-{table_name}")
-            
-            if event == "*":
-                channel = channel.on(
-                    "postgres_changes",
-                    event="*",
-                    schema="public",
-                    table=table_name,
-                    callback=callback or self._default_callback
-                )
-            else:
-                channel = channel.on(
-                    "postgres_changes",
-                    event=event,
-                    schema="public",
-                    table=table_name,
-                    callback=callback or self._default_callback
-                )
-            
-            channel.subscribe()
-            self.channels[table_name] = channel
-            self.callbacks[table_name] = callback
+        if filter:
+            parse_filter(filter)
+        key = subscription_key(table_name, event, filter)
+        if key in self.channels:
+            self.callbacks[key].append((event, callback or self._default_callback))
+            print(f"✅ {key} の監視にコールバックを追加しました（イベント: {event}）")
+            return key
+        
+        self.channels[key] = None
+        self.callbacks[key] = [(event, callback or self._default_callback)]
+        self.subscriptions[key] = (table_name, event, filter)
+        self._set_state(key, JOINING)
+        future = self._submit(self._join(key, table_name, event, filter))
+        future.add_done_callback(lambda done: self._on_join_done(key, done))
+        print(f"✅ {table_name}テーブルの監視を開始しました（イベント: {event}{'、フィルタ: ' + filter if filter else ''}）")
+        return key
+    
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """リアルタイム用のイベントループをバックグラウンドスレッドで開始（開始済みの場合はそのループ）"""
+        with self._loop_lock:
+            if self._loop is not None:
+                return self._loop
+            loop = asyncio.new_event_loop()
             
-            print(f"✅ {table_name}テーブルの監視を開始しました（イベント: {event}）")
+            def run():
+                asyncio.set_event_loop(loop)
+                try:
+                    loop.run_forever()
+                finally:
+                    loop.close()
             
+            self._thread = threading.Thread(target=run, name="supabase-realtime", daemon=True)
+            self._thread.start()
+            self._loop = loop
+            asyncio.run_coroutine_threadsafe(self._watch(), loop)
+            return loop
+    
+    def _submit(self, coro) -> Future:
+        """コルーチンをリアルタイム用のイベントループで実行（どのスレッドからでも呼び出せる）"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+    
+    async def _join(self, key: str, table_name: str, event: str, filter: Optional[str]):
+        """チャンネルを作成して postgres_changes を購読（リアルタイム用のイベントループで実行）"""
+        client = await get_async_supabase_client()
+        channel = client.channel(f"table-{key}")
+        # schema はサーバーが返す購読の条件と照合されるため省略しない
+        channel.on_postgres_changes(
+            event,
+            callback=lambda payload: self._dispatch(key, normalize_payload(payload)),
+            table=table_name,
+            schema="public",
+            filter=filter
+        )
+        if key not in self.channels:
+            # 参加前に購読が解除された
+            return
+        self.channels[key] = channel
+        # 未接続のまま複数のチャンネルが同時に参加すると WebSocket の接続が重複し、先の参加の応答を受け取れないため、接続は1回ずつ行う
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if not client.realtime.is_connected:
+                await client.realtime.connect()
+        await channel.subscribe(lambda status, err=None: self._on_subscribe_status(key, status, err))
+    
+    async def _watch(self):
+        """参加していないチャンネルを見張り、REALTIME_REJOIN_AFTER_SECONDS 続いた場合は作り直す"""
+        unjoined_since: Dict[str, float] = {}
+        while True:
+            await asyncio.sleep(REALTIME_REJOIN_AFTER_SECONDS / 3)
+            now = time.monotonic()
+            for key, channel in list(self.channels.items()):
+                if channel is None or channel.is_joined:
+                    unjoined_since.pop(key, None)
+                    continue
+                if now - unjoined_since.setdefault(key, now) >= REALTIME_REJOIN_AFTER_SECONDS:
+                    unjoined_since.pop(key, None)
+                    await self._rejoin(key, channel)
+            for key in list(unjoined_since):
+                if key not in self.channels:
+                    del unjoined_since[key]
+    
+    async def _rejoin(self, key: str, channel):
+        """
+        チャンネルを作り直して参加し直す
+        
+        参加できた時点の SUBSCRIBED で、切断中の取りこぼしを補完する（_on_subscribe_status）。
+        接続できなかった場合は FAILED にして、次の見張りで再び作り直す。
+        """
+        print(f"⚠️ {key} のチャンネルに参加できない状態が続いているため、作り直します")
+        # 切断済みのソケットでは退出を送れないため、クライアントから外すだけにする
+        channel.rejoin_timer.reset()
+        channel.socket.channels.pop(channel.topic, None)
+        table_name, event, filter = self.subscriptions[key]
+        self.rejoins += 1
+        self._set_state(key, JOINING)
+        try:
+            await self._join(key, table_name, event, filter)
         except Exception as e:
-            print(f"❌ {table_name}テーブルの監視開始に失敗しました: {e}")
+            self._set_state(key, FAILED, e)
+            print(f"❌ {key} のチャンネルを作り直せませんでした: {e}")
+    
+    def _on_join_done(self, key: str, future: Future):
+        """チャンネルの作成・参加要求に失敗した場合は購読を失敗の状態にする"""
+        error = future.exception() if not future.cancelled() else None
+        if error is not None:
+            self._set_state(key, FAILED, error)
+            print(f"❌ {key} の監視開始に失敗しました: {error}")
+    
+    def _set_state(self, key: str, state: str, err: Any = None):
+        """チャンネルの状態を記録（JOINING 以外になったら開始待ちを終える）"""
+        self.states[key] = state
+        if err:
+            self.errors[key] = str(err)
+        settled = self._settled.setdefault(key, threading.Event())
+        if state == JOINING:
+            settled.clear()
+        else:
+            settled.set()
+    
+    def wait_until_subscribed(self, keys: Iterable[str] = None, timeout: float = REALTIME_SUBSCRIBE_TIMEOUT_SECONDS):
+        """
+        購読の開始（チャンネルへの参加）を待つ（起動時に呼び出す）
+        
+        Args:
+            keys: 待つ購読のキー（省略時は全ての購読。状態を持たない購読（解除済みなど）は待たない）
+            timeout: 全体で待つ最大秒数
+        
+        Raises:
+            RuntimeError: timeout 秒以内に開始できなかった購読がある場合
+        """
+        deadline = time.monotonic() + timeout
+        keys = list(self.states) if keys is None else [key for key in keys if key in self.states]
+        for key in keys:
+            settled = self._settled.get(key)
+            if settled is not None:
+                settled.wait(max(0.0, deadline - time.monotonic()))
+        failed = {key: self.states.get(key) for key in keys if self.states.get(key) != SUBSCRIBED}
+        if failed:
+            details = ", ".join(f"{key}: {state}{'（' + self.errors[key] + '）' if key in self.errors else ''}" for key, state in failed.items())
+            raise RuntimeError(f"リアルタイムの購読を開始できませんでした: {details}")
+    
+    @property
+    def healthy(self) -> bool:
+        """全ての購読がチャンネルに参加しているか（再接続中のチャンネルは参加していない扱い）"""
+        return all(
+            state == SUBSCRIBED and getattr(self.channels.get(key), "is_joined", True)
+            for key, state in list(self.states.items())
+        )
+    
+    def _dispatch(self, key: str, payload: Dict[str, Any]):
+        """受信したイベントを配信キューに入れる（コールバックの完了は待たない）"""
+        self.dispatcher.submit(key, payload)
+    
+    def _catch_up_spec(self, key: str) -> Optional[Tuple[str, str, Optional[str], Optional[str]]]:
+        """購読の補完の設定（テーブル, 位置の列, 補完するイベント, フィルタ）、補完しない場合は None"""
+        table_name, event, filter = self.subscriptions.get(key, (key, "*", None))
+        if table_name not in CATCH_UP_COLUMNS:
+            return None
+        column, event_type, _ = CATCH_UP_COLUMNS[table_name]
+        if event not in ("*", event_type):
+            return None
+        return table_name, column, event_type, filter
+    
+    def _on_subscribe_status(self, key: str, status: Any, err: Optional[Exception] = None):
+        """チャンネルの状態の変化（2回目以降の SUBSCRIBED は再接続として取りこぼしを補完、補完できない購読は全件無効化する）"""
+        if key not in self.channels:
+            # 購読を解除したチャンネルの退出
+            return
+        status = str(getattr(status, "value", status))
+        self._set_state(key, status, err)
+        if status != SUBSCRIBED:
+            # 切断中の変更は届かないため、受信中に取得した起点の候補は使わない
+            self._pending_marks.pop(key, None)
+            print(f"❌ {key} の監視が中断しました（{status}）: {err or ''}")
+            return
+        with self._lock:
+            rejoined = key in self._joined
+            self._joined.add(key)
+            if rejoined:
+                # 切断中の変更は届いていないため、切断前に取得した起点の候補は使わない
+                self._pending_marks.pop(key, None)
+        if self._catch_up_spec(key) is None:
+            if rejoined:
+                # 補完できない購読（employees・api_keys など）は、切断中の変更を RESYNC で全件無効化させる
+                self.dispatcher.submit_catch_up(key, lambda: self.resync(key))
+            return
+        if rejoined:
+            self.dispatcher.submit_catch_up(key, lambda: self.catch_up(key))
+        else:
+            self.dispatcher.submit_catch_up(key, lambda: self._load_mark(key))
+    
+    def _fetch_bound(self, table_name: str) -> Tuple[int, Optional[datetime]]:
+        """完了済みのトランザクションの境界と取得時刻を取得（migrations/010 の関数を使用）"""
+        response = self.supabase.rpc('realtime_catch_up_bound', {'table_name': table_name}).execute()
+        return int(response.data['bound']), _parse_time(response.data['at'])
+    
+    def _load_mark(self, key: str):
+        """購読開始時点の補完の起点を取得（最初のイベントより前に切断された場合の補完に使う）"""
+        if key in self._resyncing:
+            # 起点の取得を待っている間に配信キューでイベントを捨てた
+            self.resync(key)
+            return
+        if key in self.marks:
+            return
+        bound, _ = self._fetch_bound(self._catch_up_spec(key)[0])
+        self._set_mark(key, bound)
+    
+    def _set_mark(self, key: str, mark: int):
+        """
+        補完の起点を進め、前の起点より前の配信済みの記録を捨てる
+        
+        （補完で配った変更のライブイベントは補完の直後に届くため、起点を1回進める間は記録を残す）
+        """
+        with self._lock:
+            current = self.marks.get(key)
+            if current is not None and mark <= current:
+                return
+            self.marks[key] = mark
+            pending = self._pending_marks.get(key)
+            if pending is not None and pending[0] <= mark:
+                del self._pending_marks[key]
+            delivered = self._delivered.get(key)
+            if delivered and current is not None:
+                self._delivered[key] = {change: from_catch_up for change, from_catch_up in delivered.items() if change[1] >= current}
+    
+    def _advance_mark(self, key: str, table_name: str, payload: Dict[str, Any]):
+        """
+        ライブのイベントで補完の起点を進める（配信キューのワーカーで実行）
+        
+        イベントはコミット順に届くため、候補の境界を取得した時刻より後にコミットされたイベントが届いた時点で、
+        境界より前の変更は全て届いている。候補は CATCH_UP_MARK_REFRESH_SECONDS ごとに取得する。
+        """
+        if key in self._resyncing:
+            # 捨てたイベントを取り直すまでは、その位置を越えて起点を進めない
+            return
+        committed_at = _parse_time(payload.get('commit_timestamp'))
+        pending = self._pending_marks.get(key)
+        if pending is not None and committed_at is not None and pending[1] is not None and committed_at > pending[1]:
+            self._set_mark(key, pending[0])
+        now = time.monotonic()
+        if key in self._pending_marks or now - self._mark_checked.get(key, 0.0) < CATCH_UP_MARK_REFRESH_SECONDS:
+            return
+        self._mark_checked[key] = now
+        try:
+            self._pending_marks[key] = self._fetch_bound(table_name)
+        except Exception as e:
+            print(f"⚠️ {key} の補完の起点を更新できませんでした: {e}")
+    
+    @staticmethod
+    def _record_of(payload: Dict[str, Any]) -> Dict[str, Any]:
+        return payload.get('record') or payload.get('new') or payload.get('old_record') or payload.get('old') or {}
+    
+    def _change_of(self, table_name: str, column: str, payload: Dict[str, Any]) -> Optional[Tuple[Any, Any]]:
+        """変更を識別する (主キー, 位置)（位置が無い場合は None）"""
+        record = self._record_of(payload)
+        mark = record.get(column)
+        if mark is None:
+            return None
+        return record.get(PRIMARY_KEYS.get(table_name, "id")), mark
+    
+    def catch_up(self, key: str) -> int:
+        """
+        補完の起点以降の変更を範囲クエリで取得し、ライブのイベントより先にコールバックに配る
+        
+        起点以降に書き込んだトランザクションの変更は、配り済みのものを除いて全て配る（コミットの順が前後しても取りこぼさない）。
+        補完後は、取得前に確認した完了済みのトランザクションの境界を新しい起点にする。
+        
+        Args:
+            key: 購読のキー（テーブル名、またはイベント・フィルタ付きの購読のキー）
+        
+        Returns:
+            補完したイベント数
+        """
+        table_name, column, event_type, filter = self._catch_up_spec(key)
+        with self._lock:
+            # 以降に捨てたイベントは次の取り直しで補う
+            self._resyncing.discard(key)
+        since = self.marks.get(key)
+        bound, _ = self._fetch_bound(table_name)
+        if since is None:
+            # 起点が分からない場合は取りこぼした変更を特定できないため、購読先のキャッシュを全件無効化させる
+            print(f"⚠️ {key} は補完の起点が無いため、取りこぼしを補完できません")
+            self._invalidate_all(key)
+            self._set_mark(key, bound)
+            return 0
+        
+        payloads = [
+            {"eventType": event_type, "record": row, "old_record": {}, "catch_up": True}
+            for row in self._fetch_after(table_name, column, since, filter)
+        ]
+        tombstones = CATCH_UP_COLUMNS[table_name][2]
+        if tombstones and not filter:
+            # 削除の記録にはフィルタの列が無いため、フィルタ付きの購読では補完しない（リアルタイムでも DELETE は絞り込めない）
+            payloads.extend(
+                {"eventType": "DELETE", "record": {}, "old_record": row, "catch_up": True}
+                for row in self._fetch_after(tombstones, column, since, key_table=table_name)
+            )
+            payloads.sort(key=lambda payload: self._record_of(payload).get(column))
+        
+        delivered = self._delivered.setdefault(key, {})
+        backfilled = 0
+        for payload in payloads:
+            change = self._change_of(table_name, column, payload)
+            if change in delivered:
+                continue
+            delivered[change] = True
+            self._run_callbacks(key, payload)
+            backfilled += 1
+        self._set_mark(key, bound)
+        self.catch_ups += 1
+        self.backfilled += backfilled
+        print(f"✅ {key} の取りこぼしを補完しました: {backfilled}件（{column} >= {since}）")
+        return backfilled
+    
+    def _on_overflow(self, key: str) -> Callable[[], Any]:
+        """
+        配信キューが溢れてイベントを捨てた時の取り直し処理（配信キューのスレッドから呼び出す）
+        
+        取り直すまでは起点を進めないため、補完で捨てたイベントも取得できる。
+        """
+        with self._lock:
+            self._resyncing.add(key)
+            self._pending_marks.pop(key, None)
+        return lambda: self.resync(key)
+    
+    def resync(self, key: str) -> int:
+        """
+        配信キューで捨てたイベントの分を取り直す
+        
+        補完できる購読は起点以降の変更を補完し、補完できない購読（employees・coupons など）は
+        RESYNC イベントで購読先のキャッシュを全件無効化させる。
+        
+        Returns:
+            補完したイベント数
+        """
+        if self._catch_up_spec(key) is not None:
+            return self.catch_up(key)
+        with self._lock:
+            self._resyncing.discard(key)
+        self._invalidate_all(key)
+        return 0
+    
+    def _invalidate_all(self, key: str):
+        """どの行が変わったか分からない時に、購読先にキャッシュの全件を無効化させる（record が空の RESYNC イベント）"""
+        self.resyncs += 1
+        print(f"⚠️ {key} の取りこぼした変更を特定できないため、キャッシュの全件無効化を通知します")
+        self._run_callbacks(key, {"eventType": "RESYNC", "record": {}, "old_record": {}})
+    
+    def _fetch_after(self, table_name: str, column: str, since: Any, filter: str = None, key_table: str = None) -> List[Dict[str, Any]]:
+        """
+        column が since 以上の行を (column, 主キー) の順に取得（通常は1回のクエリ）
+        
+        同じトランザクションの行は同じ位置になるため、ページの区切りは (column, 主キー) で判定する。
+        key_table は主キーの列を決めるテーブル名（削除の記録は元のテーブルの主キーを持つ）。
+        """
+        primary_key = PRIMARY_KEYS.get(key_table or table_name, "id")
+        rows = []
+        last = None
+        while True:
+            query = self.supabase.table(table_name).select('*')
+            if last is None:
+                query = query.gte(column, since)
+            else:
+                query = query.or_(f"{column}.gt.{last[0]},and({column}.eq.{last[0]},{primary_key}.gt.{last[1]})")
+            if filter:
+                query = query.filter(*parse_filter(filter))
+            response = query.order(column).order(primary_key).limit(CATCH_UP_PAGE_SIZE).execute()
+            rows.extend(response.data)
+            if len(response.data) < CATCH_UP_PAGE_SIZE:
+                return rows
+            last = (response.data[-1][column], response.data[-1][primary_key])
+    
+    def _run_callbacks(self, key: str, payload: Dict[str, Any]):
+        """購読のイベントを登録済みのコールバックに配る（配信キューのワーカーで実行）"""
+        event_type = payload.get('eventType') or payload.get('type')
+        spec = self._catch_up_spec(key)
+        if spec is not None and not payload.get('catch_up') and event_type != "RESYNC":
+            table_name, column = spec[0], spec[1]
+            change = self._change_of(table_name, column, payload)
+            delivered = self._delivered.setdefault(key, {})
+            # 補完で配った変更のライブイベントが後から届いた場合は配らない
+            if delivered.get(change):
+                return
+            mark = self.marks.get(key)
+            if change is not None and mark is not None and change[1] >= mark:
+                # 次の補完で同じ変更を配らないよう記録する
+                delivered[change] = False
+            self._advance_mark(key, table_name, payload)
+        for event, callback in list(self.callbacks.get(key, [])):
+            # RESYNC はどのイベントの購読先にも配る
+            if event not in ("*", event_type) and event_type != "RESYNC":
+                continue
+            try:
+                callback(payload)
+            except Exception as e:
+                print(f"❌ {key} のコールバックでエラーが発生しました: {e}")
+    
+    def unsubscribe_from_table(self, key: str):
+        """テーブルの監視を停止（key はテーブル名、または subscribe_to_table が返した購読のキー）"""
+        if key in self.channels:
+            channel = self.channels.pop(key)
+            del self.callbacks[key]
+            self.subscriptions.pop(key, None)
+            self.states.pop(key, None)
+            self.errors.pop(key, None)
+            self._settled.pop(key, None)
+            self._forget_marks(key)
+            self._joined.discard(key)
+            if channel is not None:
+                future = self._submit(self._leave(channel))
+                future.add_done_callback(lambda done: done.cancelled() or done.exception() is None or print(f"❌ {key} の監視停止に失敗しました: {done.exception()}"))
+            print(f"✅ {key} の監視を停止しました")
+    
+    async def _leave(self, channel):
+        """チャンネルから退出してクライアントから削除（リアルタイム用のイベントループで実行）"""
+        client = await get_async_supabase_client()
+        await client.remove_channel(channel)
     
-    def unsubscribe_from_table(self, table_name: str):
-        """テーブルの監視を停止"""
-        if table_name in self.channels:
+    def stop(self, timeout: float = 5.0):
+        """全てのチャンネルから退出してリアルタイム用のイベントループを停止し、配信キューに残っているイベントを処理する"""
+        with self._loop_lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is not None:
             try:
-                self.channels[table_name].unsubscribe()
-                del self.channels[table_name]
-                del self.callbacks[table_name]
-                print(f"✅ {table_name}テーブルの監視を停止しました")
+                asyncio.run_coroutine_threadsafe(self._close(), loop).result(timeout)
             except Exception as e:
-                print(f"❌ {table_name}テーブルの監視停止に失敗しました: {e}")
+                print(f"❌ リアルタイムの切断に失敗しました: {e}")
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout)
+            self._connect_lock = None
+        self.dispatcher.stop(timeout)
+    
+    async def _close(self):
+        client = await get_async_supabase_client()
+        await client.remove_all_channels()
+        await client.realtime.close()
+        # 参加の応答待ちなど、ループ停止後に残るタスクを片付ける
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def _forget_marks(self, key: str):
+        """購読の補完の起点・配信済みの記録を捨てる"""
+        with self._lock:
+            self.marks.pop(key, None)
+            self._pending_marks.pop(key, None)
+            self._mark_checked.pop(key, None)
+            self._delivered.pop(key, None)
+            self._resyncing.discard(key)
+    
+    def stats(self) -> Dict[str, Any]:
+        """補完の起点・回数と配信キューの統計を取得"""
+        return {
+            "subscriptions": sorted(self.channels),
+            "healthy": self.healthy,
+            "states": dict(self.states),
+            "errors": dict(self.errors),
+            "marks": dict(self.marks),
+            "pending_marks": {key: pending[0] for key, pending in list(self._pending_marks.items())},
+            "catch_ups": self.catch_ups,
+            "backfilled": self.backfilled,
+            "resyncs": self.resyncs,
+            "rejoins": self.rejoins,
+            "dispatch": self.dispatcher.stats(),
+        }
     
     def _default_callback(self, payload):
         """デフォルトのコールバック関数"""
@@ -97,6 +661,32 @@ class SupabaseRealtimeManager:
         
         self.subscribe_to_table('orders', '*', order_callback)
     
+    def subscribe_to_store_orders(self, store_cd: str, callback: Callable = None, event: str = "*", pos_no: str = None) -> Optional[str]:
+        """
+        店舗の注文だけを監視（store_cd での絞り込みはリアルタイムサーバーで行う）
+        
+        Args:
+            store_cd: 店舗コード
+            callback: 変更時のコールバック関数
+            event: 監視するイベント（INSERT, UPDATE, DELETE, *）
+            pos_no: レジ番号（指定した場合はそのレジの注文だけをコールバックに渡す。絞り込みは1列のみのためこちらで行う）
+        
+        Returns:
+            購読のキー（unsubscribe_from_table に渡す）
+        """
+        def store_order_callback(payload):
+            # DELETE は変更前の行（old_record）で判定する（DELETE はリアルタイムサーバーで絞り込まれない）
+            # 列が無い場合（主キーだけの変更前の行・RESYNC）は判定できないため渡す
+            record = payload.get('record') or payload.get('old_record') or {}
+            if record.get('store_cd', store_cd) != store_cd:
+                return
+            if pos_no is not None and record.get('pos_no', pos_no) != pos_no:
+                return
+            if callback:
+                callback(payload)
+        
+        return self.subscribe_to_table('orders', event, store_order_callback, filter=f"store_cd=eq.{store_cd}")
+    
     def subscribe_to_products(self, callback: Callable = None):
         """商品テーブルの監視"""
         def product_callback(payload):
@@ -133,28 +723,47 @@ class SupabaseRealtimeManager:
         
         self.subscribe_to_table('customers', '*', customer_callback)
     
+    def subscribe_to_employees(self, callback: Callable = None):
+        """従業員テーブルの監視"""
+        def employee_callback(payload):
+            event_type = payload.get('eventType')
+            record = payload.get('record') or payload.get('old_record') or {}
+            
+            if event_type in ('INSERT', 'UPDATE', 'DELETE'):
+                print(f"📝 従業員情報が変更されました（{event_type}）: {record.get('enp_cd')}")
+            
+            if callback:
+                callback(payload)
+        
+        self.subscribe_to_table('employees', '*', employee_callback)
+    
     def broadcast_message(self, channel: str, message: Dict[str, Any]):
-        """チャンネルにメッセージをブロードキャスト"""
-        try:
-            self.supabase.channel(channel).send({
-                "type": "broadcast",
-                "event": "message",
-                "payload": message
-            })
-            print(f"📢 チャンネル {channel} にメッセージを送信しました")
-        except Exception as e:
-            print(f"❌ メッセージ送信に失敗しました: {e}")
+        """チャンネルにメッセージをブロードキャスト（送信の完了は待たない）"""
+        async def send():
+            client = await get_async_supabase_client()
+            await client.channel(channel).send_broadcast("message", message)
+        
+        def done(future: Future):
+            if future.exception() is not None:
+                print(f"❌ メッセージ送信に失敗しました: {future.exception()}")
+            else:
+                print(f"📢 チャンネル {channel} にメッセージを送信しました")
+        
+        self._submit(send()).add_done_callback(done)
     
     def subscribe_to_channel(self, channel: str, callback: Callable = None):
         """カスタムチャンネルを監視"""
-        try:
-            channel_obj = self.supabase.channel(channel)
-            channel_obj.on("broadcast", {"event": "message"}, callback or self._default_callback)
-            channel_obj.subscribe()
+        async def join():
+            client = await get_async_supabase_client()
+            channel_obj = client.channel(channel)
+            channel_obj.on_broadcast("message", callback or self._default_callback)
             self.channels[channel] = channel_obj
-            print(f"✅ チャンネル {channel} の監視を開始しました")
-        except Exception as e:
-            print(f"❌ チャンネル {channel} の監視開始に失敗しました: {e}")
+            self.callbacks.setdefault(channel, [])
+            await channel_obj.subscribe(lambda status, err=None: self._set_state(channel, str(getattr(status, "value", status)), err))
+        
+        self._set_state(channel, JOINING)
+        self._submit(join()).add_done_callback(lambda future: self._on_join_done(channel, future))
+        print(f"✅ チャンネル {channel} の監視を開始しました")
 
 # グローバルインスタンス
 realtime_manager = SupabaseRealtimeManager()
@@ -179,8 +788,7 @@ def start_realtime_monitoring():
 def stop_realtime_monitoring():
     """リアルタイム監視を停止"""
     try:
-        for table_name in list(realtime_manager.channels.keys()):
-            realtime_manager.unsubscribe_from_table(table_name)
+        realtime_manager.stop()
         
         print("✅ リアルタイム監視を停止しました")
         
@@ -195,7 +803,7 @@ if __name__ == "__main__":
     try:
         # 監視を継続
         while True:
-            asyncio.sleep(1)
+            time.sleep(1)
     except KeyboardInterrupt:
         # Ctrl+Cで停止
         stop_realtime_monitoring()
@@ -0,0 +1,165 @@
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Optional, List, Iterable
+import os
+import threading
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+
+# .env の読み込み
+base_path = Path(__file__).resolve().parent.parent
+env_path = base_path / '.env'
+load_dotenv(dotenv_path=env_path)
+
+# 従業員の役割を保持する秒数
+ROLE_CACHE_TTL = float(os.getenv("ROLE_CACHE_TTL", "300"))
+# 存在しない従業員を保持する秒数と、保持する最大件数
+ROLE_CACHE_NEGATIVE_TTL = float(os.getenv("ROLE_CACHE_NEGATIVE_TTL", "30"))
+ROLE_CACHE_MAX_SIZE = int(os.getenv("ROLE_CACHE_MAX_SIZE", "10000"))
+
+# 存在しない従業員を表す値（存在しないことも negative_ttl の間キャッシュする）
+_NOT_FOUND = object()
+
+class EmployeeRoleCache:
+    """従業員コード（enp_cd）をキーにした役割（role）のキャッシュ（TTL・件数上限付きのLRU）"""
+
+    def __init__(
+        self,
+        bulk_loader: Callable[[List[str]], List[Dict[str, Any]]] = None,
+        ttl: float = ROLE_CACHE_TTL,
+        negative_ttl: float = ROLE_CACHE_NEGATIVE_TTL,
+        max_size: int = ROLE_CACHE_MAX_SIZE
+    ):
+        """
+        Args:
+            bulk_loader: 複数の従業員コードの enp_cd と role を1回で取得する関数
+            ttl: 役割を保持する秒数
+            negative_ttl: 存在しない従業員を保持する秒数
+            max_size: 保持する最大件数（超えた場合は最も古く使われたものから削除）
+        """
+        self.bulk_loader = bulk_loader
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 無効化のたびに増やし、取得中に無効化された結果をキャッシュしない
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def configure(self, bulk_loader: Callable = None, ttl: float = None, negative_ttl: float = None, max_size: int = None):
+        """ローダー関数・TTL・最大件数を設定"""
+        if bulk_loader is not None:
+            self.bulk_loader = bulk_loader
+        if ttl is not None:
+            self.ttl = ttl
+        if negative_ttl is not None:
+            self.negative_ttl = negative_ttl
+        if max_size is not None:
+            self.max_size = max_size
+
+    def get_roles(self, enp_cds: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        複数の従業員の役割を取得（キャッシュに無い従業員は1回でまとめて取得）
+
+        Returns:
+            従業員コード → 役割（存在しない従業員は含まない）
+        """
+        roles: Dict[str, Optional[str]] = {}
+        missing: List[str] = []
+        now = time.monotonic()
+        with self._lock:
+            for enp_cd in dict.fromkeys(enp_cds):
+                entry = self._entries.get(enp_cd)
+                if entry is not None and entry[1] > now:
+                    self._entries.move_to_end(enp_cd)
+                    self.hits += 1
+                    if entry[0] is not _NOT_FOUND:
+                        roles[enp_cd] = entry[0]
+                else:
+                    if entry is not None:
+                        del self._entries[enp_cd]
+                    self.misses += 1
+                    missing.append(enp_cd)
+            generation = self._generation
+
+        if missing and self.bulk_loader is not None:
+            loaded = {row['enp_cd']: row.get('role') for row in self.bulk_loader(missing)}
+            now = time.monotonic()
+            with self._lock:
+                self.loads += 1
+                if generation == self._generation:
+                    for enp_cd in missing:
+                        if enp_cd in loaded:
+                            self._entries[enp_cd] = (loaded[enp_cd], now + self.ttl)
+                        else:
+                            self._entries[enp_cd] = (_NOT_FOUND, now + self.negative_ttl)
+                        self._entries.move_to_end(enp_cd)
+                    self._evict(now)
+            roles.update(loaded)
+        return roles
+
+    def _evict(self, now: float):
+        """最大件数を超えた分を削除（期限切れのものを先に削除し、残りは最も古く使われたものから）"""
+        if len(self._entries) <= self.max_size:
+            return
+        for enp_cd in [enp_cd for enp_cd, entry in self._entries.items() if entry[1] <= now]:
+            del self._entries[enp_cd]
+            self.evictions += 1
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_role(self, enp_cd: str) -> Optional[str]:
+        """従業員の役割を取得（存在しない従業員・役割未設定は None）"""
+        return self.get_roles([enp_cd]).get(enp_cd)
+
+    def exists(self, enp_cd: str) -> bool:
+        """従業員が存在するか"""
+        return enp_cd in self.get_roles([enp_cd])
+
+    def invalidate(self, enp_cd: str = None):
+        """従業員の役割を無効化（enp_cd を省略した場合は全件）"""
+        with self._lock:
+            if enp_cd is None:
+                self._entries = OrderedDict()
+            else:
+                self._entries.pop(enp_cd, None)
+            self._generation += 1
+            self.invalidations += 1
+
+    def apply_change(self, payload: Dict[str, Any]):
+        """employeesテーブルのリアルタイムイベントで該当従業員を無効化"""
+        record = payload.get('record') or payload.get('new') or {}
+        old_record = payload.get('old_record') or payload.get('old') or {}
+        enp_cd = record.get('enp_cd') or old_record.get('enp_cd')
+        # どの従業員か判別できない場合は全件を無効化
+        self.invalidate(enp_cd)
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット・ミスの統計を取得"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "negative_ttl": self.negative_ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+# グローバルインスタンス
+role_cache = EmployeeRoleCache()
+
+def get_role_cache() -> EmployeeRoleCache:
+    """従業員の役割キャッシュを取得"""
+    return role_cache
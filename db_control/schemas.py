@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime, date
 
@@ -19,6 +19,27 @@ class ProductCreate(ProductBase):
 class Product(ProductBase):
     prd_id: int
 
+# 商品一括検索（ProductLookup）
+# 1回で検索できる商品コードの上限（IN (...) のパラメータ数を抑える）
+PRODUCT_LOOKUP_MAX_CODES = 500
+
+class ProductLookupRequest(BaseModel):
+    codes: List[str] = Field(..., max_length=PRODUCT_LOOKUP_MAX_CODES)
+
+class ProductLookupResponse(BaseModel):
+    products: List[Product]
+    missing: List[str]
+
+# 1回で役割を取得できる従業員の上限
+EMPLOYEE_ROLES_MAX_CODES = 200
+
+class EmployeeRolesRequest(BaseModel):
+    enp_cds: List[str] = Field(..., max_length=EMPLOYEE_ROLES_MAX_CODES)
+
+class EmployeeLoginRequest(BaseModel):
+    enp_cd: str
+    password: str
+
 # 顧客（Customer）
 class CustomerBase(ORMBase):
     email: Optional[str]
@@ -117,4 +138,19 @@ class CartItem(BaseModel):
     code: str
     name: str
     price: int
-    quantity: int
\ No newline at end of file
+    quantity: int
+
+# オフライン取引（OfflineSale）
+OFFLINE_BATCH_MAX_SALES = 2000  # 1回の一括登録で受け付ける最大件数
+
+class OfflineSale(BaseModel):
+    sale_id: str = Field(..., min_length=1, max_length=64)  # 端末側で採番した取引ID（結果の対応付け・重複登録の防止に使用）
+    datetime: datetime  # 端末で販売した日時
+    store_cd: str
+    pos_no: str
+    emp_cd: Optional[str] = None
+    items: List[CartItem]
+
+class OfflineSaleBatch(BaseModel):
+    sales: List[OfflineSale] = Field(..., max_length=OFFLINE_BATCH_MAX_SALES)
+
@@ -1,6 +1,7 @@
 from sqlalchemy.orm import Session
 from .connect import SessionLocal
 from .mymodels import Product, Employee
+from .employee_auth import hash_password
 
 
 def seed_products(db: Session):
@@ -38,8 +39,8 @@ def seed_products(db: Session):
 def seed_employees(db: Session):
     employees = [
         {"enp_cd": "GUEST00001", "name": "ゲストユーザー", "password": None, "role": "guest", "is_active": True},
-        {"enp_cd": "EMP00001", "name": "田中", "password": "password1", "role": "staff", "is_active": True},
-        {"enp_cd": "EMP00002", "name": "鈴木", "password": "password2", "role": "staff", "is_active": True},
+        {"enp_cd": "EMP00001", "name": "田中", "password": hash_password("password1"), "role": "staff", "is_active": True},
+        {"enp_cd": "EMP00002", "name": "鈴木", "password": hash_password("password2"), "role": "staff", "is_active": True},
     ]
 
     for emp in employees:
@@ -1,4 +1,5 @@
 from db_control.supabase_client import get_supabase_client
+from db_control.employee_auth import hash_password
 
 def seed_products_supabase():
     """商品データをSupabaseに登録"""
@@ -42,8 +43,8 @@ def seed_employees_supabase():
     
     employees = [
         {"enp_cd": "GUEST00001", "name": "ゲストユーザー", "password": None, "role": "guest", "is_active": True},
-        {"enp_cd": "EMP00001", "name": "田中", "password": "password1", "role": "staff", "is_active": True},
-        {"enp_cd": "EMP00002", "name": "鈴木", "password": "password2", "role": "staff", "is_active": True},
+        {"enp_cd": "EMP00001", "name": "田中", "password": hash_password("password1"), "role": "staff", "is_active": True},
+        {"enp_cd": "EMP00002", "name": "鈴木", "password": hash_password("password2"), "role": "staff", "is_active": True},
     ]
 
     for emp in employees:
@@ -1,8 +1,8 @@
-from supabase import create_client, Client
 from typing import Optional, List, Dict, Any
 import os
 from pathlib import Path
 from dotenv import load_dotenv
+from .supabase_client import get_supabase_client
 import base64
 from datetime import datetime
 import mimetypes
@@ -12,20 +12,17 @@ base_path = Path(__file__).resolve().parent.parent
 env_path = base_path / '.env'
 load_dotenv(dotenv_path=env_path)
 
-# Supabase接続情報
-SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')  # バックエンド用
-
-# Supabaseクライアントの作成（service_role key使用）
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
-
 class SupabaseStorageManager:
     """Supabaseストレージ機能を管理するクラス"""
     
     def __init__(self):
-        self.supabase = supabase
         self.default_bucket = "pos-files"
     
+    @property
+    def supabase(self):
+        """共有のSupabaseクライアント（service_role key使用、初回利用時に作成）"""
+        return get_supabase_client()
+    
     def create_bucket(self, bucket_name: str, public: bool = False) -> bool:
         """
         バケットを作成
@@ -1,8 +1,15 @@
-from supabase import create_client, Client
+from typing import Optional, Dict, Any, TYPE_CHECKING
+import asyncio
 import os
+import threading
+import time
+import weakref
 from pathlib import Path
 from dotenv import load_dotenv
 
+if TYPE_CHECKING:
+    from supabase import Client, AsyncClient
+
 # .env の読み込み
 base_path = Path(__file__).resolve().parent.parent
 env_path = base_path / '.env'
@@ -11,15 +18,108 @@ load_dotenv(dotenv_path=env_path)
 # Supabase接続情報
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')  # バックエンド用
+SUPABASE_ANON_KEY = os.getenv('SUPABASE_ANON_KEY')  # フロントエンド用
+
+SERVICE_ROLE = "service_role"
+ANON = "anon"
+
+class SupabaseClientRegistry:
+    """
+    Supabaseクライアントを初回利用時に1回だけ作成し、プロセス内で共有するレジストリ
+
+    service_role key のクライアントと anon key のクライアントを別々に保持する。
+    supabase パッケージの import もクライアント作成時まで遅らせる。
+    """
+
+    def __init__(self, url: Optional[str], keys: Dict[str, Optional[str]]):
+        """
+        Args:
+            url: SupabaseのURL
+            keys: 種類（service_role / anon）ごとのキー
+        """
+        self.url = url
+        self.keys = keys
+        self._clients: Dict[str, "Client"] = {}
+        self._lock = threading.Lock()
+        self.create_ms: Dict[str, float] = {}
+        self.requests = 0
+
+    def get(self, role: str = SERVICE_ROLE) -> "Client":
+        """指定した種類のクライアントを取得（未作成なら作成）"""
+        self.requests += 1
+        client = self._clients.get(role)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(role)
+                if client is None:
+                    client = self._clients[role] = self._create(role)
+        return client
 
-# Supabaseクライアントの作成（service_role key使用）
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    def _create(self, role: str) -> "Client":
+        if role not in self.keys:
+            raise ValueError(f"未対応のクライアント種類です: {role}")
+        start = time.perf_counter()
+        from supabase import create_client, ClientOptions
+        if role == ANON:
+            # 共有するためセッションを保持・自動更新しない（ユーザーごとのトークンは呼び出し側で扱う）
+            client = create_client(
+                self.url,
+                self.keys[role],
+                options=ClientOptions(persist_session=False, auto_refresh_token=False)
+            )
+        else:
+            client = create_client(self.url, self.keys[role])
+        self.create_ms[role] = (time.perf_counter() - start) * 1000
+        print(f"✅ Supabaseクライアント（{role}）を作成しました: {self.create_ms[role]:.1f}ms")
+        return client
 
-def get_supabase_client() -> Client:
+    def stats(self) -> Dict[str, Any]:
+        """作成済みのクライアント・作成時間・取得回数を取得"""
+        return {
+            "clients": sorted(self._clients.keys()),
+            "create_ms": dict(self.create_ms),
+            "requests": self.requests,
+        }
+
+    def clear(self):
+        """作成済みのクライアントを破棄（次回取得時に再作成）"""
+        with self._lock:
+            self._clients = {}
+            self.create_ms = {}
+
+# グローバルインスタンス
+client_registry = SupabaseClientRegistry(SUPABASE_URL, {
+    SERVICE_ROLE: SUPABASE_SERVICE_ROLE_KEY,
+    ANON: SUPABASE_ANON_KEY,
+})
+
+def get_client_registry() -> SupabaseClientRegistry:
+    """Supabaseクライアントのレジストリを取得"""
+    return client_registry
+
+def get_supabase_client() -> "Client":
     """Supabaseクライアントを取得する関数（service_role key使用）"""
-    return supabase
+    return client_registry.get(SERVICE_ROLE)
 
-def get_supabase_anon_client() -> Client:
+def get_supabase_anon_client() -> "Client":
     """Supabase匿名クライアントを取得する関数（anon key使用）"""
-    SUPABASE_ANON_KEY = os.getenv('SUPABASE_ANON_KEY')
-    return create_client(SUPABASE_URL, SUPABASE_ANON_KEY) 
\ No newline at end of file
+    return client_registry.get(ANON)
+
+# 非同期Supabaseクライアント（イベントループごとに初回利用時に作成）
+# ・クライアントの接続（HTTP・リアルタイムの WebSocket）は作成したループでしか使えないため、
+#   リクエスト処理のループとリアルタイム受信のループ（realtime_supabase.py）で別々に持つ
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncClient]" = weakref.WeakKeyDictionary()
+_async_client_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+
+async def get_async_supabase_client() -> "AsyncClient":
+    """実行中のイベントループの非同期Supabaseクライアントを取得する関数（service_role key使用）"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        lock = _async_client_locks.setdefault(loop, asyncio.Lock())
+        async with lock:
+            client = _async_clients.get(loop)
+            if client is None:
+                from supabase import acreate_client
+                client = _async_clients[loop] = await acreate_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    return client
@@ -0,0 +1,140 @@
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+from .metrics import Counter, register_metric
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+
+# .env の読み込み
+base_path = Path(__file__).resolve().parent.parent
+env_path = base_path / '.env'
+load_dotenv(dotenv_path=env_path)
+
+# 検証済みトークンを保持する最大件数
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "10000"))
+
+AUTH_TOKEN_CACHE = register_metric(Counter(
+    "auth_token_cache_total",
+    "JWT verification cache lookups by result.",
+    ("result",)
+))
+
+def hash_token(token: str) -> str:
+    """トークンのハッシュ（キャッシュのキーにはトークン本体を保持しない）"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+class VerifiedTokenCache:
+    """署名検証済みのJWTのクレームを exp まで保持するLRUキャッシュ"""
+
+    def __init__(self, max_size: int = JWT_CACHE_SIZE):
+        """
+        Args:
+            max_size: 保持する最大件数（超えた場合は最も古く使われたものから削除）
+        """
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._revoked: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.revocations = 0
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """キャッシュ済みのクレームを取得（無い・期限切れの場合は None）"""
+        key = hash_token(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                AUTH_TOKEN_CACHE.inc(result="hit")
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+                self.expired += 1
+            self.misses += 1
+        AUTH_TOKEN_CACHE.inc(result="miss")
+        return None
+
+    def put(self, token: str, claims: Dict[str, Any]):
+        """検証済みのクレームを exp まで保持（exp が無いトークンは保持しない）"""
+        exp = claims.get("exp")
+        if exp is None or exp <= time.time():
+            return
+        key = hash_token(token)
+        with self._lock:
+            self._entries[key] = (claims, float(exp))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def revoke(self, token: str, exp: Optional[float] = None):
+        """
+        トークンを失効させる（署名が有効でも exp までは拒否する）
+
+        Args:
+            token: 失効させるトークン
+            exp: トークンの有効期限（省略時はキャッシュ済みのクレームの exp）
+        """
+        key = hash_token(token)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if exp is None and entry is not None:
+                exp = entry[1]
+            self._revoked[key] = float(exp) if exp is not None else time.time() + 24 * 60 * 60
+            self.revocations += 1
+            self._purge_revoked()
+
+    def is_revoked(self, token: str) -> bool:
+        """トークンが失効済みか"""
+        key = hash_token(token)
+        with self._lock:
+            exp = self._revoked.get(key)
+            if exp is None:
+                return False
+            if exp <= time.time():
+                del self._revoked[key]
+                return False
+        AUTH_TOKEN_CACHE.inc(result="revoked")
+        return True
+
+    def _purge_revoked(self):
+        now = time.time()
+        for key in [key for key, exp in self._revoked.items() if exp <= now]:
+            del self._revoked[key]
+
+    def clear(self):
+        """キャッシュと失効リストを空にする"""
+        with self._lock:
+            self._entries.clear()
+            self._revoked.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """キャッシュの統計を取得"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "revoked": len(self._revoked),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "revocations": self.revocations,
+            }
+
+# グローバルインスタンス
+token_cache = VerifiedTokenCache()
+
+def get_token_cache() -> VerifiedTokenCache:
+    """検証済みトークンのキャッシュを取得"""
+    return token_cache
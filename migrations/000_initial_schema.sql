@@ -0,0 +1,80 @@
+-- 初期スキーマ（SUPABASE_SETUP.md「5. テーブルの作成」と同じテーブル定義）
+CREATE TABLE IF NOT EXISTS products (
+    prd_id SERIAL PRIMARY KEY,
+    code VARCHAR(20) NOT NULL UNIQUE,
+    name VARCHAR(50) NOT NULL,
+    price INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS customers (
+    cust_id SERIAL PRIMARY KEY,
+    email VARCHAR(255),
+    name VARCHAR(100),
+    point INTEGER NOT NULL DEFAULT 0,
+    is_active BOOLEAN NOT NULL DEFAULT true,
+    synced_at TIMESTAMP,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS coupons (
+    coupon_id VARCHAR(20) PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    discount INTEGER NOT NULL,
+    type VARCHAR(1) NOT NULL,
+    valid_from DATE NOT NULL,
+    valid_to DATE NOT NULL,
+    limit_cnt INTEGER,
+    is_active BOOLEAN NOT NULL DEFAULT true,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS employees (
+    enp_cd VARCHAR(10) PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    password VARCHAR(255),
+    role VARCHAR(20),
+    is_active BOOLEAN NOT NULL DEFAULT true
+);
+
+CREATE TABLE IF NOT EXISTS orders (
+    trd_id SERIAL PRIMARY KEY,
+    datetime TIMESTAMP NOT NULL,
+    enp_cd VARCHAR(10) NOT NULL REFERENCES employees(enp_cd),
+    store_cd VARCHAR(5) NOT NULL,
+    pos_no VARCHAR(3) NOT NULL,
+    total_amt INTEGER NOT NULL,
+    ttl_amt_ex_tax INTEGER NOT NULL,
+    cust_id INTEGER REFERENCES customers(cust_id),
+    used_point INTEGER,
+    coupon_id VARCHAR(20) REFERENCES coupons(coupon_id),
+    discount_by_cp INTEGER,
+    final_amt INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS order_details (
+    dtl_id SERIAL PRIMARY KEY,
+    trd_id INTEGER NOT NULL REFERENCES orders(trd_id),
+    prd_id INTEGER NOT NULL REFERENCES products(prd_id),
+    prd_code VARCHAR(20) NOT NULL,
+    prd_name VARCHAR(50) NOT NULL,
+    prd_price INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    tax_cd VARCHAR(2) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS coupon_histories (
+    crm_id VARCHAR(64) PRIMARY KEY,
+    coupon_id VARCHAR(20) NOT NULL REFERENCES coupons(coupon_id),
+    used_at TIMESTAMP NOT NULL,
+    trd_id INTEGER NOT NULL REFERENCES orders(trd_id)
+);
+
+-- APIキーテーブル（認証機能用）
+CREATE TABLE IF NOT EXISTS api_keys (
+    id SERIAL PRIMARY KEY,
+    user_id VARCHAR(255) NOT NULL,
+    key_name VARCHAR(100) NOT NULL,
+    api_key VARCHAR(255) NOT NULL UNIQUE,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    is_active BOOLEAN NOT NULL DEFAULT true
+);
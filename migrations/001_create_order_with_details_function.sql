@@ -0,0 +1,27 @@
+-- 注文と注文明細を1回のRPC呼び出しで登録する関数
+-- ・関数全体が1トランザクションで実行されるため、明細の登録に失敗した場合は注文も残らない
+-- ・戻り値は採番された trd_id
+CREATE OR REPLACE FUNCTION create_order_with_details(order_data jsonb, details jsonb)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    new_trd_id integer;
+BEGIN
+    INSERT INTO orders (
+        datetime, enp_cd, store_cd, pos_no, total_amt, ttl_amt_ex_tax,
+        cust_id, used_point, coupon_id, discount_by_cp, final_amt
+    )
+    SELECT
+        o.datetime, o.enp_cd, o.store_cd, o.pos_no, o.total_amt, o.ttl_amt_ex_tax,
+        o.cust_id, o.used_point, o.coupon_id, o.discount_by_cp, o.final_amt
+    FROM jsonb_populate_record(NULL::orders, order_data) AS o
+    RETURNING trd_id INTO new_trd_id;
+
+    INSERT INTO order_details (trd_id, prd_id, prd_code, prd_name, prd_price, quantity, tax_cd)
+    SELECT new_trd_id, d.prd_id, d.prd_code, d.prd_name, d.prd_price, d.quantity, d.tax_cd
+    FROM jsonb_populate_recordset(NULL::order_details, details) AS d;
+
+    RETURN new_trd_id;
+END;
+$$;
@@ -0,0 +1,54 @@
+-- 商品カタログのバージョン管理（端末向け差分同期用）
+-- ・products の INSERT/UPDATE ごとに catalog_version_seq から version を採番
+-- ・DELETE された商品は product_tombstones に削除バージョンとともに記録
+CREATE SEQUENCE IF NOT EXISTS catalog_version_seq;
+
+ALTER TABLE products
+    ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT nextval('catalog_version_seq');
+
+CREATE INDEX IF NOT EXISTS idx_products_version ON products (version);
+
+CREATE TABLE IF NOT EXISTS product_tombstones (
+    prd_id INTEGER PRIMARY KEY,
+    code VARCHAR(20) NOT NULL,
+    version BIGINT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_product_tombstones_version ON product_tombstones (version);
+
+CREATE OR REPLACE FUNCTION products_bump_version()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO product_tombstones (prd_id, code, version)
+        VALUES (OLD.prd_id, OLD.code, nextval('catalog_version_seq'))
+        ON CONFLICT (prd_id) DO UPDATE SET code = EXCLUDED.code, version = EXCLUDED.version;
+        RETURN OLD;
+    END IF;
+
+    NEW.version := nextval('catalog_version_seq');
+    IF TG_OP = 'INSERT' THEN
+        DELETE FROM product_tombstones WHERE prd_id = NEW.prd_id;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS products_version_trigger ON products;
+CREATE TRIGGER products_version_trigger
+    BEFORE INSERT OR UPDATE OR DELETE ON products
+    FOR EACH ROW EXECUTE FUNCTION products_bump_version();
+
+-- 現在のカタログバージョン（コミット済みの最大 version）
+CREATE OR REPLACE FUNCTION get_catalog_version()
+RETURNS bigint
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT GREATEST(
+        COALESCE((SELECT MAX(version) FROM products), 0),
+        COALESCE((SELECT MAX(version) FROM product_tombstones), 0)
+    );
+$$;
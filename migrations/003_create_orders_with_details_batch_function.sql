@@ -0,0 +1,19 @@
+-- 複数の注文と注文明細を1回のRPC・1トランザクションで登録する関数（グループコミット用）
+-- ・引数は [{"order": {...}, "details": [...]}, ...] 形式のJSON配列
+-- ・戻り値は引数の順に並んだ trd_id の配列
+CREATE OR REPLACE FUNCTION create_orders_with_details(orders jsonb)
+RETURNS integer[]
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    entry jsonb;
+    trd_ids integer[] := '{}';
+BEGIN
+    FOR entry IN
+        SELECT value FROM jsonb_array_elements(orders) WITH ORDINALITY ORDER BY ordinality
+    LOOP
+        trd_ids := trd_ids || create_order_with_details(entry->'order', entry->'details');
+    END LOOP;
+    RETURN trd_ids;
+END;
+$$;
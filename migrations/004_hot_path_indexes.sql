@@ -0,0 +1,23 @@
+-- 検索条件に使っている列のインデックス
+-- （employees は enp_cd（主キー）でのみ検索しているため追加しない）
+
+-- products.code は一意（create_all で作成した環境には UNIQUE 制約がないため、一意インデックスがない場合のみ作成）
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1
+        FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY (i.indkey)
+        WHERE i.indrelid = 'products'::regclass
+          AND i.indisunique
+          AND i.indnatts = 1
+          AND a.attname = 'code'
+    ) THEN
+        CREATE UNIQUE INDEX idx_products_code ON products (code);
+    END IF;
+END;
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_orders_datetime ON orders (datetime);
+CREATE INDEX IF NOT EXISTS idx_order_details_trd_id ON order_details (trd_id);
+CREATE INDEX IF NOT EXISTS idx_customers_email ON customers (email);
@@ -0,0 +1,35 @@
+-- APIキーをプレフィックスとハッシュで保存する
+-- ・key_prefix: キーの識別用（sk_<prefix>_... の <prefix>）
+-- ・key_hash: キー全体のSHA-256（16進数）
+-- ・updated_at: アプリのインデックスが差分を読み込むための更新日時
+ALTER TABLE api_keys ADD COLUMN IF NOT EXISTS key_prefix VARCHAR(16);
+ALTER TABLE api_keys ADD COLUMN IF NOT EXISTS key_hash CHAR(64);
+ALTER TABLE api_keys ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+ALTER TABLE api_keys ALTER COLUMN api_key DROP NOT NULL;
+
+-- 既存の平文のキーをハッシュに置き換える
+UPDATE api_keys
+SET key_hash = encode(sha256(convert_to(api_key, 'UTF8')), 'hex'),
+    key_prefix = left(split_part(api_key, '_', 2), 16),
+    api_key = NULL
+WHERE api_key IS NOT NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_api_keys_key_hash ON api_keys (key_hash);
+CREATE INDEX IF NOT EXISTS idx_api_keys_updated_at ON api_keys (updated_at);
+
+-- 更新（無効化など）のたびに updated_at を更新する
+CREATE OR REPLACE FUNCTION api_keys_touch_updated_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.updated_at := NOW();
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS api_keys_touch_updated_at ON api_keys;
+CREATE TRIGGER api_keys_touch_updated_at
+    BEFORE UPDATE ON api_keys
+    FOR EACH ROW
+    EXECUTE FUNCTION api_keys_touch_updated_at();
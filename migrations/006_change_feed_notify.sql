@@ -0,0 +1,72 @@
+-- 変更フィード（LISTEN/NOTIFY）
+-- ・products / employees / coupons / customers の変更をコミット時に table_changes チャンネルへ通知
+-- ・ペイロードはSupabaseリアルタイムと同じ形（eventType / record / old_record）
+-- ・NOTIFY の上限（8000バイト）を超える行は主キーのみを送り、受信側で読み込み直させる
+-- ・第1引数は主キーの列名、第2引数以降は通知しない列（パスワードなど）
+-- ・書き込みの多い orders はコミットごとの通知の負荷を避けるため対象外
+CREATE OR REPLACE FUNCTION notify_table_change()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    key_column text := TG_ARGV[0];
+    new_row jsonb;
+    old_row jsonb;
+    payload jsonb;
+    i integer;
+BEGIN
+    IF TG_OP <> 'DELETE' THEN
+        new_row := to_jsonb(NEW);
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        old_row := to_jsonb(OLD);
+    END IF;
+    FOR i IN 1 .. TG_NARGS - 1 LOOP
+        new_row := new_row - TG_ARGV[i];
+        old_row := old_row - TG_ARGV[i];
+    END LOOP;
+
+    payload := jsonb_build_object(
+        'table', TG_TABLE_NAME,
+        'eventType', TG_OP,
+        'commit_timestamp', now(),
+        'record', COALESCE(new_row, '{}'::jsonb),
+        'old_record', COALESCE(old_row, '{}'::jsonb)
+    );
+    IF octet_length(payload::text) > 7900 THEN
+        payload := jsonb_build_object(
+            'table', TG_TABLE_NAME,
+            'eventType', TG_OP,
+            'commit_timestamp', now(),
+            'truncated', true,
+            'record', CASE WHEN new_row IS NULL THEN '{}'::jsonb
+                           ELSE jsonb_build_object(key_column, new_row -> key_column) END,
+            'old_record', CASE WHEN old_row IS NULL THEN '{}'::jsonb
+                               ELSE jsonb_build_object(key_column, old_row -> key_column) END
+        );
+    END IF;
+
+    PERFORM pg_notify('table_changes', payload::text);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS products_notify_change ON products;
+CREATE TRIGGER products_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON products
+    FOR EACH ROW EXECUTE FUNCTION notify_table_change('prd_id');
+
+DROP TRIGGER IF EXISTS employees_notify_change ON employees;
+CREATE TRIGGER employees_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON employees
+    FOR EACH ROW EXECUTE FUNCTION notify_table_change('enp_cd', 'password');
+
+DROP TRIGGER IF EXISTS coupons_notify_change ON coupons;
+CREATE TRIGGER coupons_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON coupons
+    FOR EACH ROW EXECUTE FUNCTION notify_table_change('coupon_id');
+
+DROP TRIGGER IF EXISTS customers_notify_change ON customers;
+CREATE TRIGGER customers_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON customers
+    FOR EACH ROW EXECUTE FUNCTION notify_table_change('cust_id');
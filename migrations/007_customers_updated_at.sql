@@ -0,0 +1,23 @@
+-- customers に更新日時を追加（リアルタイム再接続時の取りこぼしの補完用）
+-- ・updated_at: INSERT/UPDATE のたびに clock_timestamp() で更新
+-- ・補完は updated_at の範囲で1回のクエリで取得するためインデックスを作成
+ALTER TABLE customers ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+
+CREATE INDEX IF NOT EXISTS idx_customers_updated_at ON customers (updated_at);
+
+CREATE OR REPLACE FUNCTION customers_touch_updated_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- NOW() はトランザクション開始時刻のため、実際の更新時刻に近い clock_timestamp() を使う
+    NEW.updated_at := clock_timestamp();
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS customers_touch_updated_at ON customers;
+CREATE TRIGGER customers_touch_updated_at
+    BEFORE INSERT OR UPDATE ON customers
+    FOR EACH ROW
+    EXECUTE FUNCTION customers_touch_updated_at();
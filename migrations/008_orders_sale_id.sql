@@ -0,0 +1,43 @@
+-- オフライン取引の重複登録防止
+-- ・sale_id: 端末側で採番した取引ID（オンラインの取引は NULL）
+-- ・同じ端末（store_cd, pos_no）の同じ sale_id は1件だけ登録し、再送時は既存の trd_id を返す
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS sale_id VARCHAR(64);
+
+CREATE UNIQUE INDEX IF NOT EXISTS orders_sale_id_key ON orders (store_cd, pos_no, sale_id);
+
+-- migrations/001 の関数を sale_id 対応に置き換え（create_orders_with_details からも呼ばれる）
+CREATE OR REPLACE FUNCTION create_order_with_details(order_data jsonb, details jsonb)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    new_trd_id integer;
+BEGIN
+    INSERT INTO orders (
+        datetime, enp_cd, store_cd, pos_no, total_amt, ttl_amt_ex_tax,
+        cust_id, used_point, coupon_id, discount_by_cp, final_amt, sale_id
+    )
+    SELECT
+        o.datetime, o.enp_cd, o.store_cd, o.pos_no, o.total_amt, o.ttl_amt_ex_tax,
+        o.cust_id, o.used_point, o.coupon_id, o.discount_by_cp, o.final_amt, o.sale_id
+    FROM jsonb_populate_record(NULL::orders, order_data) AS o
+    ON CONFLICT (store_cd, pos_no, sale_id) DO NOTHING
+    RETURNING trd_id INTO new_trd_id;
+
+    -- 登録済みの取引（再送）は明細を追加せず、既存の trd_id を返す
+    IF new_trd_id IS NULL THEN
+        SELECT trd_id INTO new_trd_id
+        FROM orders
+        WHERE store_cd = order_data->>'store_cd'
+          AND pos_no = order_data->>'pos_no'
+          AND sale_id = order_data->>'sale_id';
+        RETURN new_trd_id;
+    END IF;
+
+    INSERT INTO order_details (trd_id, prd_id, prd_code, prd_name, prd_price, quantity, tax_cd)
+    SELECT new_trd_id, d.prd_id, d.prd_code, d.prd_name, d.prd_price, d.quantity, d.tax_cd
+    FROM jsonb_populate_recordset(NULL::order_details, details) AS d;
+
+    RETURN new_trd_id;
+END;
+$$;
@@ -0,0 +1,84 @@
+-- 商品カタログのバージョンをコミット順で安全に配る
+-- ・migrations/002 は BEFORE トリガーの nextval で version を採番していたため、version の順とコミットの順が一致せず、
+--   長いトランザクションが先に採番した version を、後からコミットされた大きい version より後に見せてしまっていた
+-- ・version を書き込んだトランザクションのID（xid8）から採番し、同じトランザクションの変更は同じ version にする
+-- ・get_catalog_version() は実行中のトランザクションの最小ID（スナップショットの xmin）より小さい version だけを対象にする
+--   （xmin より小さいIDのトランザクションは全て完了しているため、これ以下の version が後から増えることはない）
+
+-- 既存の version（シーケンスの値）より必ず大きくなるよう、トランザクションIDに足す値を一度だけ決めて関数に埋め込む
+DO $$
+DECLARE
+    version_offset bigint;
+BEGIN
+    IF to_regproc('catalog_version_offset') IS NULL THEN
+        SELECT GREATEST(
+            0,
+            GREATEST(
+                (SELECT last_value FROM catalog_version_seq),
+                COALESCE((SELECT MAX(version) FROM products), 0),
+                COALESCE((SELECT MAX(version) FROM product_tombstones), 0)
+            ) - pg_current_xact_id()::text::bigint + 1
+        ) INTO version_offset;
+        EXECUTE format(
+            'CREATE FUNCTION catalog_version_offset() RETURNS bigint LANGUAGE sql IMMUTABLE AS %L',
+            format('SELECT %s::bigint', version_offset)
+        );
+    END IF;
+END;
+$$;
+
+-- 現在のトランザクションの version
+CREATE OR REPLACE FUNCTION current_catalog_version()
+RETURNS bigint
+LANGUAGE sql
+VOLATILE
+AS $$
+    SELECT pg_current_xact_id()::text::bigint + catalog_version_offset();
+$$;
+
+-- 配ってよい version の上限（これ未満の version を持つトランザクションは全て完了している）
+CREATE OR REPLACE FUNCTION catalog_version_bound()
+RETURNS bigint
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint + catalog_version_offset();
+$$;
+
+CREATE OR REPLACE FUNCTION products_bump_version()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO product_tombstones (prd_id, code, version)
+        VALUES (OLD.prd_id, OLD.code, current_catalog_version())
+        ON CONFLICT (prd_id) DO UPDATE SET code = EXCLUDED.code, version = EXCLUDED.version;
+        RETURN OLD;
+    END IF;
+
+    NEW.version := current_catalog_version();
+    IF TG_OP = 'INSERT' THEN
+        DELETE FROM product_tombstones WHERE prd_id = NEW.prd_id;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+-- 同じ version の行が多数ある場合のページング（version, prd_id）用
+CREATE INDEX IF NOT EXISTS idx_products_version_prd_id ON products (version, prd_id);
+DROP INDEX IF EXISTS idx_products_version;
+
+-- 現在のカタログバージョン（完了したトランザクションの最大 version）
+-- ・カタログが変わらない間は同じ値を返す（ETag に使う）
+-- ・/products/changes はこの値以下の変更だけを返し、端末は次回この値を since に指定する
+CREATE OR REPLACE FUNCTION get_catalog_version()
+RETURNS bigint
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT GREATEST(
+        COALESCE((SELECT MAX(version) FROM products WHERE version < catalog_version_bound()), 0),
+        COALESCE((SELECT MAX(version) FROM product_tombstones WHERE version < catalog_version_bound()), 0)
+    );
+$$;
@@ -0,0 +1,41 @@
+-- リアルタイム・変更フィードの再接続時の補完をコミット順で安全にする
+-- ・orders.trd_id（シリアル）や customers.updated_at（clock_timestamp）は採番・更新の順で、コミットの順ではないため、
+--   最後に受け取った位置より小さい値の行が後からコミットされると補完で取りこぼしていた
+-- ・行を書き込んだトランザクションのID（xact_id）を記録し、補完の起点は完了済みのトランザクションの境界
+--   （スナップショットの xmin）にする。xmin より小さいIDのトランザクションが後からコミットされることはない
+-- ・products は migrations/009 の version（トランザクションIDから採番）を使う
+
+-- 既存の行は補完の対象外のため NULL のまま（列の追加でテーブルを書き換えない）
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS xact_id BIGINT;
+ALTER TABLE orders ALTER COLUMN xact_id SET DEFAULT (pg_current_xact_id()::text::bigint);
+CREATE INDEX IF NOT EXISTS idx_orders_xact_id ON orders (xact_id, trd_id);
+
+ALTER TABLE customers ADD COLUMN IF NOT EXISTS xact_id BIGINT;
+CREATE INDEX IF NOT EXISTS idx_customers_xact_id ON customers (xact_id, cust_id);
+
+-- migrations/007 のトリガー関数に xact_id の記録を追加
+CREATE OR REPLACE FUNCTION customers_touch_updated_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- NOW() はトランザクション開始時刻のため、実際の更新時刻に近い clock_timestamp() を使う
+    NEW.updated_at := clock_timestamp();
+    NEW.xact_id := pg_current_xact_id()::text::bigint;
+    RETURN NEW;
+END;
+$$;
+
+-- 補完の起点に使う境界（これより小さい位置の変更を書き込んだトランザクションは全て完了している）と、その取得時刻
+-- ・取得時刻より後にコミットされたイベントを受け取った時点で、境界より前の変更は全て受け取り済みになる
+CREATE OR REPLACE FUNCTION realtime_catch_up_bound(table_name text)
+RETURNS jsonb
+LANGUAGE sql
+VOLATILE
+AS $$
+    SELECT jsonb_build_object(
+        'bound', CASE WHEN table_name IN ('products', 'product_tombstones') THEN catalog_version_bound()
+                      ELSE pg_snapshot_xmin(pg_current_snapshot())::text::bigint END,
+        'at', clock_timestamp()
+    );
+$$;
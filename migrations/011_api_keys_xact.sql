@@ -0,0 +1,22 @@
+-- APIキーの差分の読み込みをコミット順で安全にする
+-- ・updated_at（NOW() = トランザクション開始時刻）を起点にすると、長いトランザクションの無効化が
+--   起点より前の時刻でコミットされ、差分の読み込みで取りこぼしていた
+-- ・行を書き込んだトランザクションのID（xact_id）を記録し、起点は完了済みのトランザクションの境界
+--   （realtime_catch_up_bound('api_keys')、migrations/010）にする
+
+-- 既存の行は全件の読み込みで反映するため NULL のまま（列の追加でテーブルを書き換えない）
+ALTER TABLE api_keys ADD COLUMN IF NOT EXISTS xact_id BIGINT;
+ALTER TABLE api_keys ALTER COLUMN xact_id SET DEFAULT (pg_current_xact_id()::text::bigint);
+CREATE INDEX IF NOT EXISTS idx_api_keys_xact_id ON api_keys (xact_id);
+
+-- migrations/005 のトリガー関数に xact_id の記録を追加
+CREATE OR REPLACE FUNCTION api_keys_touch_updated_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.updated_at := NOW();
+    NEW.xact_id := pg_current_xact_id()::text::bigint;
+    RETURN NEW;
+END;
+$$;
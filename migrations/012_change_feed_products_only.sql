@@ -0,0 +1,7 @@
+-- 変更フィード（LISTEN/NOTIFY）の通知を products のみにする
+-- ・SQLAlchemy版（app.py）は従業員・顧客・クーポンを読み取りキャッシュに保持しないため、
+--   migrations/006 で追加したこれらのテーブルの通知は受け取っても使われない（書き込みごとの通知の負荷だけが残る）
+-- ・通知のチャンネル（table_changes）は notify_table_change() に固定で書かれている（db_control/change_feed.py も同じ値）
+DROP TRIGGER IF EXISTS employees_notify_change ON employees;
+DROP TRIGGER IF EXISTS coupons_notify_change ON coupons;
+DROP TRIGGER IF EXISTS customers_notify_change ON customers;
@@ -0,0 +1,14 @@
+-- 従業員のログアウトを全ワーカーに反映する
+-- ・セッションの無効化はプロセス内にしか記録していなかったため、他のワーカーでは有効期限まで使えていた
+-- ・ログアウトしたトークンのハッシュを有効期限とともに記録し、各ワーカーが差分を定期的に読み込む
+-- ・差分の起点は完了済みのトランザクションの境界（realtime_catch_up_bound、migrations/010）にする
+-- ・expires_at はセッションの有効期限（UNIXエポック秒）で、過ぎた行はログアウトの記録時に削除する
+CREATE TABLE IF NOT EXISTS employee_session_revocations (
+    token_hash CHAR(64) PRIMARY KEY,
+    expires_at BIGINT NOT NULL,
+    revoked_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    xact_id BIGINT NOT NULL DEFAULT (pg_current_xact_id()::text::bigint)
+);
+
+CREATE INDEX IF NOT EXISTS idx_employee_session_revocations_xact_id ON employee_session_revocations (xact_id);
+CREATE INDEX IF NOT EXISTS idx_employee_session_revocations_expires_at ON employee_session_revocations (expires_at);
@@ -0,0 +1,65 @@
+-- オフライン取引の一括登録で、新規の取引と再送（登録済みの sale_id）を区別できるようにする
+-- ・migrations/008 の create_order_with_details は登録済みの取引も既存の trd_id を返すだけで、
+--   今回登録したかどうかを返さないため、再送も「登録した」と数えていた
+-- ・登録処理を {"trd_id": ..., "created": true/false} を返す関数に移し、既存の関数はそれを呼び出す
+
+CREATE OR REPLACE FUNCTION create_order_with_details_status(order_data jsonb, details jsonb)
+RETURNS jsonb
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    new_trd_id integer;
+BEGIN
+    INSERT INTO orders (
+        datetime, enp_cd, store_cd, pos_no, total_amt, ttl_amt_ex_tax,
+        cust_id, used_point, coupon_id, discount_by_cp, final_amt, sale_id
+    )
+    SELECT
+        o.datetime, o.enp_cd, o.store_cd, o.pos_no, o.total_amt, o.ttl_amt_ex_tax,
+        o.cust_id, o.used_point, o.coupon_id, o.discount_by_cp, o.final_amt, o.sale_id
+    FROM jsonb_populate_record(NULL::orders, order_data) AS o
+    ON CONFLICT (store_cd, pos_no, sale_id) DO NOTHING
+    RETURNING trd_id INTO new_trd_id;
+
+    -- 登録済みの取引（再送）は明細を追加せず、既存の trd_id を返す
+    IF new_trd_id IS NULL THEN
+        SELECT trd_id INTO new_trd_id
+        FROM orders
+        WHERE store_cd = order_data->>'store_cd'
+          AND pos_no = order_data->>'pos_no'
+          AND sale_id = order_data->>'sale_id';
+        RETURN jsonb_build_object('trd_id', new_trd_id, 'created', false);
+    END IF;
+
+    INSERT INTO order_details (trd_id, prd_id, prd_code, prd_name, prd_price, quantity, tax_cd)
+    SELECT new_trd_id, d.prd_id, d.prd_code, d.prd_name, d.prd_price, d.quantity, d.tax_cd
+    FROM jsonb_populate_recordset(NULL::order_details, details) AS d;
+
+    RETURN jsonb_build_object('trd_id', new_trd_id, 'created', true);
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION create_order_with_details(order_data jsonb, details jsonb)
+RETURNS integer
+LANGUAGE sql
+AS $$
+    SELECT (create_order_with_details_status(order_data, details)->>'trd_id')::integer;
+$$;
+
+-- 複数の注文を1トランザクションで登録し、引数の順に {"trd_id": ..., "created": ...} の配列を返す（一括登録用）
+CREATE OR REPLACE FUNCTION create_orders_with_details_status(orders jsonb)
+RETURNS jsonb
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    entry jsonb;
+    results jsonb := '[]'::jsonb;
+BEGIN
+    FOR entry IN
+        SELECT value FROM jsonb_array_elements(orders) WITH ORDINALITY ORDER BY ordinality
+    LOOP
+        results := results || jsonb_build_array(create_order_with_details_status(entry->'order', entry->'details'));
+    END LOOP;
+    RETURN results;
+END;
+$$;